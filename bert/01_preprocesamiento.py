@@ -4,14 +4,33 @@
 
 import os
 import json
-import random
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+
+# La generación a partir de plantillas compiladas y la escritura en shards están en la carpeta de libretas, las reutilizamos desde aquí.
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'libretas'))
+from generacion import cargar_plantillas, generar_shard, shards_de_maquina
+from shards import escribir_indice, escribir_shard, leer_shard
 
 # Directorios de entrada y salida
 plantillas_dir = "C:/Users/34670/Desktop/python/Hack a boss/proyecto_decide/bert/plantillas/"
 json_dir = "C:/Users/34670/Desktop/python/Hack a boss/proyecto_decide/bert/json_categoria/"
 output_dir = "C:/Users/34670/Desktop/python/Hack a boss/proyecto_decide/bert/datos/"
 corpus_file = os.path.join(output_dir, "corpus.txt")  # Archivo para el corpus
-entidades_file = os.path.join(output_dir, "entidades.json")  # Archivo para datos etiquetados
+
+# Generación reproducible por shards: cada shard tiene docs_por_shard documentos y su propia semilla sacada de la
+# semilla global, así que con la misma semilla se generan los mismos documentos con cualquier número de procesos.
+semilla = 42
+docs_por_shard = 1000
+num_workers = os.cpu_count() or 1
+# Los documentos etiquetados se guardan en archivos JSONL, uno por shard, con un índice (ver libretas/shards.py).
+# Se pueden comprimir con 'gzip' o con 'zstd' (necesita el paquete zstandard); None para no comprimir.
+compresion = 'gzip'
+# Para repartir la generación entre varias máquinas: cada una pone su número (0, 1, ...) y el total.
+# Cada máquina genera un bloque seguido de shards (con su propio corpus, y los corpus se juntan en orden).
+maquina = 0
+num_maquinas = 1
 
 # Diccionario de placeholders que relaciona cada placeholder con su correspondiente archivo JSON
 json_files = {
@@ -64,85 +83,83 @@ def ajustar_entidades_fuera_de_rango(texto, entities):
         adjusted_entities.append([start, end, label])
     return adjusted_entities
 
-# En esta función generamos un texto con datos aleatorios y capturamos las entidades correspondientes
-def generar_texto_con_datos(plantilla, datos_json):
-    entities = []
-    texto_final = plantilla
-    offset = 0
+# Datos que necesita cada proceso para generar documentos: las plantillas compiladas y los valores de los JSON.
+# Se cargan una sola vez por proceso, al arrancarlo (en el modo de un solo proceso, en el proceso principal).
+_contexto = {}
 
-    for placeholder, key in json_files.items():
-        while placeholder in texto_final:
-            valor = random.choice(datos_json[placeholder])
-            start = texto_final.find(placeholder)
-            end = start + len(placeholder)
-
-            # Actualizamos texto_final reemplazando el placeholder por el valor real
-            texto_final = texto_final[:start] + valor + texto_final[end:]
-
-            # Registramos la entidad con su posición en el texto
-            entities.append([start, start + len(valor), key])
-
-            # Actualizamos el offset para la siguiente búsqueda
-            offset = start + len(valor)
-
-    # Verificamos los placeholders restantes en el texto
-    for placeholder in json_files.keys():
-        if placeholder in texto_final:
-            print(f"Advertencia: {placeholder} no ha sido reemplazado en el texto final.")
-
-    return texto_final, entities
-
-# Función principal donde generamos los documentos y creamos el corpus y el archivo de entidades
-def generar_documentos_y_corpus(plantillas_dir, json_dir, output_dir, corpus_file, entidades_file, json_files, num_docs=10000):
-    # Primero cargamos los datos JSON
-    datos_json = cargar_datos_json(json_dir, json_files)
-    
-    # Aquí obtenemos la lista de archivos de plantilla
-    plantillas = [f for f in os.listdir(plantillas_dir) if f.endswith('.txt')]
-    
-    # Ahora generamos los documentos y creamos el corpus y el archivo de entidades
+def iniciar_generador(plantillas_dir, json_dir, json_files):
+    _contexto['datos_json'] = cargar_datos_json(json_dir, json_files)
+    # Las plantillas se leen, normalizan y compilan una sola vez (ver libretas/generacion.py)
+    _contexto['plantillas'] = cargar_plantillas(plantillas_dir, json_files, normalizar_texto)
+
+# En esta función generamos los documentos de un shard con datos aleatorios y capturamos las entidades correspondientes.
+# Los documentos se escriben según se generan en el archivo JSONL del shard (ver libretas/shards.py).
+# Devuelve la entrada del índice del shard y el número de documentos descartados.
+def generar_documentos_shard(shard, output_dir, num_docs, docs_por_shard, semilla):
     documentos_descartados = 0
-    with open(corpus_file, 'w', encoding='utf-8') as corpus, open(entidades_file, 'w', encoding='utf-8') as entidades:
-        all_entities = []
-        for i in range(num_docs):
-            plantilla_file = random.choice(plantillas)
-            with open(os.path.join(plantillas_dir, plantilla_file), 'r', encoding='utf-8') as f:
-                plantilla = f.read()
-            
-            plantilla_normalizada = normalizar_texto(plantilla)
-            texto, entities = generar_texto_con_datos(plantilla_normalizada, datos_json)
-            
+
+    def documentos():
+        nonlocal documentos_descartados
+        for i, plantilla, texto, entities in generar_shard(_contexto['plantillas'], _contexto['datos_json'], shard, num_docs, docs_por_shard, semilla):
             if not entities:
                 documentos_descartados += 1
                 continue
-            
+
             # Ajustamos las entidades fuera de rango
             entities = ajustar_entidades_fuera_de_rango(texto, entities)
-            
-            data_entry = {
+
+            yield {
+                "id": i + 1,
+                "plantilla": plantilla.nombre,
                 "text": texto,
                 "entities": entities
             }
-            
-            # Guardamos el documento JSON (opcional, puedes comentar estas líneas si no necesitas guardar los JSONs)
-            output_file = os.path.join(output_dir, f"documento_{i+1}.json")
-            with open(output_file, 'w', encoding='utf-8') as f:
-                json.dump(data_entry, f, ensure_ascii=False, indent=4)
 
-            # Escribimos el texto en el corpus
-            corpus.write(texto + '\n')
+    entrada = escribir_shard(output_dir, 'documentos', shard, documentos(), compresion)
+    return entrada, documentos_descartados
+
+# Función principal donde generamos los documentos y creamos el corpus
+# Los shards de esta máquina se reparten entre los procesos y sus documentos se escriben en el corpus en orden,
+# así que el resultado es el mismo con cualquier número de procesos o de máquinas (ver libretas/generacion.py).
+# Los documentos con sus entidades quedan en los shards y su índice, que sustituyen al antiguo entidades.json
+# (que había que montar entero en memoria).
+def generar_documentos_y_corpus(plantillas_dir, json_dir, output_dir, corpus_file, json_files, num_docs=10000):
+    shards = shards_de_maquina(num_docs, docs_por_shard, maquina, num_maquinas)
+    argumentos = (repeat(output_dir), repeat(num_docs), repeat(docs_por_shard), repeat(semilla))
+
+    executor = None
+    if num_workers > 1:
+        executor = ProcessPoolExecutor(max_workers=num_workers, initializer=iniciar_generador,
+                                       initargs=(plantillas_dir, json_dir, json_files))
+        resultados = executor.map(generar_documentos_shard, shards, *argumentos)
+    else:
+        iniciar_generador(plantillas_dir, json_dir, json_files)
+        resultados = map(generar_documentos_shard, shards, *argumentos)
+
+    # Ahora creamos el corpus, leyendo cada shard en cuanto está terminado
+    entradas = []
+    documentos_descartados = 0
+    with open(corpus_file, 'w', encoding='utf-8') as corpus:
+        for entrada, descartados in resultados:
+            entradas.append(entrada)
+            documentos_descartados += descartados
+            for data_entry in leer_shard(output_dir, entrada, compresion):
+                # Escribimos el texto en el corpus
+                corpus.write(data_entry["text"] + '\n')
+
+    # Índice con los shards de esta máquina
+    escribir_indice(output_dir, entradas, compresion, maquina if num_maquinas > 1 else None)
 
-            # Agregamos las entidades al archivo de entidades
-            all_entities.append(data_entry)
-        
-        # Guardamos todas las entidades en un archivo JSON
-        json.dump(all_entities, entidades, ensure_ascii=False, indent=4)
+    if executor is not None:
+        executor.shutdown()
 
     print(f"Total de documentos descartados: {documentos_descartados}")
 
-# Aquí verificamos si el directorio de salida existe, y si no, lo creamos
-if not os.path.exists(output_dir):
-    os.makedirs(output_dir)
+# El bloque principal va protegido con __main__ porque en Windows cada proceso del pool vuelve a importar este script.
+if __name__ == '__main__':
+    # Aquí verificamos si el directorio de salida existe, y si no, lo creamos
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
 
-# Finalmente, ejecutamos la función principal
-generar_documentos_y_corpus(plantillas_dir, json_dir, output_dir, corpus_file, entidades_file, json_files, num_docs=10000)
+    # Finalmente, ejecutamos la función principal
+    generar_documentos_y_corpus(plantillas_dir, json_dir, output_dir, corpus_file, json_files, num_docs=10000)
@@ -5,10 +5,15 @@
 import os
 import json
 import random
+import sys
 from collections import Counter
 from tokenizers import Tokenizer
 from transformers import RobertaTokenizerFast
 
+# La lectura de los shards de documentos está en la carpeta de libretas, la reutilizamos desde aquí.
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'libretas'))
+from shards import hay_shards, leer_indice, leer_shards
+
 # Cargar el tokenizador entrenado
 tokenizer_dir = "C:/Users/34670/Desktop/python/Hack a boss/proyecto_decide/bert/tokenizer/"
 tokenizer = Tokenizer.from_file(os.path.join(tokenizer_dir, "tokenizer.json"))
@@ -110,20 +115,28 @@ def balance_data(data):
     
     return balanced_data
 
+# Seleccionamos al azar num_files documentos del directorio de entrada.
+# 01_preprocesamiento.py los guarda en shards JSONL con un índice (ver libretas/shards.py): elegimos los números
+# de documento con el total del índice y los vamos cogiendo mientras leemos los shards en streaming.
+# Si el directorio es de antes, con un documento_N.json por documento, leemos esos archivos.
+def select_documents(input_dir, num_files):
+    if hay_shards(input_dir):
+        total = leer_indice(input_dir)["registros"]
+        selected = set(random.sample(range(total), min(num_files, total)))
+        for i, data in enumerate(leer_shards(input_dir)):
+            if i in selected:
+                yield f"documento_{data['id']}", data
+    else:
+        all_files = [f for f in os.listdir(input_dir) if f.endswith('.json')]
+        for file_name in random.sample(all_files, min(num_files, len(all_files))):
+            yield file_name, load_data(os.path.join(input_dir, file_name))
+
 # Procesar archivos
 def process_files(input_dir, output_dir, num_files=500, max_records_per_file=500, reduction_rate=0.5):
     all_data = []
     file_count = 0
 
-    # Obtenemos todos los archivos JSON en el directorio
-    all_files = [f for f in os.listdir(input_dir) if f.endswith('.json')]
-
-    # Seleccionamos un subconjunto aleatorio de archivos
-    selected_files = random.sample(all_files, min(num_files, len(all_files)))
-
-    for file_name in selected_files:
-        file_path = os.path.join(input_dir, file_name)
-        data = load_data(file_path)
+    for file_name, data in select_documents(input_dir, num_files):
         print(f"Processing file: {file_name}")
         prepared_data = prepare_data(data)
         all_data.extend(prepared_data)
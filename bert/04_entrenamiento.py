@@ -3,14 +3,21 @@
 # Pero que se ha hecho también con BERT y ROBERTA sin el tokenizador personalizado. Se pueden modificar sin problemas en el script.
 
 import os
+import sys
 import json
+import math
+import time
 import torch
 from collections import Counter
-from transformers import RobertaTokenizerFast, RobertaForTokenClassification, RobertaConfig, Trainer, TrainingArguments, EarlyStoppingCallback
+from transformers import RobertaTokenizerFast, RobertaForTokenClassification, RobertaConfig, Trainer, TrainingArguments, EarlyStoppingCallback, TrainerCallback
 from torch.utils.data import Dataset
 from sklearn.model_selection import train_test_split
 from sklearn.metrics import precision_recall_fscore_support, accuracy_score
 import torch.nn as nn
+from itertools import islice
+from flujo_roberta import FlujoRoberta
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'libretas'))
+from instrumentacion import RegistroEntrenamiento
 
 # Definir la clase del dataset
 class NERDataset(Dataset):
@@ -149,89 +156,180 @@ def compute_metrics(pred):
         'recall': recall
     }
 
+# Callback para medir el entrenamiento (ver libretas/instrumentacion.py)...
+# Cada cada_pasos pasos apunta en el registro los tokens por segundo (sin contar el padding), cuánto se ha ido en el
+# forward (compute_loss) y cuánto en el backward y el optimizador, la pérdida, la memoria y el tiempo restante.
+# Las evaluaciones se apuntan aparte, con su duración y sus métricas. Los tokens y el tiempo del forward los va
+# sumando CustomTrainer en tokens y forward_s.
+class InstrumentacionCallback(TrainerCallback):
+    def __init__(self, registro, cada_pasos):
+        self.registro = registro
+        self.cada_pasos = cada_pasos
+        self.tokens = 0
+        self.forward_s = 0.0
+        self._duracion = 0.0
+        self._perdidas = {}
+
+    def on_step_begin(self, args, state, control, **kwargs):
+        self._inicio = time.perf_counter()
+
+    def on_step_end(self, args, state, control, **kwargs):
+        # En GPU las operaciones son asíncronas: hay que esperar a que acaben para que los tiempos sean reales
+        if torch.cuda.is_available():
+            torch.cuda.synchronize()
+        self._duracion += time.perf_counter() - self._inicio
+        if state.global_step % self.cada_pasos != 0:
+            return
+        extra = {"gpu_pico_mb": round(torch.cuda.max_memory_allocated() / 1024 ** 2, 1)} if torch.cuda.is_available() else {}
+        self.registro.apuntar(state.global_step, self.tokens, self._duracion,
+                              {"forward": self.forward_s, "backward_y_optimizador": self._duracion - self.forward_s},
+                              self._perdidas, **extra)
+        self.tokens = 0
+        self.forward_s = 0.0
+        self._duracion = 0.0
+
+    def on_log(self, args, state, control, logs=None, **kwargs):
+        if logs and 'loss' in logs:
+            self._perdidas = {"loss": logs['loss']}
+
+    def on_evaluate(self, args, state, control, metrics=None, **kwargs):
+        metrics = metrics or {}
+        self.registro.apuntar(state.global_step, 0, 0.0, evaluacion_s=metrics.get('eval_runtime'),
+                              metricas={key: value for key, value in metrics.items() if key.startswith('eval_')})
+
+    def on_train_end(self, args, state, control, **kwargs):
+        self.registro.cerrar()
+
 # Configuraciones
 data_dir = 'C:/Users/34670/Desktop/python/Hack a boss/proyecto_decide/bert/datos_roberta/'
 model_name = 'PlanTL-GOB-ES/roberta-base-bne'
 output_dir = 'C:/Users/34670/Desktop/python/Hack a boss/proyecto_decide/bert/archivos_roberta_2/'
 tokenizer_dir = "C:/Users/34670/Desktop/python/Hack a boss/proyecto_decide/bert/tokenizer/"
 num_labels = len(label2id)
-
-# Desactivar advertencia de symlinks
-os.environ["HF_HUB_DISABLE_SYMLINKS_WARNING"] = "1"
-
-# Configuración personalizada para ajustar el dropout
-config = RobertaConfig.from_pretrained(
-    model_name,
-    hidden_dropout_prob=0.1,  # Dropout en las capas ocultas
-    attention_probs_dropout_prob=0.1,  # Dropout en la atención
-    num_labels=num_labels
-)
-
-# Cargar el modelo y el tokenizer de RoBERTa con la configuración personalizada
-tokenizer = RobertaTokenizerFast.from_pretrained(tokenizer_dir, use_fast=True)
-model = RobertaForTokenClassification.from_pretrained(model_name, config=config)
-
-# Cargar los datos preprocesados
-encodings, labels = load_preprocessed_data(data_dir, tokenizer)
-
-# Calcular los pesos
-weights = calculate_weights(labels, o_weight_ratio=0.15)
-loss_fct = nn.CrossEntropyLoss(weight=weights)
-
-# Verificar que las longitudes coincidan
-assert len(encodings['input_ids']) == len(labels), "Inconsistencia en el número de muestras entre encodings y labels"
-
-# Dividir en conjuntos de entrenamiento y evaluación
-indices = list(range(len(labels)))
-train_indices, val_indices = train_test_split(indices, test_size=0.2, random_state=42)
-
-train_encodings = {key: val[train_indices] for key, val in encodings.items()}
-val_encodings = {key: val[val_indices] for key, val in encodings.items()}
-train_labels = labels[train_indices]
-val_labels = labels[val_indices]
-
-train_dataset = NERDataset(train_encodings, train_labels)
-val_dataset = NERDataset(val_encodings, val_labels)
-
-# Configuración del entrenamiento
-training_args = TrainingArguments(
-    output_dir=output_dir,
-    num_train_epochs=3,
-    per_device_train_batch_size=16,
-    per_device_eval_batch_size=16,
-    warmup_steps=100,
-    weight_decay=0.01,
-    logging_dir='./logs',
-    logging_steps=50,
-    save_steps=74,
-    eval_steps=74,
-    eval_strategy="steps",
-    load_best_model_at_end=True,
-    save_total_limit=2,
-    save_strategy="steps"
-)
-
-# Trainer con la función de pérdida personalizada
-class CustomTrainer(Trainer):
-    def compute_loss(self, model, inputs, return_outputs=False):
-        labels = inputs.pop("labels")
-        outputs = model(**inputs)
-        logits = outputs.logits
-        loss = loss_fct(logits.view(-1, self.model.config.num_labels), labels.view(-1))
-        return (loss, outputs) if return_outputs else loss
-
-trainer = CustomTrainer(
-    model=model,
-    args=training_args,
-    train_dataset=train_dataset,
-    eval_dataset=val_dataset,
-    compute_metrics=compute_metrics,
-    callbacks=[EarlyStoppingCallback(early_stopping_patience=10)]
-)
-
-# Entrenar el modelo
-trainer.train()
-
-# Guardar el modelo y el tokenizer
-model.save_pretrained(output_dir)
-tokenizer.save_pretrained(output_dir)
+# Carpeta del registro del entrenamiento (se resume con libretas/13_resumen_entrenamiento.py)
+logs_dir = 'logs'
+
+# Entrenar con el flujo infinito de documentos generados según se piden (ver flujo_roberta.py) en vez de con datos_roberta.
+# Como el flujo no tiene fin, se entrena un número fijo de pasos (pasos_flujo) y los documentos se generan en
+# num_workers_flujo procesos del DataLoader. La validación son num_validacion documentos fijos que el flujo no usa para entrenar,
+# y los pesos de las etiquetas se calculan con los primeros docs_pesos documentos del flujo.
+usar_flujo = False
+plantillas_dir = "C:/Users/34670/Desktop/python/Hack a boss/proyecto_decide/bert/plantillas/"
+json_dir = "C:/Users/34670/Desktop/python/Hack a boss/proyecto_decide/bert/json_categoria/"
+semilla = 42
+pasos_flujo = 5000
+num_workers_flujo = 2
+num_validacion = 1000
+docs_pesos = 2000
+
+# Va protegido con __main__ porque, si se entrena con el flujo, en Windows cada proceso del DataLoader
+# vuelve a importar este script.
+if __name__ == '__main__':
+    # Desactivar advertencia de symlinks
+    os.environ["HF_HUB_DISABLE_SYMLINKS_WARNING"] = "1"
+
+    # Configuración personalizada para ajustar el dropout
+    config = RobertaConfig.from_pretrained(
+        model_name,
+        hidden_dropout_prob=0.1,  # Dropout en las capas ocultas
+        attention_probs_dropout_prob=0.1,  # Dropout en la atención
+        num_labels=num_labels
+    )
+
+    # Cargar el modelo y el tokenizer de RoBERTa con la configuración personalizada
+    tokenizer = RobertaTokenizerFast.from_pretrained(tokenizer_dir, use_fast=True)
+    model = RobertaForTokenClassification.from_pretrained(model_name, config=config)
+
+    if usar_flujo:
+        # Flujo de entrenamiento y documentos de validación fijos
+        train_dataset = FlujoRoberta(plantillas_dir, json_dir, tokenizer, label2id, semilla=semilla)
+        val_items = train_dataset.validacion(num_validacion)
+        val_encodings = {key: torch.stack([item[key] for item in val_items]) for key in ('input_ids', 'attention_mask', 'token_type_ids')}
+        val_dataset = NERDataset(val_encodings, torch.stack([item['labels'] for item in val_items]))
+
+        # Calcular los pesos con una muestra del flujo
+        weights = calculate_weights([item['labels'].tolist() for item in islice(iter(train_dataset), docs_pesos)], o_weight_ratio=0.15)
+        loss_fct = nn.CrossEntropyLoss(weight=weights)
+    else:
+        # Cargar los datos preprocesados
+        encodings, labels = load_preprocessed_data(data_dir, tokenizer)
+
+        # Calcular los pesos
+        weights = calculate_weights(labels, o_weight_ratio=0.15)
+        loss_fct = nn.CrossEntropyLoss(weight=weights)
+
+        # Verificar que las longitudes coincidan
+        assert len(encodings['input_ids']) == len(labels), "Inconsistencia en el número de muestras entre encodings y labels"
+
+        # Dividir en conjuntos de entrenamiento y evaluación
+        indices = list(range(len(labels)))
+        train_indices, val_indices = train_test_split(indices, test_size=0.2, random_state=42)
+
+        train_encodings = {key: val[train_indices] for key, val in encodings.items()}
+        val_encodings = {key: val[val_indices] for key, val in encodings.items()}
+        train_labels = labels[train_indices]
+        val_labels = labels[val_indices]
+
+        train_dataset = NERDataset(train_encodings, train_labels)
+        val_dataset = NERDataset(val_encodings, val_labels)
+
+    # Configuración del entrenamiento
+    training_args = TrainingArguments(
+        output_dir=output_dir,
+        num_train_epochs=3,
+        # Con el flujo no hay épocas: se entrena un número fijo de pasos y los documentos se generan en los procesos del DataLoader
+        max_steps=pasos_flujo if usar_flujo else -1,
+        dataloader_num_workers=num_workers_flujo if usar_flujo else 0,
+        per_device_train_batch_size=16,
+        per_device_eval_batch_size=16,
+        warmup_steps=100,
+        weight_decay=0.01,
+        logging_dir='./logs',
+        logging_steps=50,
+        save_steps=74,
+        eval_steps=74,
+        eval_strategy="steps",
+        load_best_model_at_end=True,
+        save_total_limit=2,
+        save_strategy="steps"
+    )
+
+    # Registro del entrenamiento: con el flujo se sabe cuántos pasos habrá; si no, el Trainer lo calcula al empezar
+    pasos_totales = pasos_flujo if usar_flujo else math.ceil(len(train_dataset) / training_args.per_device_train_batch_size) * int(training_args.num_train_epochs)
+    registro = RegistroEntrenamiento(logs_dir, 'roberta', 'tokens', total=pasos_totales,
+                                     config={"model_name": model_name, "usar_flujo": usar_flujo,
+                                             "batch_size": training_args.per_device_train_batch_size,
+                                             "learning_rate": training_args.learning_rate})
+    instrumentacion = InstrumentacionCallback(registro, training_args.logging_steps)
+
+    # Trainer con la función de pérdida personalizada
+    class CustomTrainer(Trainer):
+        def compute_loss(self, model, inputs, return_outputs=False):
+            start = time.perf_counter()
+            labels = inputs.pop("labels")
+            outputs = model(**inputs)
+            logits = outputs.logits
+            loss = loss_fct(logits.view(-1, self.model.config.num_labels), labels.view(-1))
+            # Solo se cuentan los pasos de entrenamiento (compute_loss también se llama al evaluar)
+            if model.training:
+                if torch.cuda.is_available():
+                    torch.cuda.synchronize()
+                instrumentacion.forward_s += time.perf_counter() - start
+                instrumentacion.tokens += int(inputs['attention_mask'].sum())
+            return (loss, outputs) if return_outputs else loss
+
+    trainer = CustomTrainer(
+        model=model,
+        args=training_args,
+        train_dataset=train_dataset,
+        eval_dataset=val_dataset,
+        compute_metrics=compute_metrics,
+        callbacks=[EarlyStoppingCallback(early_stopping_patience=10), instrumentacion]
+    )
+
+    # Entrenar el modelo
+    trainer.train()
+
+    # Guardar el modelo y el tokenizer
+    model.save_pretrained(output_dir)
+    tokenizer.save_pretrained(output_dir)
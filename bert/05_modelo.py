@@ -3,11 +3,16 @@
 # En este caso, usamos ROBERTA con un tokenizador personalizado, pero se puede adaptar para usar BERT u otros modelos y tokenizadores.
 
 import os
+import sys
 import json
 import torch
 from transformers import RobertaTokenizerFast, RobertaForTokenClassification
 from torch.nn import functional as F
 
+# El almacén empaquetado de textos de facturas está en la carpeta de libretas
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'libretas'))
+from almacen_textos import AlmacenTextos
+
 # Mapeo de etiquetas a índices y viceversa
 label2id = {
     "O": 0,
@@ -80,26 +85,36 @@ def infer(text):
 # Leer archivos de texto y realizar inferencia
 input_dir = 'C:/Users/34670/Desktop/python/Hack a boss/proyecto_decide/bert/facturas/'
 output_dir = 'C:/Users/34670/Desktop/python/Hack a boss/proyecto_decide/bert/validaciones/'
+# Si existe el almacén que genera libretas/06_extraccion_pdf.py, leemos los textos de ahí en vez de input_dir
+almacen_path = 'C:/Users/34670/Desktop/python/Hack a boss/proyecto_decide/libretas/facturas.pack'
 
 if not os.path.exists(output_dir):
     os.makedirs(output_dir)
 
-for file_name in os.listdir(input_dir):
-    if file_name.endswith('.txt'):
-        file_path = os.path.join(input_dir, file_name)
-        with open(file_path, 'r', encoding='utf-8') as file:
-            text = file.read()
-        
-        entities = infer(text)
-        
-        # Completar las categorías faltantes con valores vacíos
-        for category in categories:
-            if category not in entities:
-                entities[category] = ""
-
-        # Guardar el resultado en un archivo JSON
-        output_file_path = os.path.join(output_dir, file_name.replace('.txt', '.json'))
-        with open(output_file_path, 'w', encoding='utf-8') as json_file:
-            json.dump(entities, json_file, ensure_ascii=False, indent=4)
-
-print("Inferencia completada y archivos JSON guardados.")
+# Devuelve pares (nombre, texto) de las facturas, del almacén o de los .txt sueltos
+def leer_facturas():
+    if os.path.exists(almacen_path):
+        with AlmacenTextos(almacen_path) as almacen:
+            yield from almacen.items()
+        return
+
+    for file_name in os.listdir(input_dir):
+        if file_name.endswith('.txt'):
+            file_path = os.path.join(input_dir, file_name)
+            with open(file_path, 'r', encoding='utf-8') as file:
+                yield file_name[:-len('.txt')], file.read()
+
+for nombre, text in leer_facturas():
+    entities = infer(text)
+
+    # Completar las categorías faltantes con valores vacíos
+    for category in categories:
+        if category not in entities:
+            entities[category] = ""
+
+    # Guardar el resultado en un archivo JSON
+    output_file_path = os.path.join(output_dir, nombre + '.json')
+    with open(output_file_path, 'w', encoding='utf-8') as json_file:
+        json.dump(entities, json_file, ensure_ascii=False, indent=4)
+
+print("Inferencia completada y archivos JSON guardados.")
\ No newline at end of file
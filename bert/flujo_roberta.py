@@ -0,0 +1,87 @@
+# flujo_roberta.py
+# Dataset de PyTorch con un flujo infinito de documentos generados según se piden (ver libretas/flujo.py),
+# ya tokenizados y con las etiquetas alineadas, para entrenar en 04_entrenamiento.py sin pasar por los
+# archivos de datos_roberta. Cada documento se genera, se tokeniza y se etiqueta en los procesos del DataLoader
+# (dataloader_num_workers en TrainingArguments), que van por delante del entrenamiento.
+# Cada proceso se queda con shards distintos (el proceso k de n genera los shards k, k + n, k + 2n...),
+# con la misma semilla por shard que 01_preprocesamiento.py, así que no se repiten documentos entre procesos.
+
+import os
+import sys
+import torch
+from torch.utils.data import IterableDataset, get_worker_info
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'libretas'))
+from flujo import documentos_shard, flujo_documentos
+from generacion import cargar_datos_json, cargar_plantillas, json_files
+
+# La misma normalización de plantillas que en 01_preprocesamiento.py (saltos de línea como barra vertical)
+def normalizar_texto(texto):
+    return texto.replace('\n', '|').replace('  ', ' ')
+
+# Tokenizamos un texto y le ponemos a cada token la etiqueta del carácter en el que empieza (B- si es el primer
+# token de la entidad, I- si no). Los tokens especiales y el relleno llevan -100 para que no cuenten en la pérdida.
+def codificar_documento(tokenizer, label2id, texto, entities, max_len=512):
+    labels = [None] * len(texto)
+    for start, end, label in entities:
+        for i in range(start, end):
+            labels[i] = label
+
+    encoding = tokenizer(texto, truncation=True, max_length=max_len, padding='max_length', return_offsets_mapping=True)
+    token_labels = []
+    anterior = None
+    for (start, end), attention in zip(encoding['offset_mapping'], encoding['attention_mask']):
+        if start == end or not attention:
+            token_labels.append(-100)
+            anterior = None
+            continue
+        label = labels[start] if texto[start] != '|' else None
+        if label is None:
+            token_labels.append(label2id["O"])
+        elif label == anterior:
+            token_labels.append(label2id[f"I-{label}"])
+        else:
+            token_labels.append(label2id[f"B-{label}"])
+        anterior = label
+
+    return {
+        'input_ids': torch.tensor(encoding['input_ids']),
+        'attention_mask': torch.tensor(encoding['attention_mask']),
+        'token_type_ids': torch.tensor(encoding.get('token_type_ids', [0] * len(encoding['input_ids']))),
+        'labels': torch.tensor(token_labels),
+    }
+
+class FlujoRoberta(IterableDataset):
+    def __init__(self, plantillas_dir, json_dir, tokenizer, label2id, semilla=42, docs_por_shard=1000, max_len=512):
+        self.plantillas_dir = plantillas_dir
+        self.json_dir = json_dir
+        self.tokenizer = tokenizer
+        self.label2id = label2id
+        self.semilla = semilla
+        self.docs_por_shard = docs_por_shard
+        self.max_len = max_len
+
+    # Las plantillas y los valores se cargan en cada proceso del DataLoader, al empezar a leer
+    def _cargar(self):
+        plantillas = cargar_plantillas(self.plantillas_dir, json_files, normalizar_texto)
+        return plantillas, cargar_datos_json(self.json_dir, json_files)
+
+    def __iter__(self):
+        worker = get_worker_info()
+        proceso, num_procesos = (worker.id, worker.num_workers) if worker is not None else (0, 1)
+        plantillas, datos_json = self._cargar()
+        for texto, entities in flujo_documentos(plantillas, datos_json, self.semilla, self.docs_por_shard,
+                                                shard_inicial=proceso, paso=num_procesos):
+            yield codificar_documento(self.tokenizer, self.label2id, texto, entities, self.max_len)
+
+    # Documentos de validación fijos: los num_docs primeros que el flujo reserva para validación (ver generacion.py).
+    # Nunca salen en el flujo de entrenamiento.
+    def validacion(self, num_docs):
+        plantillas, datos_json = self._cargar()
+        documentos = []
+        shard = 0
+        while len(documentos) < num_docs:
+            for texto, entities in documentos_shard(plantillas, datos_json, shard, self.docs_por_shard, self.semilla, validacion=True):
+                documentos.append(codificar_documento(self.tokenizer, self.label2id, texto, entities, self.max_len))
+            shard += 1
+        return documentos[:num_docs]
@@ -4,8 +4,14 @@
 import fitz  # PyMuPDF
 import os
 import re
+import sys
 from dateutil.parser import parse
 
+# El almacén de textos con caché y el motor de limpieza están en la carpeta de libretas, los reutilizamos desde aquí.
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'libretas'))
+from almacen_textos import AlmacenTextos, clave_pdf, version_reglas
+from limpieza import MotorLimpieza
+
 # Función para extraer texto de un PDF usando PyMuPDF (fitz)
 def extract_text_from_pdf(pdf_path):
     doc = fitz.open(pdf_path)
@@ -15,19 +21,19 @@ def extract_text_from_pdf(pdf_path):
         text += page.get_text()
     return text
 
+# Motor con las reglas de limpieza, compilado una sola vez (ver libretas/limpieza.py). Aquí pasamos el texto a minúsculas
+# y quitamos URLs, secuencias de puntos y de espacios, valores placeholder x,xx, € que no tienen un número antes,
+# números de página, comas que no tienen un número antes y tienen solo 1 o 2 dígitos después, puntos y comas solitarios
+# y caracteres no deseados (mantenemos números, letras, puntos, comas y €).
+# Los marcadores van en tres pasadas porque quitar unos cambia lo que tienen al lado los siguientes.
+motor_limpieza = MotorLimpieza(
+    conservar='.,€',
+    marcadores=(r'\bx,xx\b|(?<!\d)€', r'\bpágina \d+\b', r'(?<!\d),\d{1,2}\b'),
+    minusculas=True)
+
 # Función para limpiar el texto
 def clean_text(text):
-    text = text.lower()
-    text = re.sub(r'http\S+|www\.\S+', '', text)  # Eliminar URLs
-    text = re.sub(r'\.{2,}', '.', text)  # Eliminar secuencias repetidas de puntos
-    text = re.sub(r'\s+', ' ', text).strip()  # Eliminar secuencias repetidas de espacios
-    text = re.sub(r'\bx,xx\b', '', text)  # Eliminar valores placeholder x,xx
-    text = re.sub(r'(?<!\d)€', '', text)  # Eliminar € que no tienen un número antes
-    text = re.sub(r'\bpágina \d+\b', '', text)  # Eliminar números de página
-    text = re.sub(r'(?<!\d),\d{1,2}\b', '', text)  # Eliminar comas que no tienen un número antes y tienen solo 1 o 2 dígitos después
-    text = re.sub(r'(?<=\s)[\.\,](?=\s)', '', text)  # Eliminar puntos y comas solitarios
-    text = re.sub(r'[^\w\s.,€]', '', text)  # Eliminar caracteres no deseados, mantener números, letras, puntos, comas y €
-    return text
+    return motor_limpieza.limpiar(text)
 
 # Función para normalizar las fechas a un formato estándar
 def normalize_dates(text):
@@ -52,29 +58,54 @@ def normalize_dates(text):
 # Ruta a la carpeta de los PDFs y la carpeta de salida para los textos extraídos
 pdf_folder = 'C:/Users/34670/Desktop/python/Hack a boss/proyecto_decide/training'
 output_folder = 'C:/Users/34670/Desktop/python/Hack a boss/proyecto_decide/cuadernos/pre'
+# Almacén con los textos ya limpios: si el PDF y las reglas de limpieza no han cambiado, no se vuelve a extraer.
+almacen_path = 'C:/Users/34670/Desktop/python/Hack a boss/proyecto_decide/cuadernos/pre.pack'
+# 02_procesamiento.py lee los .txt de la carpeta pre, así que aquí los seguimos escribiendo.
+guardar_txt = True
 os.makedirs(output_folder, exist_ok=True)
 
+almacen = AlmacenTextos(almacen_path)
+version = version_reglas(clean_text, normalize_dates, MotorLimpieza, motor_limpieza)
+saltados = 0
+
 # Procesar todos los PDFs en la carpeta
-for pdf_file in os.listdir(pdf_folder):
-    if not pdf_file.endswith('.pdf'):
-        continue
-
-    pdf_path = os.path.join(pdf_folder, pdf_file)
-    
-    # 1. Extraer texto del PDF
-    text = extract_text_from_pdf(pdf_path)
-    
-    # 2. Limpiar el texto
-    text = clean_text(text)
-    
-    # 3. Normalizar las fechas en el texto
-    text = normalize_dates(text)
-    
-    # Guardar el texto limpiado en un archivo
-    output_file = os.path.join(output_folder, pdf_file.replace('.pdf', '.txt'))
-    with open(output_file, 'w', encoding='utf-8') as f:
-        f.write(text)
-    
-    print(f"Texto extraído y limpiado de '{pdf_file}' guardado en '{output_file}'")
-
-print("Procesamiento completado.")
+with almacen:
+    for pdf_file in os.listdir(pdf_folder):
+        if not pdf_file.endswith('.pdf'):
+            continue
+
+        pdf_path = os.path.join(pdf_folder, pdf_file)
+        nombre = pdf_file[:-len('.pdf')]
+        output_file = os.path.join(output_folder, pdf_file.replace('.pdf', '.txt'))
+        with open(pdf_path, 'rb') as f:
+            clave = clave_pdf(f.read(), version)
+
+        # Si ya lo tenemos con la misma clave, nos ahorramos extraer y limpiar otra vez
+        if almacen.vigente(nombre, clave) and (not guardar_txt or os.path.exists(output_file)):
+            saltados += 1
+            continue
+
+        if clave in almacen.claves:
+            # PDF duplicado de otro ya procesado: reutilizamos su texto
+            almacen.guardar(nombre, clave)
+            text = almacen.leer(nombre)
+        else:
+            # 1. Extraer texto del PDF
+            text = extract_text_from_pdf(pdf_path)
+
+            # 2. Limpiar el texto
+            text = clean_text(text)
+
+            # 3. Normalizar las fechas en el texto
+            text = normalize_dates(text)
+
+            almacen.guardar(nombre, clave, text)
+
+        # Guardar el texto limpiado en un archivo
+        if guardar_txt:
+            with open(output_file, 'w', encoding='utf-8') as f:
+                f.write(text)
+
+        print(f"Texto extraído y limpiado de '{pdf_file}' guardado en '{almacen_path}'")
+
+print(f"Procesamiento completado. Facturas sin cambios (caché): {saltados}")
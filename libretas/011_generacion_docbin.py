@@ -0,0 +1,118 @@
+# generacion_docbin.py
+# Este script genera directamente los DocBin de spaCy para entrenar y validar, a partir de las plantillas compiladas
+# (ver generacion.py), sin pasar por los documentos JSON de 01_preprocesamiento.py ni volver a leerlos y
+# validarlos en 02_entrenamiento.py. Cada documento se monta con los huecos de su plantilla, se tokeniza una vez
+# y las entidades se crean con las posiciones que ya conocemos de los huecos.
+# Las entidades que no coinciden con los tokens (por ejemplo un valor pegado a una palabra de la plantilla)
+# se quitan según se genera y se cuentan por etiqueta, en vez de descartar el documento entero.
+# Los DocBin se guardan por shards (train/train_00000.spacy, val/val_00000.spacy...), con la misma semilla y el
+# mismo reparto en shards que 01_preprocesamiento.py, así que salen los mismos documentos con cualquier número de procesos.
+# spacy train y load_data de docbins.py (03_modelo.py y 04_validacion.py) aceptan la carpeta con los shards en vez de un único .spacy.
+
+import os
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+import spacy
+from spacy.tokens import DocBin
+from generacion import cargar_datos_json, cargar_plantillas, es_validacion, generar_shard, json_files, shards_de_maquina
+from valores import cargar_valores, compilar_valores
+
+# Directorios de entrada y salida...
+plantillas_dir = "C:/Users/34670/Desktop/python/Hack a boss/proyecto_decide/libretas/plantillas/"
+json_dir = "C:/Users/34670/Desktop/python/Hack a boss/proyecto_decide/libretas/json_categoria/"
+output_dir = "C:/Users/34670/Desktop/python/Hack a boss/proyecto_decide/libretas/docbin/"
+
+# Generación reproducible por shards, igual que en 01_preprocesamiento.py
+semilla = 42
+docs_por_shard = 1000
+num_workers = os.cpu_count() or 1
+maquina = 0
+num_maquinas = 1
+# Valores de json_categoria en formato compacto, compartidos entre los procesos con mmap (ver valores.py).
+# Con valores_dir = None se cargan los JSON en listas como antes. muestreo permite sacar más a menudo algunos
+# estratos de un campo, por ejemplo {"calle_cliente": ("longitud", {"3": 3.0, "4": 3.0, "5": 3.0})}.
+valores_dir = None
+muestreo = {}
+
+# Datos de cada proceso: plantillas compiladas, valores de los JSON y el tokenizador de spaCy en blanco
+_contexto = {}
+
+def iniciar_generador(plantillas_dir, json_dir, json_files, valores_dir=None, muestreo=None):
+    if valores_dir is None:
+        _contexto['datos_json'] = cargar_datos_json(json_dir, json_files)
+    else:
+        _contexto['datos_json'] = cargar_valores(valores_dir, json_files, muestreo)
+    _contexto['plantillas'] = cargar_plantillas(plantillas_dir, json_files)
+    _contexto['nlp'] = spacy.blank('es')
+
+# Función para crear el Doc de un documento generado...
+# Las entidades que no caen en límites de token se quitan y se cuentan en descartadas (por etiqueta).
+def crear_doc(nlp, texto, entities, descartadas):
+    doc = nlp.make_doc(texto)
+    spans = []
+    for start, end, label in entities:
+        span = doc.char_span(start, end, label=label)
+        if span is not None:
+            spans.append(span)
+        else:
+            descartadas[label] += 1
+    doc.ents = spans
+    return doc
+
+# Los Doc salen de un spaCy en blanco y solo tienen tokens y entidades, así que el DocBin guarda solo eso:
+# ocupa casi la mitad y se escribe bastante más rápido que con todos los atributos.
+atributos = ["ORTH", "ENT_IOB", "ENT_TYPE"]
+
+# Función para generar y guardar los DocBin de un shard...
+# Devuelve cuántos documentos van a cada DocBin y las entidades descartadas por etiqueta.
+def generar_docbin_shard(shard, output_dir, num_docs, docs_por_shard, semilla):
+    nlp = _contexto['nlp']
+    train_db = DocBin(attrs=atributos)
+    val_db = DocBin(attrs=atributos)
+    descartadas = Counter()
+
+    for i, _, texto, entities in generar_shard(_contexto['plantillas'], _contexto['datos_json'], shard, num_docs, docs_por_shard, semilla):
+        doc = crear_doc(nlp, texto, entities, descartadas)
+        # Reparto entre entrenamiento y validación (80%-20%) por el número de documento (ver generacion.py)
+        if es_validacion(i):
+            val_db.add(doc)
+        else:
+            train_db.add(doc)
+
+    train_db.to_disk(os.path.join(output_dir, 'train', f'train_{shard:05d}.spacy'))
+    val_db.to_disk(os.path.join(output_dir, 'val', f'val_{shard:05d}.spacy'))
+    return len(train_db), len(val_db), descartadas
+
+# Función principal...
+# Reparte los shards de esta máquina entre los procesos y junta los recuentos.
+def generar_docbins(plantillas_dir, json_dir, output_dir, json_files, num_docs=20000):
+    shards = shards_de_maquina(num_docs, docs_por_shard, maquina, num_maquinas)
+    argumentos = (repeat(output_dir), repeat(num_docs), repeat(docs_por_shard), repeat(semilla))
+    if valores_dir is not None:
+        compilar_valores(json_dir, json_files, valores_dir)
+
+    if num_workers > 1:
+        with ProcessPoolExecutor(max_workers=num_workers, initializer=iniciar_generador,
+                                 initargs=(plantillas_dir, json_dir, json_files, valores_dir, muestreo)) as executor:
+            resultados = list(executor.map(generar_docbin_shard, shards, *argumentos))
+    else:
+        iniciar_generador(plantillas_dir, json_dir, json_files, valores_dir, muestreo)
+        resultados = list(map(generar_docbin_shard, shards, *argumentos))
+
+    descartadas = Counter()
+    for _, _, descartadas_shard in resultados:
+        descartadas.update(descartadas_shard)
+
+    print(f"Documentos de entrenamiento: {sum(train for train, _, _ in resultados)} en {len(resultados)} shards")
+    print(f"Documentos de validación: {sum(val for _, val, _ in resultados)}")
+    print(f"Entidades descartadas por no coincidir con los tokens: {sum(descartadas.values())}")
+    for label, cantidad in descartadas.most_common():
+        print(f"  {label}: {cantidad}")
+
+# Va protegido con __main__ porque en Windows cada proceso del pool vuelve a importar este script.
+if __name__ == '__main__':
+    for carpeta in ('train', 'val'):
+        os.makedirs(os.path.join(output_dir, carpeta), exist_ok=True)
+
+    generar_docbins(plantillas_dir, json_dir, output_dir, json_files, num_docs=20000)
@@ -0,0 +1,63 @@
+# deduplicacion.py
+# Este script quita los documentos casi duplicados de los generados por 01_preprocesamiento.py antes de montar
+# los DocBin en 02_entrenamiento.py, y se queda con un subconjunto variado de objetivo documentos.
+# Con pocas plantillas y listas de valores finitas, muchos de los 20.000 documentos son casi iguales y entrenar
+# con todos cuesta lo mismo que si fuesen distintos: con menos documentos, pero variados, entrenamos antes sin
+# perder cobertura de plantillas ni de valores.
+# Los casi duplicados se detectan con firmas MinHash (ver duplicados.py) y se saca la tasa de duplicados por plantilla.
+# El resultado se guarda en shards con su índice (ver shards.py), igual que los datos de entrada, así que
+# 02_entrenamiento.py puede leerlo cambiando data_folder por output_dir.
+
+import os
+from collections import Counter
+from duplicados import DetectorDuplicados, seleccionar_diversos
+from shards import escribir_indice, escribir_shard, leer_indice, leer_shards
+
+# Directorios de entrada (documentos de 01_preprocesamiento.py) y de salida
+input_dir = "C:/Users/34670/Desktop/python/Hack a boss/proyecto_decide/libretas/datos/"
+output_dir = "C:/Users/34670/Desktop/python/Hack a boss/proyecto_decide/libretas/datos_dedup/"
+
+# Similitud de Jaccard (estimada) a partir de la cual dos documentos se consideran casi duplicados
+umbral = 0.85
+# Número de documentos que queremos quedarnos (None para quedarnos con todos los que no son duplicados)
+objetivo = 10000
+docs_por_shard = 1000
+
+# Función principal...
+# Recorremos los documentos en orden: de cada grupo de casi duplicados nos quedamos con el primero.
+def deduplicar(input_dir, output_dir, umbral=0.85, objetivo=None):
+    detector = DetectorDuplicados(umbral=umbral)
+    generados = Counter()
+    duplicados = Counter()
+    unicos = []
+    for registro in leer_shards(input_dir):
+        plantilla = registro.get('plantilla')
+        generados[plantilla] += 1
+        if detector.duplicado_de(registro['text']) is None:
+            unicos.append(registro)
+        else:
+            duplicados[plantilla] += 1
+
+    seleccion = unicos if objetivo is None or len(unicos) <= objetivo else seleccionar_diversos(unicos, objetivo)
+    seleccionados = Counter(registro.get('plantilla') for registro in seleccion)
+
+    # Guardamos la selección en shards, con la misma compresión que la entrada
+    compresion = leer_indice(input_dir)["compresion"]
+    entradas = [escribir_shard(output_dir, 'documentos', shard, seleccion[inicio:inicio + docs_por_shard], compresion)
+                for shard, inicio in enumerate(range(0, len(seleccion), docs_por_shard))]
+    escribir_indice(output_dir, entradas, compresion)
+
+    # Resumen por plantilla
+    print(f"{'plantilla':<22}{'generados':>10}{'duplicados':>12}{'tasa':>8}{'seleccionados':>15}")
+    for plantilla in sorted(generados, key=str):
+        print(f"{str(plantilla):<22}{generados[plantilla]:>10}{duplicados[plantilla]:>12}"
+              f"{duplicados[plantilla] / generados[plantilla]:>8.1%}{seleccionados[plantilla]:>15}")
+    total = sum(generados.values())
+    print(f"Total: {total} documentos, {sum(duplicados.values())} casi duplicados ({sum(duplicados.values()) / max(total, 1):.1%}), "
+          f"{len(seleccion)} seleccionados")
+
+if __name__ == '__main__':
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+
+    deduplicar(input_dir, output_dir, umbral, objetivo)
@@ -6,7 +6,11 @@
 
 import os
 import json
-import random
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from generacion import cargar_plantillas, generar_shard, shards_de_maquina
+from shards import escribir_indice, escribir_shard
+from valores import cargar_valores, compilar_valores
 
 # Directorios de entrada y salida...
 # Cargamos las plantillas que hemos generado y donde tenemos las etiquetas llamadas placeholders.
@@ -16,6 +20,25 @@ plantillas_dir = "C:/Users/34670/Desktop/python/Hack a boss/proyecto_decide/libr
 json_dir = "C:/Users/34670/Desktop/python/Hack a boss/proyecto_decide/libretas/json_categoria/"
 output_dir = "C:/Users/34670/Desktop/python/Hack a boss/proyecto_decide/libretas/datos/"
 
+# Generación reproducible por shards (ver generacion.py)...
+# Cada shard tiene docs_por_shard documentos y su propia semilla sacada de la semilla global, así que con la misma
+# semilla se generan exactamente los mismos documentos con cualquier número de procesos.
+semilla = 42
+docs_por_shard = 1000
+num_workers = os.cpu_count() or 1
+# Los documentos se guardan en archivos JSONL, uno por shard, con un índice (ver shards.py).
+# Se pueden comprimir con 'gzip' o con 'zstd' (necesita el paquete zstandard); None para no comprimir.
+compresion = 'gzip'
+# Para repartir la generación entre varias máquinas: cada una pone su número (0, 1, ...) y el total.
+# Cada máquina genera un bloque seguido de shards, así que juntando las carpetas de salida sale el conjunto completo.
+maquina = 0
+num_maquinas = 1
+# Valores de json_categoria en formato compacto, compartidos entre los procesos con mmap (ver valores.py).
+# Con valores_dir = None se cargan los JSON en listas como antes. muestreo permite sacar más a menudo algunos
+# estratos de un campo, por ejemplo {"calle_cliente": ("longitud", {"3": 3.0, "4": 3.0, "5": 3.0})}.
+valores_dir = None
+muestreo = {}
+
 # Diccionario de placeholders...
 # Este diccionario mapea los placeholders a sus correspondientes archivos JSON.
 json_files = {
@@ -50,73 +73,72 @@ def cargar_datos_json(json_dir, json_files):
             datos[placeholder] = json.load(f)
     return datos
 
-# Función para generar un texto con datos aleatorios y capturar las entidades...
-# Sustituimos los placeholders en la plantilla por datos aleatorios del JSON correspondiente
+# Datos que necesita cada proceso para generar documentos: las plantillas compiladas y los valores de los JSON.
+# Se cargan una sola vez por proceso, al arrancarlo (en el modo de un solo proceso, en el proceso principal).
+_contexto = {}
+
+def iniciar_generador(plantillas_dir, json_dir, json_files, valores_dir=None, muestreo=None):
+    if valores_dir is None:
+        _contexto['datos_json'] = cargar_datos_json(json_dir, json_files)
+    else:
+        _contexto['datos_json'] = cargar_valores(valores_dir, json_files, muestreo)
+    _contexto['plantillas'] = cargar_plantillas(plantillas_dir, json_files)
+
+# Función para generar y guardar los documentos de un shard...
+# Sustituimos los placeholders de las plantillas (ya compiladas, ver generacion.py) por datos aleatorios del JSON correspondiente
 # y capturamos la posición de las entidades para usarlas en el entrenamiento del modelo...
-def generar_texto_con_datos(plantilla, datos_json):
-    entities = []
-    texto_final = ""
-    offset = 0
+# Los documentos se escriben según se generan en el archivo JSONL del shard (ver shards.py).
+# Devuelve la entrada del índice del shard y cuántos documentos se han descartado.
+def generar_documentos_shard(shard, output_dir, num_docs, docs_por_shard, semilla):
+    documentos_descartados = 0
 
-    for placeholder, key in json_files.items():
-        while placeholder in plantilla:
-            valor = random.choice(datos_json[placeholder])
-            start = plantilla.find(placeholder)
-            end = start + len(valor)
-            
-            texto_final += plantilla[:start] + valor
-            plantilla = plantilla[start + len(placeholder):]
-            
-            # Ajuste de entidades y desplazamiento de posiciones
-            for entity in entities:
-                if entity[0] >= offset + start:
-                    entity[0] += len(valor) - len(placeholder)
-                if entity[1] >= offset + start:
-                    entity[1] += len(valor) - len(placeholder)
-                    
-            entities.append([offset + start, offset + start + len(valor), key])
-            offset += start + len(valor)
-    
-    texto_final += plantilla
-
-    return texto_final, entities
+    def documentos():
+        nonlocal documentos_descartados
+        for i, plantilla, texto, entities in generar_shard(_contexto['plantillas'], _contexto['datos_json'], shard, num_docs, docs_por_shard, semilla):
+            if not entities:
+                documentos_descartados += 1
+                continue
+
+            yield {
+                "id": i + 1,
+                "plantilla": plantilla.nombre,
+                "text": texto,
+                "entities": entities
+            }
+
+    entrada = escribir_shard(output_dir, 'documentos', shard, documentos(), compresion)
+    return entrada, documentos_descartados
 
 # Función principal para generar documentos...
-# Esta función coordina la carga de datos, selección de plantillas, generación de textos y escritura en archivos.
+# Esta función coordina la carga de datos y reparte los shards de esta máquina entre los procesos.
+# El resultado es el mismo con cualquier número de procesos o de máquinas (ver generacion.py).
 def generar_documentos(plantillas_dir, json_dir, output_dir, json_files, num_docs=20000):
-    # Cargar datos JSON...
-    datos_json = cargar_datos_json(json_dir, json_files)
-    
-    # Obtener plantillas...
-    plantillas = [f for f in os.listdir(plantillas_dir) if f.endswith('.txt')]
-    
-    # Generar documentos...
-    documentos_descartados = 0
-    for i in range(num_docs):
-        plantilla_file = random.choice(plantillas)
-        with open(os.path.join(plantillas_dir, plantilla_file), 'r', encoding='utf-8') as f:
-            plantilla = f.read()
-        
-        texto, entities = generar_texto_con_datos(plantilla, datos_json)
-        
-        if not entities:
-            documentos_descartados += 1
-            continue
-        
-        data_entry = {
-            "text": texto,
-            "entities": entities
-        }
-        
-        output_file = os.path.join(output_dir, f"documento_{i+1}.json")
-        with open(output_file, 'w', encoding='utf-8') as f:
-            json.dump(data_entry, f, ensure_ascii=False, indent=4)
+    shards = shards_de_maquina(num_docs, docs_por_shard, maquina, num_maquinas)
+    argumentos = (repeat(output_dir), repeat(num_docs), repeat(docs_por_shard), repeat(semilla))
+    if valores_dir is not None:
+        compilar_valores(json_dir, json_files, valores_dir)
+
+    if num_workers > 1:
+        with ProcessPoolExecutor(max_workers=num_workers, initializer=iniciar_generador,
+                                 initargs=(plantillas_dir, json_dir, json_files, valores_dir, muestreo)) as executor:
+            resultados = list(executor.map(generar_documentos_shard, shards, *argumentos))
+    else:
+        iniciar_generador(plantillas_dir, json_dir, json_files, valores_dir, muestreo)
+        resultados = list(map(generar_documentos_shard, shards, *argumentos))
+
+    # Índice con los shards de esta máquina
+    entradas = [entrada for entrada, _ in resultados]
+    escribir_indice(output_dir, entradas, compresion, maquina if num_maquinas > 1 else None)
 
+    documentos_descartados = sum(descartados for _, descartados in resultados)
+    print(f"Total de documentos generados: {sum(entrada['registros'] for entrada in entradas)} en {len(entradas)} shards")
     print(f"Total de documentos descartados: {documentos_descartados}")
 
 # Ejecutar la función principal...
 # Creamos el directorio de salida si no existe y llamamos a la función para generar los documentos.
-if not os.path.exists(output_dir):
-    os.makedirs(output_dir)
+# Va protegido con __main__ porque en Windows cada proceso del pool vuelve a importar este script.
+if __name__ == '__main__':
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
 
-generar_documentos(plantillas_dir, json_dir, output_dir, json_files, num_docs=20000)
+    generar_documentos(plantillas_dir, json_dir, output_dir, json_files, num_docs=20000)
@@ -4,95 +4,152 @@
 # Usamos plantillas generadas previamente y etiquetas para entrenar el modelo...
 
 import os
+import re
 import json
 import spacy
 from spacy.tokens import DocBin
-import random
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from generacion import es_validacion
+from shards import hay_shards, leer_indice, leer_shard
 
 # Ruta a la carpeta de los textos extraídos y los JSON con las etiquetas...
 data_folder = 'C:/Users/34670/Desktop/python/Hack a boss/proyecto_decide/libretas/datos/'
 
+# Los documentos se reparten en trozos (un shard, o archivos_por_trozo archivos JSON en las carpetas antiguas)
+# y cada trozo lo procesa un proceso con su propio spaCy en blanco. Cada proceso devuelve sus DocBin parciales
+# y aquí se juntan, así que rehacer los datos de entrenamiento tras cambiar las plantillas escala con los núcleos.
+num_workers = os.cpu_count() or 1
+archivos_por_trozo = 1000
+
 # Inicializar spaCy...
 # Usar un modelo en blanco para español, que entrenaremos desde cero con nuestros datos.
-nlp = spacy.blank('es')
-
-# Recopilar y procesar todos los archivos JSON en el directorio de datos...
-all_files = [file_name for file_name in os.listdir(data_folder) if file_name.endswith('.json')]
-
-# Barajar los archivos para una distribución aleatoria...
-random.shuffle(all_files)
-
-# Dividir los archivos en conjuntos de entrenamiento y validación (80%-20%)...
-split_index = int(len(all_files) * 0.8)
-train_files = all_files[:split_index]
-val_files = all_files[split_index:]
-
-# Función para procesar archivos y crear DocBin...
+# Cada proceso tiene el suyo (se crea al arrancar el proceso, ver iniciar_proceso).
+nlp = None
+
+def iniciar_proceso():
+    global nlp
+    nlp = spacy.blank('es')
+
+# Trozos de documentos en los que repartir el trabajo...
+# 01_preprocesamiento.py guarda los documentos en shards JSONL con un índice (ver shards.py) y cada shard es un trozo.
+# Si la carpeta es de antes y tiene un documento_N.json por documento, los archivos se agrupan de archivos_por_trozo en archivos_por_trozo.
+def trozos_documentos(data_folder):
+    if hay_shards(data_folder):
+        indice = leer_indice(data_folder)
+        return [('shard', entrada, indice["compresion"]) for entrada in indice["shards"]]
+    file_names = sorted(f for f in os.listdir(data_folder) if f.endswith('.json'))
+    return [('archivos', file_names[i:i + archivos_por_trozo], None) for i in range(0, len(file_names), archivos_por_trozo)]
+
+# Recorrer los documentos de un trozo
+def leer_documentos(data_folder, trozo):
+    tipo, contenido, compresion = trozo
+    if tipo == 'shard':
+        for data in leer_shard(data_folder, contenido, compresion):
+            yield f"documento_{data['id']}", data
+    else:
+        for file_name in contenido:
+            with open(os.path.join(data_folder, file_name), 'r', encoding='utf-8') as f:
+                yield file_name, json.load(f)
+
+# Función para procesar un documento y crear su Doc...
 # DocBin es una estructura de datos eficiente para almacenar múltiples objetos Doc, que representa nuestros documentos procesados con spaCy.
-# Procesa cada archivo, crea el objeto Doc de spaCy y añade las entidades.
+# Crea el objeto Doc de spaCy con sus entidades, o devuelve None si el documento es inválido.
 # Los documentos inválidos son descartados y se cuentan... así podemos evaluar si hay muchos errores en el procesamiento del entrenamiento.
-def process_files(file_list, docbin):
-    discarded_count = 0
-    for file_name in file_list:
-        file_path = os.path.join(data_folder, file_name)
-
-        with open(file_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-
-        text = data['text']
-        entities = data['entities']
-
-        # Crear ejemplo de spaCy...
-        doc = nlp.make_doc(text)
-        spans = []
-        valid = True
-        for start, end, label in entities:
-            if start < len(doc.text) and end <= len(doc.text):
-                entity_text = text[start:end]
-                # Verificar que el texto de la entidad coincida con lo que debería ser...
-                if entity_text == text[start:end]:
-                    span = doc.char_span(start, end, label=label)
-                    if span is not None:
-                        spans.append(span)
-                    else:
-                        valid = False
-                        print(f"Entidad inválida: {label} ({start}-{end}) en el archivo {file_name}, texto: '{entity_text}'")
-                        break
-                else:
-                    valid = False
-                    print(f"Texto de entidad no coincide: {label} ({start}-{end}) en el archivo {file_name}, texto entidad: '{entity_text}', texto real: '{text[start:end]}'")
-                    break
+def process_document(file_name, data):
+    text = data['text']
+    entities = data['entities']
+
+    # Crear ejemplo de spaCy...
+    # doc.text se vuelve a montar token a token cada vez que se pide, así que usamos text (es el mismo texto).
+    doc = nlp.make_doc(text)
+    spans = []
+    for start, end, label in entities:
+        if start < len(text) and end <= len(text):
+            entity_text = text[start:end]
+            span = doc.char_span(start, end, label=label)
+            if span is not None:
+                spans.append(span)
             else:
-                valid = False
-                print(f"Índice fuera de rango: {label} ({start}-{end}) en el archivo {file_name}, longitud del texto: {len(doc.text)}, texto: '{text[start:end]}'")
-                break
-
-        if valid:
-            doc.ents = spans
-            docbin.add(doc)
+                print(f"Entidad inválida: {label} ({start}-{end}) en el archivo {file_name}, texto: '{entity_text}'")
+                return None
         else:
-            discarded_count += 1
+            print(f"Índice fuera de rango: {label} ({start}-{end}) en el archivo {file_name}, longitud del texto: {len(text)}, texto: '{text[start:end]}'")
+            return None
+
+    doc.ents = spans
+    return doc
+
+# Número del documento (el mismo que usa generacion.py para repartir): el id en los shards y, en las carpetas
+# antiguas, la N de documento_N.json (01_preprocesamiento.py numeraba los archivos desde 1, igual que los id).
+_patron_documento = re.compile(r'documento_(\d+)\.json')
+
+def numero_documento(file_name, data):
+    if 'id' in data:
+        return data['id']
+    match = _patron_documento.fullmatch(file_name)
+    if match is None:
+        raise ValueError(f"No se sabe el número del documento {file_name}: no tiene id ni se llama documento_N.json")
+    return int(match.group(1))
+
+# Función para procesar un trozo de documentos (en cada proceso)...
+# Reparte los documentos entre entrenamiento y validación (80%-20%) por su número de documento (ver generacion.py),
+# así que el reparto es el mismo con cualquier número de procesos. Devuelve los DocBin parciales en bytes
+# y los documentos descartados en cada uno.
+def process_chunk(trozo, data_folder):
+    train_db = DocBin()
+    val_db = DocBin()
+    train_discarded = 0
+    val_discarded = 0
+
+    for file_name, data in leer_documentos(data_folder, trozo):
+        is_train = not es_validacion(numero_documento(file_name, data) - 1)
+        doc = process_document(file_name, data)
+        if doc is None:
             print(f"Documento inválido descartado: {file_name}")
-
-    return discarded_count
-
-# Crear DocBin para entrenamiento y validación...
-train_db = DocBin()
-val_db = DocBin()
-
-# Procesar archivos de entrenamiento...
-train_discarded = process_files(train_files, train_db)
-# Procesar archivos de validación...
-val_discarded = process_files(val_files, val_db)
-
-# Guardar los datos de entrenamiento y validación en formato binario de spaCy
-train_output_path = 'train_data.spacy'
-val_output_path = 'val_data.spacy'
-train_db.to_disk(train_output_path)
-val_db.to_disk(val_output_path)
-print(f"Datos de entrenamiento guardados en '{train_output_path}'")
-print(f"Datos de validación guardados en '{val_output_path}'")
-
-# Imprimir resumen de archivos descartados. Así vemos si hay muchos errores a la hora del entrenamiento al montar los archivos del DocBin
-print(f"Archivos descartados durante el entrenamiento: {train_discarded}")
-print(f"Archivos descartados durante la validación: {val_discarded}")
+            if is_train:
+                train_discarded += 1
+            else:
+                val_discarded += 1
+        elif is_train:
+            train_db.add(doc)
+        else:
+            val_db.add(doc)
+
+    return train_db.to_bytes(), val_db.to_bytes(), train_discarded, val_discarded
+
+# Función principal...
+# Reparte los trozos entre los procesos y junta sus DocBin parciales, en orden, en los de entrenamiento y validación.
+def build_docbins(data_folder, train_output_path, val_output_path):
+    trozos = trozos_documentos(data_folder)
+    if num_workers > 1:
+        with ProcessPoolExecutor(max_workers=num_workers, initializer=iniciar_proceso) as executor:
+            resultados = list(executor.map(process_chunk, trozos, repeat(data_folder)))
+    else:
+        iniciar_proceso()
+        resultados = list(map(process_chunk, trozos, repeat(data_folder)))
+
+    # Crear DocBin para entrenamiento y validación juntando los parciales...
+    train_db = DocBin()
+    val_db = DocBin()
+    train_discarded = 0
+    val_discarded = 0
+    for train_bytes, val_bytes, train_chunk_discarded, val_chunk_discarded in resultados:
+        train_db.merge(DocBin().from_bytes(train_bytes))
+        val_db.merge(DocBin().from_bytes(val_bytes))
+        train_discarded += train_chunk_discarded
+        val_discarded += val_chunk_discarded
+
+    # Guardar los datos de entrenamiento y validación en formato binario de spaCy
+    train_db.to_disk(train_output_path)
+    val_db.to_disk(val_output_path)
+    print(f"Datos de entrenamiento guardados en '{train_output_path}'")
+    print(f"Datos de validación guardados en '{val_output_path}'")
+
+    # Imprimir resumen de archivos descartados. Así vemos si hay muchos errores a la hora del entrenamiento al montar los archivos del DocBin
+    print(f"Archivos descartados durante el entrenamiento: {train_discarded}")
+    print(f"Archivos descartados durante la validación: {val_discarded}")
+
+# Va protegido con __main__ porque en Windows cada proceso del pool vuelve a importar este script.
+if __name__ == '__main__':
+    build_docbins(data_folder, 'train_data.spacy', 'val_data.spacy')
@@ -0,0 +1,96 @@
+# exportacion_ner.py
+# Este script exporta una versión ligera del modelo entrenado solo para extraer entidades.
+# 03_modelo.py ajusta es_core_news_md, así que modelo_entrenado lleva también el morphologizer, el parser, el senter,
+# el attribute_ruler y el lematizador (con sus tablas de lemas), y todos se ejecutan con cada factura en 07_app.py
+# aunque solo leemos doc.ents. Aquí montamos un pipeline con solo el NER (y el tok2vec si el NER lo usa como listener),
+# copiando los componentes ya entrenados (sourced) y marcándolos como congelados, sin las tablas de lemas y,
+# si se quiere, con menos vectores.
+# Al final comparamos los dos modelos: tamaño en disco, tiempo de carga, palabras por segundo y si sacan las mismas entidades.
+
+import os
+import time
+import spacy
+from shards import hay_shards, leer_shards
+
+# Modelo completo y carpeta del modelo ligero
+model_path = 'modelo_entrenado'
+lean_path = 'modelo_ner'
+
+# Número de vectores a conservar (las palabras sin vector pasan a usar el del más parecido que queda).
+# None para dejar todos: con menos vectores el modelo ocupa y carga mucho menos, pero puede cambiar alguna entidad,
+# así que hay que mirar la coincidencia de entidades del informe antes de usarlo.
+vectors_to_keep = None
+
+# Textos para medir la velocidad y comparar las entidades: los documentos generados por 01_preprocesamiento.py
+data_folder = 'C:/Users/34670/Desktop/python/Hack a boss/proyecto_decide/libretas/datos/'
+num_texts = 500
+
+# Función para montar el pipeline ligero...
+# El NER de es_core_news_md tiene su propio tok2vec, pero si en el modelo el NER escucha al tok2vec compartido
+# (Tok2VecListener) también hay que llevarse ese tok2vec.
+def build_lean_pipeline(nlp_full):
+    components = ['ner']
+    if 'tok2vec' in nlp_full.pipe_names and 'ner' in nlp_full.get_pipe('tok2vec').listening_components:
+        components.insert(0, 'tok2vec')
+
+    nlp_lean = spacy.blank(nlp_full.lang, vocab=nlp_full.vocab)
+    nlp_lean.tokenizer = nlp_full.tokenizer
+    for name in components:
+        nlp_lean.add_pipe(name, source=nlp_full)
+
+    # Los componentes ya vienen entrenados: si se vuelve a entrenar a partir de este modelo, que no cambien
+    nlp_lean.config["training"]["frozen_components"] = list(components)
+    nlp_lean.config["training"]["annotating_components"] = []
+
+    # Las tablas de lemas eran del lematizador, que no va en el modelo ligero
+    for table in list(nlp_lean.vocab.lookups.tables):
+        if table.startswith('lemma_'):
+            nlp_lean.vocab.lookups.remove_table(table)
+
+    if vectors_to_keep is not None and len(nlp_lean.vocab.vectors) > vectors_to_keep:
+        nlp_lean.vocab.prune_vectors(vectors_to_keep)
+    return nlp_lean
+
+# Tamaño de una carpeta en MB
+def folder_size(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        total += sum(os.path.getsize(os.path.join(root, f)) for f in files)
+    return total / 1024 / 1024
+
+# Tiempo de carga, palabras por segundo y entidades de un modelo sobre los textos
+def measure(path, texts):
+    start = time.perf_counter()
+    nlp = spacy.load(path)
+    load_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    docs = list(nlp.pipe(texts, batch_size=64))
+    elapsed = time.perf_counter() - start
+    words = sum(len(doc) for doc in docs)
+    entities = [[(ent.start_char, ent.end_char, ent.label_) for ent in doc.ents] for doc in docs]
+    return nlp.pipe_names, load_time, words / elapsed, entities
+
+if __name__ == '__main__':
+    nlp_full = spacy.load(model_path)
+    nlp_lean = build_lean_pipeline(nlp_full)
+    nlp_lean.to_disk(lean_path)
+    print(f"Modelo ligero guardado en '{lean_path}' con {nlp_lean.pipe_names}")
+
+    # Textos de prueba
+    texts = []
+    if hay_shards(data_folder):
+        for data in leer_shards(data_folder):
+            texts.append(data['text'])
+            if len(texts) == num_texts:
+                break
+
+    # Informe comparando los dos modelos
+    results = {}
+    for name, path in (('completo', model_path), ('ligero', lean_path)):
+        pipe_names, load_time, wps, entities = measure(path, texts)
+        results[name] = entities
+        print(f"Modelo {name}: {folder_size(path):.1f} MB, carga en {load_time:.2f} s, {wps:.0f} palabras/s, componentes {pipe_names}")
+
+    same = sum(a == b for a, b in zip(results['completo'], results['ligero']))
+    print(f"Documentos con las mismas entidades en los dos modelos: {same} de {len(texts)}")
@@ -0,0 +1,201 @@
+# barrido_hiperparametros.py
+# Este script prueba varias combinaciones de hiperparámetros del entrenamiento de 03_modelo.py a la vez.
+# En 03_modelo.py la tasa de aprendizaje (0.001, 0.0005, 0.0001...), el dropout (0.3, 0.5...) y el número de
+# iteraciones se fueron probando a mano, un entrenamiento de varias horas detrás de otro.
+# Aquí cada prueba es un entrenamiento en su propio proceso, con num_hilos hilos como máximo para que no se
+# peleen por los núcleos. Los DocBins de entrenamiento y validación se leen una sola vez y se pasan a los procesos
+# por memoria compartida. Cada prueba tiene su early stopping por paciencia, como en 03_modelo.py, y además las
+# pruebas que van mal se cortan pronto (successive halving): en cada escalón (iteraciones de escalones) solo siguen
+# las que están en el mejor 1/eta de las que han llegado a ese escalón.
+# Al final se muestra una tabla comparando todas las pruebas (y se guarda en resultados_barrido.csv).
+
+import os
+import csv
+import time
+import random
+import itertools
+import importlib
+import multiprocessing
+from multiprocessing import shared_memory
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+import spacy
+from spacy.tokens import DocBin
+from spacy.training import Example
+from docbins import load_data
+
+# Funciones del entrenamiento (el nombre empieza por número, así que hay que importarlo con importlib)
+modelo = importlib.import_module('03_modelo')
+
+# Datos: los mismos que en 03_modelo.py (archivos .spacy o carpetas de shards de 011_generacion_docbin.py)
+train_data_path = 'train_data.spacy'
+val_data_path = 'val_data.spacy'
+# Para ir más rápido, cada prueba evalúa sobre una muestra estratificada de la validación (None para usar toda)
+val_muestra = 1000
+
+# Hiperparámetros a probar. Con modo 'rejilla' se prueban todas las combinaciones y con 'aleatorio'
+# num_pruebas combinaciones al azar (sin repetir). Los lotes se hacen como en 03_modelo.py, por palabras
+# (length_batches), así que lo que se prueba es el tamaño de lote en palabras y su tolerancia.
+espacio = {
+    'learn_rate': [0.001, 0.0005, 0.0001],
+    'dropout': [0.3, 0.4, 0.5],
+    'palabras_por_lote': [1000, 2000, 4000],
+    'tolerancia_lote': [0.1, 0.3],
+}
+modo = 'aleatorio'
+num_pruebas = 18
+semilla = 42
+
+# Entrenamiento de cada prueba, como en 03_modelo.py
+n_iter = 50
+evaluate_every = 1
+patience = 8
+
+# Successive halving: en cada escalón siguen las pruebas en el mejor 1/eta (según su mejor F1 hasta entonces)
+# de las que ya han pasado por él. Las primeras eta - 1 que llegan a un escalón siguen siempre.
+escalones = [2, 6, 18]
+eta = 3
+
+# Pruebas a la vez y hilos por prueba (num_procesos * num_hilos no debería pasar del número de núcleos)
+num_procesos = 3
+num_hilos = 2
+
+# Guardar el mejor modelo de cada prueba en carpeta_barrido/prueba_NN (cada uno ocupa como modelo_entrenado)
+guardar_modelos = False
+carpeta_barrido = 'barrido'
+
+# Combinaciones de hiperparámetros a probar
+def combinaciones():
+    nombres = list(espacio)
+    todas = [dict(zip(nombres, valores)) for valores in itertools.product(*espacio.values())]
+    if modo == 'aleatorio':
+        todas = random.Random(semilla).sample(todas, min(num_pruebas, len(todas)))
+    return todas
+
+# Copiamos los DocBins serializados a memoria compartida, para que cada proceso los lea de ahí
+def compartir_docbin(data_path):
+    docs = load_data(data_path, spacy.blank('es'))
+    datos = DocBin(attrs=["ORTH", "ENT_IOB", "ENT_TYPE"], docs=docs).to_bytes()
+    memoria = shared_memory.SharedMemory(create=True, size=len(datos))
+    memoria.buf[:len(datos)] = datos
+    return memoria, len(datos)
+
+# Datos de cada proceso: los DocBins, leídos de la memoria compartida una sola vez al arrancarlo
+_contexto = {}
+
+def iniciar_proceso(train_compartido, val_compartido):
+    for nombre, (memoria_nombre, longitud) in (('train', train_compartido), ('val', val_compartido)):
+        memoria = shared_memory.SharedMemory(name=memoria_nombre)
+        _contexto[nombre] = DocBin().from_bytes(bytes(memoria.buf[:longitud]))
+        memoria.close()
+
+# ¿Sigue la prueba en este escalón? Se apunta su F1 en el escalón y se compara con los de las demás pruebas
+def sigue_en_escalon(escalon, f1, resultados_escalones, cerrojo):
+    with cerrojo:
+        vistos = resultados_escalones.get(escalon, []) + [f1]
+        resultados_escalones[escalon] = vistos
+    if len(vistos) < eta:
+        return True
+    return f1 >= sorted(vistos, reverse=True)[len(vistos) // eta - 1]
+
+# Una prueba: el mismo entrenamiento que 03_modelo.py con los hiperparámetros de params
+def ejecutar_prueba(numero, params, resultados_escalones, cerrojo):
+    start = time.perf_counter()
+    nlp = modelo.load_base_model()
+    train_data = list(_contexto['train'].get_docs(nlp.vocab))
+    val_data = modelo.stratified_sample(list(_contexto['val'].get_docs(nlp.vocab)), val_muestra)
+    ner = nlp.get_pipe('ner') if 'ner' in nlp.pipe_names else nlp.add_pipe('ner', last=True)
+    for doc in train_data:
+        for ent in doc.ents:
+            ner.add_label(ent.label_)
+
+    optimizer = nlp.create_optimizer()
+    optimizer.learn_rate = params['learn_rate']
+    rng = random.Random(modelo.semilla)
+    saver = ThreadPoolExecutor(max_workers=1)
+    guardado = None
+    best_f1_score = 0.0
+    best_iter = 0
+    no_improvement_counter = 0
+    estado = 'completa'
+
+    for itn in range(n_iter):
+        train_examples = (Example.from_dict(doc, {"entities": [(ent.start_char, ent.end_char, ent.label_) for ent in doc.ents]})
+                          for doc in train_data)
+        batches = modelo.length_batches(train_examples, params['palabras_por_lote'], params['tolerancia_lote'],
+                                        modelo.buffer_lotes, rng)
+        for examples in batches:
+            nlp.update(examples, sgd=optimizer, drop=params['dropout'])
+
+        es_escalon = (itn + 1) in escalones
+        if (itn + 1) % evaluate_every != 0 and not es_escalon:
+            continue
+        current_f1_score = modelo.evaluate_model(nlp, val_data)["ents_f"] or 0.0
+        if current_f1_score > best_f1_score:
+            best_f1_score = current_f1_score
+            best_iter = itn + 1
+            no_improvement_counter = 0
+            if guardar_modelos:
+                # Si falló el guardado anterior, el error sale aquí y no se pierde
+                if guardado is not None:
+                    guardado.result()
+                guardado = modelo.save_in_background(saver, nlp, os.path.join(carpeta_barrido, f"prueba_{numero:02d}"))
+        else:
+            no_improvement_counter += 1
+
+        if no_improvement_counter >= patience:
+            estado = 'early stopping'
+            break
+        if es_escalon and not sigue_en_escalon(itn + 1, best_f1_score, resultados_escalones, cerrojo):
+            estado = f"cortada en {itn + 1}"
+            break
+
+    saver.shutdown(wait=True)
+    if guardado is not None:
+        guardado.result()
+    return {"prueba": numero, **params, "mejor_f1": round(best_f1_score, 4), "mejor_iteracion": best_iter,
+            "iteraciones": itn + 1, "estado": estado, "minutos": round((time.perf_counter() - start) / 60, 1)}
+
+# Tabla comparando las pruebas, de mejor a peor F1
+def mostrar_tabla(resultados):
+    columnas = list(resultados[0])
+    anchos = {c: max(len(c), *(len(str(r[c])) for r in resultados)) for c in columnas}
+    print('  '.join(c.rjust(anchos[c]) for c in columnas))
+    for r in resultados:
+        print('  '.join(str(r[c]).rjust(anchos[c]) for c in columnas))
+
+if __name__ == '__main__':
+    os.makedirs(carpeta_barrido, exist_ok=True)
+    pruebas = combinaciones()
+    print(f"{len(pruebas)} pruebas, {num_procesos} a la vez con {num_hilos} hilos cada una")
+
+    # Los procesos se crean con spawn y heredan estas variables, así numpy y compañía usan num_hilos hilos
+    for variable in ('OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS'):
+        os.environ[variable] = str(num_hilos)
+
+    contexto = multiprocessing.get_context('spawn')
+    train_memoria, train_longitud = compartir_docbin(train_data_path)
+    val_memoria, val_longitud = compartir_docbin(val_data_path)
+    resultados = []
+    try:
+        with contexto.Manager() as manager:
+            resultados_escalones = manager.dict()
+            cerrojo = manager.Lock()
+            with ProcessPoolExecutor(max_workers=num_procesos, mp_context=contexto, initializer=iniciar_proceso,
+                                     initargs=((train_memoria.name, train_longitud), (val_memoria.name, val_longitud))) as executor:
+                futures = [executor.submit(ejecutar_prueba, numero, params, resultados_escalones, cerrojo)
+                           for numero, params in enumerate(pruebas)]
+                for future in as_completed(futures):
+                    resultado = future.result()
+                    resultados.append(resultado)
+                    print(f"Prueba {resultado['prueba']} terminada ({resultado['estado']}): F1 {resultado['mejor_f1']}")
+    finally:
+        for memoria in (train_memoria, val_memoria):
+            memoria.close()
+            memoria.unlink()
+
+    resultados.sort(key=lambda r: -r['mejor_f1'])
+    mostrar_tabla(resultados)
+    with open(os.path.join(carpeta_barrido, 'resultados_barrido.csv'), 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=list(resultados[0]))
+        writer.writeheader()
+        writer.writerows(resultados)
@@ -5,134 +5,320 @@
 # un método genérico que pueda manejar distintos tipos de plantillas de facturas y extraer
 # la información necesaria de manera consistente.
 
+import random
+import time
 import spacy
-from spacy.tokens import DocBin
-from spacy.training import Example
-from sklearn.metrics import classification_report
-from spacy.util import compounding, minibatch
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from spacy.scorer import Scorer
+from spacy import ty
+from spacy.training import Example, validate_examples
+from spacy.util import compounding, load_model_from_config, minibatch
 from spacy.lookups import load_lookups
+from itertools import islice
+from docbins import load_data
+from generacion import json_files
+from instrumentacion import RegistroEntrenamiento
+from lector_flujo import crear_lector_flujo
 
 # Cargar los datos de entrenamiento y validación
 train_data_path = 'train_data.spacy'
 val_data_path = 'val_data.spacy'
 
-# Función para cargar datos binarios...
-# Cargamos los datos de entrenamiento y validación desde archivos binarios de spaCy (DocBin).
-def load_data(data_path, nlp):
-    doc_bin = DocBin().from_disk(data_path)
-    return list(doc_bin.get_docs(nlp.vocab))
-
-# Inicializar spaCy con un modelo preentrenado en español...
-# Usamos 'es_core_news_md' que es un modelo de tamaño medio para probar su eficacia. 
-# Existe también el spacy.load('es_core_news_lg') para modelo grande
-# y también el spacy.load('es_core_news_sm') para un modelo más pequeño.
-nlp = spacy.load('es_core_news_md')
-
-# Eliminar el componente 'matcher' si existe en el pipeline... me ha dado varias veces error 
-# y eliminándolo se soluciona el problema y se ejecuta el modelo.
-if 'matcher' in nlp.pipe_names:
-    nlp.remove_pipe('matcher')
-
-# Cargar las tablas de lemas necesarias para el lematizador...
-# Esto mejora la precisión al normalizar palabras a su forma base.
-lookups = load_lookups(lang="es", tables=["lemma_rules", "lemma_index", "lemma_exc", "lemma_rules_groups"])
-nlp.get_pipe("lemmatizer").initialize(nlp.vocab, lookups=lookups)
-
-# Cargar los datos de entrenamiento y validación...
-train_data = load_data(train_data_path, nlp)
-val_data = load_data(val_data_path, nlp)
-
-# Añadir el componente NER al pipeline si no existe...
-if 'ner' not in nlp.pipe_names:
-    ner = nlp.add_pipe('ner', last=True)
-else:
-    ner = nlp.get_pipe('ner')
-
-# Añadir las etiquetas al componente NER...
-# Aquí añadimos las etiquetas de las entidades que queremos que el modelo reconozca.
-for doc in train_data:
-    for ent in doc.ents:
-        ner.add_label(ent.label_)
-
-# Configurar los parámetros de entrenamiento...
-# Ajustamos la tasa de aprendizaje para mejorar la convergencia del modelo.
-optimizer = nlp.create_optimizer()
-optimizer.learn_rate = 0.0005 # He probado con varias... con 0.001, con 0.0001... 
+# Entrenar con el flujo infinito de documentos generados según se piden (ver flujo.py y lector_flujo.py)
+# en vez de con train_data.spacy. Cada iteración usa docs_por_iteracion documentos nuevos.
+# La validación sigue siendo val_data.spacy (o la carpeta val de 011_generacion_docbin.py, con la misma semilla).
+usar_flujo = False
+plantillas_dir = "C:/Users/34670/Desktop/python/Hack a boss/proyecto_decide/libretas/plantillas/"
+json_dir = "C:/Users/34670/Desktop/python/Hack a boss/proyecto_decide/libretas/json_categoria/"
+semilla = 42
+docs_por_iteracion = 16000
+num_workers_flujo = 2
+
+# Evaluación...
+# Los documentos de validación se pasan por nlp.pipe en lotes de eval_batch_size (y en eval_n_process procesos si es > 1).
+# Con val_muestra se evalúa cada iteración sobre una muestra fija de ese tamaño, estratificada por las etiquetas
+# que tiene cada documento; la evaluación final es siempre sobre toda la validación. None para usar siempre todo.
+eval_batch_size = 64
+eval_n_process = 1
+val_muestra = None
+
+# Lotes de entrenamiento...
+# Con lotes_por_palabras los documentos se agrupan por longitud parecida y cada lote lleva unas palabras_por_lote
+# palabras (hasta un tolerancia_lote más para no partir mal un lote), en vez de un número de documentos que va
+# creciendo (compounding). Las facturas generadas tienen longitudes muy distintas y con lotes por número de documentos
+# salían lotes muy pequeños o con un documento largo que se comía todo el lote; así la memoria y el tiempo por
+# lote son más estables. Se ordenan por longitud los documentos de cada tanda de buffer_lotes y se barajan los lotes.
+lotes_por_palabras = True
+palabras_por_lote = 2000
+tolerancia_lote = 0.2
+buffer_lotes = 1000
+
+# Carpeta del registro del entrenamiento (ver instrumentacion.py): por cada iteración, palabras por segundo, tiempo de
+# cada componente, memoria máxima, tiempo de evaluación y tiempo restante. Se resume con 13_resumen_entrenamiento.py.
+logs_dir = 'logs'
+
+# Muestra fija de validación, estratificada por el conjunto de etiquetas de cada documento (que depende sobre todo
+# de la plantilla): de cada grupo se coge la misma proporción, así la muestra tiene de todo.
+def stratified_sample(docs, size, seed=42):
+    if size is None or size >= len(docs):
+        return docs
+    groups = defaultdict(list)
+    for doc in docs:
+        groups[tuple(sorted({ent.label_ for ent in doc.ents}))].append(doc)
+    rng = random.Random(seed)
+    sample = []
+    for key in sorted(groups):
+        group = groups[key]
+        sample.extend(rng.sample(group, max(1, round(size * len(group) / len(docs)))))
+    return sample
 
 # Función para evaluar el modelo...
 # Esta función evalúa la precisión del modelo comparando las entidades predichas con las reales.
 # Esto es importante porque bueno, una de las veces estuve más de 4 horas esperando que el modelo terminara
 # de entrenar y luego dio error en las métricas. 
-def evaluate_model(nlp, data):
-    y_true = []
-    y_pred = []
-    labels = list(nlp.get_pipe("ner").labels)
-    for doc in data:
-        gold_entities = [(ent.start_char, ent.end_char, ent.label_) for ent in doc.ents]
-        pred_doc = nlp(doc.text)
-        pred_entities = [(ent.start_char, ent.end_char, ent.label_) for ent in pred_doc.ents]
-        
-        y_true.extend([label for _, _, label in gold_entities])
-        y_pred.extend([label for _, _, label in pred_entities])
-    
-    # Asegurar que y_true y y_pred tengan la misma longitud ¡Importante!
-    min_length = min(len(y_true), len(y_pred))
-    y_true = y_true[:min_length]
-    y_pred = y_pred[:min_length]
-
-    report = classification_report(y_true, y_pred, labels=labels, zero_division=0)
-    return report
-
-# Entrenar el modelo...
-# Aumentamos el número de iteraciones para asegurar una mejor convergencia. He probado con 10, 20... 100... 
-n_iter = 50
-# El evaluate_every en 1 lo he puesto para saber rápidamente si las evaluaciones las hacía bien y que no hubiese ningún error.
-# Quizás es más interesante poner 10 psi vas a hacer 50 iteraciones para ir viendo la evaluación o 5 si haces 20 iteraciones...
-evaluate_every = 1 
-best_f1_score = 0.0
-patience = 8 # esto es para que el modelo se detenga si no mejora... así no hay que esperar hasta 50 si ya en el 30 ve que no mejora
-no_improvement_counter = 0
-
-for itn in range(n_iter):
-    losses = {}
-    # Ajustamos el tamaño del batch para mejorar el rendimiento del entrenamiento.
-    batches = minibatch(train_data, size=compounding(4.0, 32.0, 1.001))
-    for batch in batches:
-        examples = []
-        for doc in batch:
-            example = Example.from_dict(doc, {"entities": [(ent.start_char, ent.end_char, ent.label_) for ent in doc.ents]})
-            examples.append(example)
-        # Ajustamos el dropout para prevenir sobreajuste. Igual, he probado con 0.3, 0.5... 
-        nlp.update(examples, sgd=optimizer, drop=0.4, losses=losses)
-    
-    print(f"Iteración {itn + 1}, Pérdidas: {losses}")
-
-    # Evaluar el modelo cada iteración...
-    report = evaluate_model(nlp, val_data)
-    print(f"Reporte de clasificación para la iteración {itn + 1}:\n{report}")
-    
-    # Medir F1-score y comparar con el mejor
-    lines = report.split('\n')
-    avg_line = [line for line in lines if 'avg' in line.lower()][0]
-    current_f1_score = float(avg_line.split()[-2])
-    if current_f1_score > best_f1_score:
-        best_f1_score = current_f1_score
-        no_improvement_counter = 0
-        # Guardar el mejor modelo
-        nlp.to_disk('best_model')
+# Los textos se procesan por lotes con nlp.pipe, solo con el NER (y el tok2vec, por si el NER lo usa), y las
+# métricas salen del Scorer de spaCy: precisión, recall y F1 globales y por etiqueta, como números.
+def evaluate_model(nlp, data, batch_size=64, n_process=1):
+    disable = [name for name in nlp.pipe_names if name not in ('tok2vec', 'ner')]
+    preds = nlp.pipe((doc.text for doc in data), batch_size=batch_size, n_process=n_process, disable=disable)
+    examples = [Example(pred, doc) for pred, doc in zip(preds, data)]
+    return Scorer.score_spans(examples, "ents")
+
+# Reporte con las métricas de evaluate_model, una línea por etiqueta y la media al final
+def format_report(scores):
+    lines = [f"{'':>28}{'precision':>10}{'recall':>10}{'f1-score':>10}"]
+    for label, prf in sorted(scores["ents_per_type"].items()):
+        lines.append(f"{label:>28}{prf['p']:>10.2f}{prf['r']:>10.2f}{prf['f']:>10.2f}")
+    # Sin ninguna entidad (ni real ni predicha) el Scorer no da métricas globales
+    p, r, f = (scores[f"ents_{key}"] or 0.0 for key in 'prf')
+    lines.append(f"{'micro avg':>28}{p:>10.2f}{r:>10.2f}{f:>10.2f}")
+    return '\n'.join(lines)
+
+# Lotes de documentos de longitud parecida con unas max_words palabras cada uno...
+# Se llena un buffer con buffer_size ejemplos, se ordena por número de palabras (con desempate al azar, para que
+# los lotes no sean siempre los mismos) y se va cortando en lotes: un lote se cierra al llegar a max_words palabras o
+# si el siguiente documento lo pasaría de max_words * (1 + tolerance). Un documento más largo que eso va solo en su lote.
+# Los lotes de cada buffer salen barajados, para que el modelo no vea siempre los cortos primero.
+def length_batches(examples, max_words, tolerance=0.2, buffer_size=1000, rng=random):
+    limit = max_words * (1 + tolerance)
+
+    def split(buffer):
+        buffer.sort(key=lambda eg: (len(eg.reference), rng.random()))
+        batches, batch, words = [], [], 0
+        for eg in buffer:
+            if batch and (words >= max_words or words + len(eg.reference) > limit):
+                batches.append(batch)
+                batch, words = [], 0
+            batch.append(eg)
+            words += len(eg.reference)
+        if batch:
+            batches.append(batch)
+        rng.shuffle(batches)
+        return batches
+
+    buffer = []
+    for eg in examples:
+        buffer.append(eg)
+        if len(buffer) == buffer_size:
+            yield from split(buffer)
+            buffer = []
+    if buffer:
+        yield from split(buffer)
+
+# Estadísticas de los lotes de una iteración: cuántos, palabras por lote (media y desequilibrio, la desviación
+# típica entre la media) y relleno, las palabras que sobrarían si cada documento se rellenase hasta el más largo
+# de su lote, que es lo que pasa dentro de los modelos al procesar el lote junto.
+def batch_stats(lengths):
+    sizes = [sum(batch) for batch in lengths]
+    if not sizes:
+        return {"lotes": 0, "palabras_lote": 0.0, "desequilibrio": 0.0, "relleno": 0.0}
+    mean = sum(sizes) / len(sizes)
+    std = (sum((size - mean) ** 2 for size in sizes) / len(sizes)) ** 0.5
+    padded = sum(max(batch) * len(batch) for batch in lengths)
+    return {"lotes": len(sizes), "palabras_lote": round(mean, 1), "desequilibrio": round(std / mean, 3),
+            "relleno": round(1 - sum(sizes) / padded, 3)}
+
+# Lo mismo que nlp.update, pero midiendo cuánto tarda cada componente (su update y su finish_update)...
+# nlp.update no deja medirlo por separado. tiempos es un defaultdict(float) que va sumando los segundos de cada
+# componente. Si un componente escucha al tok2vec (listener), el tiempo de pasar el gradiente hacia el tok2vec
+# cuenta en ese componente. Como nlp.update, valida y copia los ejemplos y deja las pérdidas como floats de Python;
+# lo que no se copia es lo que aquí no se usa: exclude, component_cfg y annotating_components
+# (el drop es el mismo para todos los componentes y ninguno anota durante el entrenamiento).
+def actualizar_por_componente(nlp, examples, sgd, drop, losses, tiempos):
+    if isinstance(examples, list) and len(examples) == 0:
+        return losses
+    validate_examples(examples, "actualizar_por_componente")
+    examples = [eg.copy() for eg in examples]
+    for name, proc in nlp.pipeline:
+        inicio = time.perf_counter()
+        if hasattr(proc, 'update'):
+            proc.update(examples, sgd=None, losses=losses, drop=drop)
+        if isinstance(proc, ty.TrainableComponent) and proc.is_trainable and proc.model not in (True, False, None):
+            proc.finish_update(sgd)
+        tiempos[name] += time.perf_counter() - inicio
+    for name in losses:
+        losses[name] = float(losses[name])
+    return losses
+
+# Guardar el modelo sin parar el entrenamiento...
+# El modelo se copia en memoria (to_bytes) en este hilo, para guardar justo el de esta iteración aunque el
+# entrenamiento siga cambiándolo, y se reconstruye y escribe en disco en un hilo aparte.
+# Devuelve el future del guardado: hay que llamar a su result() para que, si falla, el error no se pierda.
+def save_in_background(executor, nlp, path):
+    config = nlp.config
+    data = nlp.to_bytes()
+
+    def save():
+        copy = load_model_from_config(config, auto_fill=False)
+        copy.from_bytes(data)
+        copy.to_disk(path)
+
+    return executor.submit(save)
+
+# Modelo de partida...
+# También lo usa 032_barrido_hiperparametros.py, para que cada prueba empiece igual que este entrenamiento.
+def load_base_model():
+    # Inicializar spaCy con un modelo preentrenado en español...
+    # Usamos 'es_core_news_md' que es un modelo de tamaño medio para probar su eficacia. 
+    # Existe también el spacy.load('es_core_news_lg') para modelo grande
+    # y también el spacy.load('es_core_news_sm') para un modelo más pequeño.
+    nlp = spacy.load('es_core_news_md')
+
+    # Eliminar el componente 'matcher' si existe en el pipeline... me ha dado varias veces error 
+    # y eliminándolo se soluciona el problema y se ejecuta el modelo.
+    if 'matcher' in nlp.pipe_names:
+        nlp.remove_pipe('matcher')
+
+    # Cargar las tablas de lemas necesarias para el lematizador...
+    # Esto mejora la precisión al normalizar palabras a su forma base.
+    lookups = load_lookups(lang="es", tables=["lemma_rules", "lemma_index", "lemma_exc", "lemma_rules_groups"])
+    nlp.get_pipe("lemmatizer").initialize(nlp.vocab, lookups=lookups)
+    return nlp
+
+# Va protegido con __main__ porque, si se entrena con el flujo, en Windows cada proceso en segundo plano
+# vuelve a importar este script.
+if __name__ == '__main__':
+    nlp = load_base_model()
+
+    # Cargar los datos de entrenamiento y validación...
+    # Con el flujo no hay datos de entrenamiento en disco: los documentos se generan en segundo plano según se piden.
+    if usar_flujo:
+        lector = crear_lector_flujo(plantillas_dir, json_dir, semilla=semilla, num_workers=num_workers_flujo)
+        flujo_train = lector(nlp)
+    else:
+        train_data = load_data(train_data_path, nlp)
+    val_data = load_data(val_data_path, nlp)
+    val_sample = stratified_sample(val_data, val_muestra)
+
+    # Añadir el componente NER al pipeline si no existe...
+    if 'ner' not in nlp.pipe_names:
+        ner = nlp.add_pipe('ner', last=True)
     else:
-        no_improvement_counter += 1
-    
-    if no_improvement_counter >= patience:
-        print("Early stopping debido a la falta de mejora en el rendimiento.")
-        break
-
-# Guardar el modelo entrenado final
-output_dir = 'modelo_entrenado'
-nlp.to_disk(output_dir)
-print(f"Modelo guardado en '{output_dir}'")
-
-# Evaluar el modelo final
-nlp_trained = spacy.load(output_dir)
-final_report = evaluate_model(nlp_trained, val_data)
-print(f"Reporte de clasificación final:\n{final_report}")
+        ner = nlp.get_pipe('ner')
+
+    # Añadir las etiquetas al componente NER...
+    # Aquí añadimos las etiquetas de las entidades que queremos que el modelo reconozca.
+    # Con el flujo son las etiquetas de los placeholders de las plantillas.
+    if usar_flujo:
+        for label in json_files.values():
+            ner.add_label(label)
+    else:
+        for doc in train_data:
+            for ent in doc.ents:
+                ner.add_label(ent.label_)
+
+    # Configurar los parámetros de entrenamiento...
+    # Ajustamos la tasa de aprendizaje para mejorar la convergencia del modelo.
+    optimizer = nlp.create_optimizer()
+    optimizer.learn_rate = 0.0005 # He probado con varias... con 0.001, con 0.0001... 
+
+    # Entrenar el modelo...
+    # Aumentamos el número de iteraciones para asegurar una mejor convergencia. He probado con 10, 20... 100... 
+    n_iter = 50
+    # El evaluate_every en 1 lo he puesto para saber rápidamente si las evaluaciones las hacía bien y que no hubiese ningún error.
+    # Quizás es más interesante poner 10 psi vas a hacer 50 iteraciones para ir viendo la evaluación o 5 si haces 20 iteraciones...
+    evaluate_every = 1 
+    best_f1_score = 0.0
+    patience = 8 # esto es para que el modelo se detenga si no mejora... así no hay que esperar hasta 50 si ya en el 30 ve que no mejora
+    no_improvement_counter = 0
+    saver = ThreadPoolExecutor(max_workers=1)
+    guardado = None
+    registro = RegistroEntrenamiento(logs_dir, 'spacy', 'palabras', total=n_iter,
+                                     config={"usar_flujo": usar_flujo, "learn_rate": optimizer.learn_rate, "drop": 0.4,
+                                             "pipeline": nlp.pipe_names, "val_docs": len(val_sample),
+                                             "palabras_por_lote": palabras_por_lote if lotes_por_palabras else None})
+    rng = random.Random(semilla)
+
+    for itn in range(n_iter):
+        losses = {}
+        tiempos = defaultdict(float)
+        palabras = 0
+        lengths = []
+        start = time.perf_counter()
+        # Con el flujo, cada iteración coge los siguientes docs_por_iteracion ejemplos (ya vienen como Example).
+        if usar_flujo:
+            train_examples = islice(flujo_train, docs_por_iteracion)
+        else:
+            train_examples = (Example.from_dict(doc, {"entities": [(ent.start_char, ent.end_char, ent.label_) for ent in doc.ents]})
+                              for doc in train_data)
+        # Ajustamos el tamaño del batch para mejorar el rendimiento del entrenamiento.
+        if lotes_por_palabras:
+            batches = length_batches(train_examples, palabras_por_lote, tolerancia_lote, buffer_lotes, rng)
+        else:
+            batches = minibatch(train_examples, size=compounding(4.0, 32.0, 1.001))
+        for examples in batches:
+            lengths.append([len(eg.reference) for eg in examples])
+            palabras += sum(lengths[-1])
+            # Ajustamos el dropout para prevenir sobreajuste. Igual, he probado con 0.3, 0.5... 
+            # (es lo mismo que nlp.update, pero midiendo el tiempo de cada componente)
+            actualizar_por_componente(nlp, examples, optimizer, 0.4, losses, tiempos)
+        duracion = time.perf_counter() - start
+        stats = batch_stats(lengths)
+
+        print(f"Iteración {itn + 1}, Pérdidas: {losses}, {palabras / duracion:.0f} palabras/s")
+        print(f"Lotes: {stats['lotes']}, {stats['palabras_lote']:.0f} palabras por lote (desequilibrio {stats['desequilibrio']:.0%}), "
+              f"relleno {stats['relleno']:.0%}")
+
+        # Evaluar el modelo cada evaluate_every iteraciones...
+        if (itn + 1) % evaluate_every != 0:
+            registro.apuntar(itn + 1, palabras, duracion, tiempos, losses, **stats)
+            continue
+        start = time.perf_counter()
+        scores = evaluate_model(nlp, val_sample, eval_batch_size, eval_n_process)
+        datos = registro.apuntar(itn + 1, palabras, duracion, tiempos, losses, evaluacion_s=time.perf_counter() - start,
+                                 metricas={key: scores[key] for key in ("ents_p", "ents_r", "ents_f")}, **stats)
+        print(f"Reporte de clasificación para la iteración {itn + 1}:\n{format_report(scores)}")
+        print(f"Memoria máxima: {datos['rss_pico_mb']:.0f} MB, tiempo restante como mucho: {datos['restante_s'] / 60:.0f} min")
+
+        # Medir F1-score y comparar con el mejor
+        current_f1_score = scores["ents_f"] or 0.0
+        if current_f1_score > best_f1_score:
+            best_f1_score = current_f1_score
+            no_improvement_counter = 0
+            # Guardar el mejor modelo (en segundo plano). Antes comprobamos que el anterior se guardó bien.
+            if guardado is not None:
+                guardado.result()
+            guardado = save_in_background(saver, nlp, 'best_model')
+        else:
+            no_improvement_counter += 1
+
+        if no_improvement_counter >= patience:
+            print("Early stopping debido a la falta de mejora en el rendimiento.")
+            break
+
+    # Esperar a que termine de guardarse el mejor modelo (si falló, el error sale aquí)
+    saver.shutdown(wait=True)
+    if guardado is not None:
+        guardado.result()
+    registro.cerrar()
+
+    # Guardar el modelo entrenado final
+    output_dir = 'modelo_entrenado'
+    nlp.to_disk(output_dir)
+    print(f"Modelo guardado en '{output_dir}'")
+
+    # Evaluar el modelo final
+    nlp_trained = spacy.load(output_dir)
+    final_scores = evaluate_model(nlp_trained, val_data, eval_batch_size, eval_n_process)
+    print(f"Reporte de clasificación final:\n{format_report(final_scores)}")
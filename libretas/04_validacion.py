@@ -3,14 +3,8 @@
 # Cargará el modelo que ya hemos entrenado y los datos de validación para evaluar el rendimiento del modelo.
 
 import spacy
-from spacy.tokens import DocBin
 from sklearn.metrics import classification_report
-
-# Función para cargar datos binarios...
-# Cargamos los datos de validación desde un archivo binario de spaCy (DocBin).
-def load_data(data_path, nlp):
-    doc_bin = DocBin().from_disk(data_path)
-    return list(doc_bin.get_docs(nlp.vocab))
+from docbins import load_data
 
 # Inicializar spaCy y cargar el modelo entrenado...
 # Asegúrate de que el directorio 'modelo_entrenado' contenga tu modelo entrenado.
@@ -3,88 +3,103 @@
 # Una vez entrenado el modelo y confirmado que reconoce las entidades correctamente,
 # procedemos con la extracción de los datos de las facturas originales.
 # Vamos a utilizar la librería fitz (PyMuPDF) que parece dar buen rendimiento...
+# Como hay que pasar miles de facturas, se pueden repartir los PDFs entre varios procesos
+# (modo paralelo), cada uno abriendo sus propios documentos con fitz.
+# Las funciones de extracción y limpieza están en extraccion.py.
 
-import fitz  # PyMuPDF
 import os
-import re
-from dateutil.parser import parse, ParserError
+import time
+from itertools import repeat
+from concurrent.futures import ProcessPoolExecutor
+import fechas
+from almacen_textos import AlmacenTextos, clave_pdf, version_reglas
+from extraccion import clean_text, motor_limpieza, normalize_dates, procesar_referencia
+from limpieza import MotorLimpieza
+from fuentes import leer_bytes, recorrer
 
-# Función para extraer texto de un PDF usando PyMuPDF (fitz)
-# Abrimos el PDF y extraemos el texto de cada página.
-def extract_text_from_pdf(pdf_path):
-    doc = fitz.open(pdf_path)
-    text = ''
-    for page_num in range(len(doc)):
-        page = doc.load_page(page_num)
-        text += page.get_text("text")
-    return text
+# Ruta a la carpeta de los PDFs y la carpeta de salida para los textos extraídos.
+# pdf_folder también puede ser un .zip (por ejemplo training.zip) o una lista de carpetas y zips:
+# los PDFs se leen directamente del zip sin descomprimirlo (ver fuentes.py).
+pdf_folder = 'C:/Users/34670/Desktop/python/Hack a boss/proyecto_decide/training'
+output_folder = 'C:/Users/34670/Desktop/python/Hack a boss/proyecto_decide/libretas/facturas'
+# Almacén empaquetado con todos los textos limpios (ver almacen_textos.py). Hace también de caché:
+# las facturas cuyo PDF y reglas de limpieza no han cambiado no se vuelven a extraer.
+almacen_path = 'C:/Users/34670/Desktop/python/Hack a boss/proyecto_decide/libretas/facturas.pack'
+# Si se pone a True se siguen escribiendo también los factura_N.txt en output_folder, como antes.
+guardar_txt = False
 
-# Función para normalizar fechas
-def normalize_dates(text):
-    # Expresión regular para encontrar fechas en varios formatos
-    date_patterns = [
-        (r'\b(\d{1,2})[\/\-\.](\d{1,2})[\/\-\.](\d{2,4})\b', "%d/%m/%Y"),  # Formatos: 15/09/2024, 15-01-21, 15.01.21
-        (r'\b(\d{2,4})[\/\-\.](\d{1,2})[\/\-\.](\d{1,2})\b', "%d/%m/%Y"),  # Formato: 2024/09/17, 2024-09-17, 2024.09.17
-        (r'\b(\d{8})\b', "%d/%m/%Y"),                                      # Formato: 27092018
-        (r'\b(\d{1,2})\s+de\s+(\w+)\s+de\s+(\d{4})\b', "%d/%m/%Y")         # Formato: 2 de octubre de 1991
-    ]
+# Librería para sacar el texto de los PDFs: 'fitz', 'pdfminer', 'pdfplumber' o 'pypdfium2' (ver extraccion.py)
+backend = 'fitz'
 
-    def replace_date(match, date_format):
-        date_str = match.group()
-        try:
-            # Parse the date and format it as dd/mm/yyyy
-            parsed_date = parse(date_str, dayfirst=True)
-            return parsed_date.strftime(date_format)
-        except (ParserError, ValueError):
-            return date_str
+# Número de procesos para la extracción. Con 1 se procesa secuencialmente como antes,
+# con os.cpu_count() se aprovechan todos los núcleos de la máquina.
+num_workers = os.cpu_count() or 1
+# Cuántos PDFs se le mandan de golpe a cada proceso, para no pagar la comunicación factura a factura.
+chunksize = 16
 
-    for pattern, date_format in date_patterns:
-        text = re.sub(pattern, lambda match: replace_date(match, date_format), text, flags=re.IGNORECASE)
+# El bloque principal va protegido con __main__ porque en Windows cada proceso del pool
+# vuelve a importar este script, y no queremos que relance el procesamiento.
+if __name__ == '__main__':
+    if guardar_txt:
+        os.makedirs(output_folder, exist_ok=True)
 
-    return text
+    almacen = AlmacenTextos(almacen_path)
+    # La librería de PDF también forma parte de la clave: cada una saca un texto distinto
+    version = f"{version_reglas(clean_text, normalize_dates, fechas, MotorLimpieza, motor_limpieza)}-{backend}"
 
-# Función para limpiar el texto
-# Aplicamos varias reglas de limpieza para preparar el texto extraído.
-def clean_text(text):
-    text = re.sub(r'http\S+|www\.\S+', '', text)  # Eliminar URLs
-    text = re.sub(r'\.{2,}', '.', text)  # Eliminar secuencias repetidas de puntos
-    text = re.sub(r'\s+', ' ', text).strip()  # Eliminar secuencias repetidas de espacios
-    text = re.sub(r'\bx,xx\b', '', text)  # Eliminar valores placeholder x,xx
-    text = re.sub(r'\bpágina \d+\b', '', text)  # Eliminar números de página
-    text = re.sub(r'(?<=\s)[\.\,](?=\s)', '', text)  # Eliminar puntos y comas solitarios
-    text = re.sub(r'[^\w\s.,€|-]', '', text)  # Eliminar caracteres no deseados, mantener números, letras, puntos, comas, € y guiones, y el símbolo |
-    return text
+    # Revisamos qué PDFs hay que procesar. Los que ya están en el almacén con la misma clave se saltan,
+    # y los PDFs repetidos (mismo contenido) solo se extraen una vez.
+    pendientes = {}  # clave -> (referencia del PDF, [nombres de factura con ese PDF])
+    enlazados = []
+    saltados = 0
+    for pdf_file, referencia in recorrer(pdf_folder, '.pdf'):
+        nombre = pdf_file[:-len('.pdf')]
+        clave = clave_pdf(leer_bytes(referencia), version)
 
-# Ruta a la carpeta de los PDFs y la carpeta de salida para los textos extraídos
-pdf_folder = 'C:/Users/34670/Desktop/python/Hack a boss/proyecto_decide/training'
-output_folder = 'C:/Users/34670/Desktop/python/Hack a boss/proyecto_decide/libretas/facturas'
-os.makedirs(output_folder, exist_ok=True)
+        if almacen.vigente(nombre, clave):
+            saltados += 1
+        elif clave in almacen.claves:
+            almacen.guardar(nombre, clave)
+            enlazados.append(nombre)
+        elif clave in pendientes:
+            pendientes[clave][1].append(nombre)
+        else:
+            pendientes[clave] = (referencia, [nombre])
+
+    claves = list(pendientes)
+    referencias = [pendientes[clave][0] for clave in claves]
+
+    inicio = time.perf_counter()
+    with almacen:
+        if num_workers > 1 and len(referencias) > 1:
+            executor = ProcessPoolExecutor(max_workers=num_workers)
+            resultados = executor.map(procesar_referencia, referencias, repeat(backend), chunksize=chunksize)
+        else:
+            executor = None
+            resultados = map(procesar_referencia, referencias, repeat(backend))
 
-# Procesar todos los PDFs en la carpeta
-# Iteramos sobre todos los archivos PDF en la carpeta especificada.
-for pdf_file in os.listdir(pdf_folder):
-    if not pdf_file.endswith('.pdf'):
-        continue
+        actualizados = list(enlazados)
+        for clave, text in zip(claves, resultados):
+            for nombre in pendientes[clave][1]:
+                almacen.guardar(nombre, clave, text)
+                actualizados.append(nombre)
+                print(f"Texto extraído y limpiado de '{nombre}.pdf' guardado en '{almacen_path}'")
+        if executor is not None:
+            executor.shutdown()
 
-    pdf_path = os.path.join(pdf_folder, pdf_file)
-    
-    # 1. Extraer texto del PDF
-    text = extract_text_from_pdf(pdf_path)
-    
-    # 2. Reemplazar saltos de línea con el símbolo |
-    text = text.replace('\n', ' | ')
-    
-    # 3. Limpiar el texto
-    text = clean_text(text)
-    
-    # 4. Normalizar las fechas en el texto
-    text = normalize_dates(text)
-    
-    # Guardar el texto limpiado en un archivo
-    output_file = os.path.join(output_folder, pdf_file.replace('.pdf', '.txt'))
-    with open(output_file, 'w', encoding='utf-8') as f:
-        f.write(text)
-    
-    print(f"Texto extraído y limpiado de '{pdf_file}' guardado en '{output_file}'")
+    # Guardar el texto limpiado en un archivo por factura, si se quiere mantener el formato antiguo
+    if guardar_txt:
+        actualizados = set(actualizados)
+        for nombre in almacen.nombres():
+            output_file = os.path.join(output_folder, f"{nombre}.txt")
+            if nombre in actualizados or not os.path.exists(output_file):
+                with open(output_file, 'w', encoding='utf-8') as f:
+                    f.write(almacen.leer(nombre))
+        almacen.cerrar()
+    duracion = time.perf_counter() - inicio
 
-print("Procesamiento completado.")
\ No newline at end of file
+    print("Procesamiento completado.")
+    print(f"Facturas sin cambios (caché): {saltados}, duplicadas: {len(actualizados) - len(referencias)}, extraídas: {len(referencias)}")
+    # Rendimiento: documentos por segundo, para comparar entre número de procesos.
+    if duracion > 0 and referencias:
+        print(f"{len(referencias)} documentos en {duracion:.2f} s ({len(referencias) / duracion:.2f} docs/s, {num_workers} procesos)")
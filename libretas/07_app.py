@@ -2,199 +2,161 @@
 # Este será el archivo principal que configuraremos para realizar toda la operación de extracción de datos de las facturas.
 # Utilizaremos este script para cargar el modelo entrenado de spaCy, aplicar el modelo a las facturas originales extraídas,
 # detectar patrones específicos en el texto, y guardar los resultados en archivos JSON.
+# Las funciones de extracción de entidades y los patrones están en entidades.py.
+# Para muchas facturas (1.000, 100.000...) el trabajo se reparte en num_workers procesos, cada uno con su propio
+# modelo cargado, por lotes de facturas_por_lote facturas. Los resultados se escriben en el mismo orden en que se
+# leen las facturas, sea cual sea el número de procesos, y se va mostrando el progreso con facturas/s y tiempo restante.
+# Uso: python 07_app.py [--input carpeta] [--output carpeta] [--almacen facturas.pack] [--workers N] [--lote B]
 
 import spacy
 import os
+import sys
 import json
-import re
-from dateutil.parser import parse, ParserError
+import time
+import argparse
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from almacen_textos import AlmacenTextos
+from entidades import elegir_modelo, extract_entities_batch
 
-# Ruta del modelo entrenado
-model_path = 'modelo_entrenado'
-
-# Cargar el modelo entrenado
-nlp = spacy.load(model_path)
+# Ruta del modelo entrenado. Con None se usa el modelo ligero solo con el NER (031_exportacion_ner.py) si se ha
+# exportado después del último entrenamiento, y si no modelo_entrenado (ver elegir_modelo en entidades.py).
+model_path = None
 
 # Directorios
 input_dir = 'C:/Users/34670/Desktop/python/Hack a boss/proyecto_decide/libretas/facturas/'
 output_dir = 'C:/Users/34670/Desktop/python/Hack a boss/proyecto_decide/libretas/validaciones/'
-
-# Asegurarse de que el directorio de salida existe
-os.makedirs(output_dir, exist_ok=True)
-
-# Categorías de entidades
-# Estas son las etiquetas que el modelo debe reconocer y extraer del texto de las facturas
-categories = [
-    "nombre_cliente", "dni_cliente", "calle_cliente", "cp_cliente", "población_cliente",
-    "provincia_cliente", "nombre_comercializadora", "cif_comercializadora", "dirección_comercializadora",
-    "cp_comercializadora", "población_comercializadora", "provincia_comercializadora", "número_factura",
-    "inicio_periodo", "fin_periodo", "importe_factura", "fecha_cargo", "consumo_periodo", "potencia_contratada"
-]
-
-# Para facilitar la ayuda al modelo, podemos de alguna forma "seleccionar" que datos extraer de los textos
-# que sean más reconocibles mediante expresiones regulares u otras. 
-# Lista de provincias españolas con sus variaciones
-provincias_espanolas = [
-    "Álava", "Araba", "Albacete", "Alicante", "Alacant", "Almería", "Asturias", "Ávila", "Badajoz", 
-    "Baleares", "Illes Balears", "Barcelona", "Burgos", "Cáceres", "Cádiz", "Cantabria", "Castellón", 
-    "Castelló", "Ciudad Real", "Córdoba", "Cuenca", "Gerona", "Girona", "Granada", "Guadalajara", 
-    "Guipúzcoa", "Gipuzkoa", "Huelva", "Huesca", "Jaén", "La Coruña", "A Coruña", "La Rioja", "Las Palmas",
-    "León", "Lleida", "Lugo", "Madrid", "Málaga", "Murcia", "Navarra", "Nafarroa", "Orense", "Ourense", 
-    "Palencia", "Pontevedra", "Salamanca", "Santa Cruz de Tenerife", "Segovia", "Sevilla", "Soria", 
-    "Tarragona", "Teruel", "Toledo", "Valencia", "Valladolid", "Vizcaya", "Bizkaia", "Zamora", "Zaragoza"
-]
-
-# Funciones para detectar patrones en el texto
-def detect_dni(text):
-    match = re.search(r'\b\d{8}[A-Z]\b', text, re.IGNORECASE)
-    return match.group() if match else ""
-
-def detect_cp(text):
-    match = re.search(r'\b\d{5}\b', text)
-    return match.group() if match else ""
-
-def detect_nombre_cliente(text):
-    # Eliminar ocurrencias de NIF y DNI antes de buscar el nombre
-    text = re.sub(r'\bNIF\s*\d{8}[A-Z]\b', '', text, flags=re.IGNORECASE)
-    text = re.sub(r'\bDNI\s*\d{8}[A-Z]\b', '', text, flags=re.IGNORECASE)
-    # Expresión regular para nombres españoles con soporte para mayúsculas, minúsculas y acentos, y sin números ni caracteres no válidos
-    pattern = r'\b[A-ZÁÉÍÓÚÑ][a-záéíóúñ]+ [A-ZÁÉÍÓÚÑ][a-záéíóúñ]+ [A-ZÁÉÍÓÚÑ][a-záéíóúñ]+\b|\b[A-ZÁÉÍÓÚÑ][a-záéíóúñ]+ [a-záéíóúñ]+ [A-ZÁÉÍÓÚÑáéíóúñ]+\b'
-    matches = re.findall(pattern, text)
-    for match in matches:
-        if not re.search(r'\d', match):
-            # Verificar que no haya letras sueltas separadas por espacios, puntos o comas
-            if not re.search(r'([A-Za-zÁÉÍÓÚÑáéíóúñ]\s{1}[A-Za-zÁÉÍÓÚÑáéíóúñ])|([A-Za-zÁÉÍÓÚÑáéíóúñ]\.{1}[A-Za-zÁÉÍÓÚÑáéíóúñ])|([A-Za-zÁÉÍÓÚÑáéíóúñ],{1}[A-Za-zÁÉÍÓÚÑáéíóúñ])', match):
-                return match
-    return ""
-
-# Aquí para ayudar a detectar las provincias
-def detect_provincia(text):
-    for provincia in provincias_espanolas:
-        if re.search(r'\b' + re.escape(provincia.lower()) + r'\b', text.lower()):
-            return provincia
-    return ""
-
-# Aquí introducimos el patrón que siguen más o menos las facturas
-def detect_numero_factura(text):
-    match = re.search(r'\b[A-Z0-9]{10,13}\b', text, re.IGNORECASE)
-    return match.group() if match else ""
-
-# Aquí para la potencia contratada
-def detect_potencia(text):
-    match = re.search(r'\b\d{1,2},\d{3}\b', text)
-    return match.group() if match else ""
-
-# Esto es para el importe de las facturas...
-def detect_importe(text):
-    match = re.search(r'\b\d{1,3},\d{2}\b', text)
-    return match.group() if match else ""
-
-# Aquí para detectar fechas
-def detect_fecha(text):
+# Almacén empaquetado que genera 06_extraccion_pdf.py. Si existe leemos las facturas de ahí,
+# si no, se leen los archivos sueltos de input_dir como siempre. Si se pasa --input (y no --almacen),
+# se leen los archivos de esa carpeta aunque exista el almacén.
+almacen_path = 'C:/Users/34670/Desktop/python/Hack a boss/proyecto_decide/libretas/facturas.pack'
+
+# Procesos (con 1 se hace todo en el proceso principal), facturas por lote y lotes en vuelo por proceso
+num_workers = os.cpu_count() or 1
+facturas_por_lote = 32
+lotes_por_worker = 2
+
+# Función para recorrer las facturas a procesar...
+# Devuelve el número de facturas y un generador de pares (nombre, texto), sacando el texto del almacén
+# empaquetado o de los archivos de input_dir (ordenados por nombre, para que el orden sea siempre el mismo).
+# Sin almacen_path (None) se leen siempre los archivos.
+def leer_facturas(input_dir, almacen_path):
+    if almacen_path is not None and os.path.exists(almacen_path):
+        with AlmacenTextos(almacen_path) as almacen:
+            total = len(almacen)
+
+        def del_almacen():
+            with AlmacenTextos(almacen_path) as almacen:
+                yield from almacen.items()
+        return total, del_almacen()
+
+    filenames = sorted(f for f in os.listdir(input_dir) if f.endswith('.txt') or f.endswith('.json'))
+
+    def de_archivos():
+        for filename in filenames:
+            file_path = os.path.join(input_dir, filename)
+            with open(file_path, 'r', encoding='utf-8') as file:
+                if filename.endswith('.json'):
+                    data = json.load(file)
+                    text = data.get("text", "")
+                else:
+                    text = file.read()
+            yield os.path.splitext(filename)[0], text
+    return len(filenames), de_archivos()
+
+# Agrupamos las facturas en lotes de facturas_por_lote
+def lotes(facturas, facturas_por_lote):
+    lote = []
+    for factura in facturas:
+        lote.append(factura)
+        if len(lote) == facturas_por_lote:
+            yield lote
+            lote = []
+    if lote:
+        yield lote
+
+# Modelo de cada proceso: se carga una sola vez, al arrancarlo
+_contexto = {}
+
+def iniciar_proceso(model_path):
+    _contexto['nlp'] = spacy.load(model_path)
+
+# Extraemos las entidades de un lote de facturas (en un proceso)
+def procesar_lote(lote):
+    facturas = ((nombre, text, None) for nombre, text in lote)
+    return list(extract_entities_batch(_contexto['nlp'], facturas, facturas_por_lote=len(lote)))
+
+# Resultados de todos los lotes, en orden...
+# Con un pool de procesos mantenemos como mucho `ventana` lotes encargados y los devolvemos en el orden
+# en que se encargaron, así la salida es la misma con cualquier número de procesos.
+def resultados_lotes(lotes_facturas, executor=None, ventana=4):
+    if executor is None:
+        for lote in lotes_facturas:
+            yield procesar_lote(lote)
+        return
+
+    en_vuelo = deque()
+    for lote in lotes_facturas:
+        en_vuelo.append(executor.submit(procesar_lote, lote))
+        if len(en_vuelo) >= ventana:
+            yield en_vuelo.popleft().result()
+    while en_vuelo:
+        yield en_vuelo.popleft().result()
+
+# Línea de progreso: facturas hechas, facturas por segundo y tiempo restante estimado
+def progreso(hechas, total, inicio):
+    transcurrido = time.perf_counter() - inicio
+    velocidad = hechas / transcurrido if transcurrido > 0 else 0.0
+    restante = (total - hechas) / velocidad if velocidad > 0 else 0.0
+    return f"{hechas}/{total} facturas ({100 * hechas / max(total, 1):.0f} %), {velocidad:.1f} facturas/s, quedan {restante:.0f} s"
+
+# Procesamos todas las facturas...
+# Aplicamos el modelo para extraer entidades y guardamos los resultados en archivos JSON.
+def main():
+    parser = argparse.ArgumentParser(description="Extrae las entidades de todas las facturas y las guarda en JSON.")
+    parser.add_argument('--input', help="carpeta con los textos de las facturas (se usa aunque exista el almacén)")
+    parser.add_argument('--output', default=output_dir, help="carpeta donde guardar los JSON")
+    parser.add_argument('--almacen', help="almacén empaquetado (si existe se usa en vez de --input)")
+    parser.add_argument('--modelo', default=model_path, help="modelo spaCy entrenado (por defecto, el más reciente de modelo_ner y modelo_entrenado)")
+    parser.add_argument('--workers', type=int, default=num_workers, help="procesos, cada uno con su modelo")
+    parser.add_argument('--lote', type=int, default=facturas_por_lote, help="facturas por lote")
+    args = parser.parse_args()
+    if args.modelo is None:
+        args.modelo = elegir_modelo()
+    # Sin --input ni --almacen, el almacén por defecto si existe y si no la carpeta por defecto
+    if args.input is None:
+        args.input = input_dir
+        if args.almacen is None:
+            args.almacen = almacen_path
+
+    # Asegurarse de que el directorio de salida existe
+    os.makedirs(args.output, exist_ok=True)
+    total, facturas = leer_facturas(args.input, args.almacen)
+    print(f"{total} facturas con {args.workers} procesos, lotes de {args.lote}")
+
+    executor = None
+    if args.workers > 1:
+        executor = ProcessPoolExecutor(max_workers=args.workers, initializer=iniciar_proceso, initargs=(args.modelo,))
+    else:
+        iniciar_proceso(args.modelo)
+
+    hechas = 0
+    inicio = time.perf_counter()
     try:
-        parsed_date = parse(text, dayfirst=True)
-        return parsed_date.strftime("%d.%m.%Y")
-    except (ParserError, ValueError):
-        return ""
-
-# Este es para la detección del consumo, ya que hay muchos números enteros, le ayudamos con el kWh
-def detect_consumo(text):
-    match = re.search(r'\b(\d{1,4}) kWh\b', text, re.IGNORECASE)
-    return match.group(1) if match else ""
-
-# Aquí para detectar direcciones
-def detect_direccion(text):
-    pattern = (
-        r'\b(?:C\/|Calle|Avenida|Avda\.|Av\.|Plaza|Paseo|Pje\.|Pl\.|Parque|Camino|Carretera|Cami|Urb\.)\s+[\w\s]+(?:,\s*\d+|\s+\d+)?\s*(?:[-ºªA-Za-z0-9\s,]*)?'
-    )
-    match = re.search(pattern, text, re.IGNORECASE)
-    return match.group() if match else ""
-
-# Función para limpiar el nombre de cliente, algunas veces se cuela la palabra NIF
-def clean_nombre_cliente(nombre):
-    # Eliminar cualquier ocurrencia de NIF o DNI y lo que venga después
-    nombre = re.sub(r'\bNIF\s*\d{8}[A-Z]\b', '', nombre, flags=re.IGNORECASE)
-    nombre = re.sub(r'\bDNI\s*\d{8}[A-Z]\b', '', nombre, flags=re.IGNORECASE)
-    # Eliminar caracteres no deseados
-    nombre = re.sub(r'[^\w\sÁÉÍÓÚÑáéíóúñ]', '', nombre)
-    # Eliminar espacios extra
-    nombre = re.sub(r'\s+', ' ', nombre).strip()
-    return nombre
-
-# Función para validar y ajustar entidades según patrones conocidos
-def validate_and_adjust_entities(entities, text):
-    # Detectar patrones en el texto
-    detected_entities = {
-        "dni_cliente": detect_dni(text),
-        "cp_cliente": detect_cp(text),
-        "nombre_cliente": detect_nombre_cliente(text),
-        "provincia_cliente": detect_provincia(text),
-        "provincia_comercializadora": detect_provincia(text),
-        "número_factura": detect_numero_factura(text),
-        "potencia_contratada": detect_potencia(text),
-        "importe_factura": detect_importe(text),
-        "inicio_periodo": detect_fecha(text),
-        "fin_periodo": detect_fecha(text),
-        "fecha_cargo": detect_fecha(text),
-        "consumo_periodo": detect_consumo(text),
-        "dirección_comercializadora": detect_direccion(text)
-    }
-
-    # Ajustar entidades extraídas con las detectadas por patrones
-    for key in detected_entities:
-        if not entities[key] and detected_entities[key]:
-            entities[key] = detected_entities[key]
-
-    # Validar y ajustar el CP de la comercializadora... para que no coja el del cliente
-    if detected_entities["dirección_comercializadora"]:
-        context_text = text[text.find(detected_entities["dirección_comercializadora"]):]
-        cp_comercializadora = detect_cp(context_text)
-        if cp_comercializadora:
-            entities["cp_comercializadora"] = cp_comercializadora
-
-    # Limpiar el nombre del cliente
-    entities["nombre_cliente"] = clean_nombre_cliente(entities["nombre_cliente"])
-    
-    return entities
-
-# Función para procesar el texto y extraer las entities...
-# Esta función utiliza el modelo spaCy para extraer entidades específicas del texto de las facturas
-def extract_entities(text):
-    doc = nlp(text)
-    segments = text.split(' | ')
-    entities = {category: "" for category in categories}
-    
-    for segment in segments:
-        segment_doc = nlp(segment)
-        for ent in segment_doc.ents:
-            if ent.label_ in categories and not entities[ent.label_]:
-                entities[ent.label_] = ent.text
-
-    # Validar y ajustar las entities extraídas
-    entities = validate_and_adjust_entities(entities, text)
-    
-    return entities
-
-# Procesamos cada archivo en el directorio de entrada...
-# Iteramos sobre todos los archivos en el directorio de entrada, leemos el texto,
-# aplicamos el modelo para extraer entidades y guardamos los resultados en archivos JSON.
-for filename in os.listdir(input_dir):
-    if filename.endswith('.txt') or filename.endswith('.json'):
-        file_path = os.path.join(input_dir, filename)
-        with open(file_path, 'r', encoding='utf-8') as file:
-            if filename.endswith('.json'):
-                data = json.load(file)
-                text = data.get("text", "")
-            else:
-                text = file.read()
-
-        # Extraer entidades del texto...
-        extracted_entities = extract_entities(text)
-
-        # Guardar los resultados en un archivo JSON
-        output_filename = os.path.splitext(filename)[0] + '_result.json'
-        output_path = os.path.join(output_dir, output_filename)
-        with open(output_path, 'w', encoding='utf-8') as output_file:
-            json.dump(extracted_entities, output_file, ensure_ascii=False, indent=4)
-
-        print(f"Resultados guardados en {output_path}")
+        for resultados in resultados_lotes(lotes(facturas, args.lote), executor, args.workers * lotes_por_worker):
+            for nombre, extracted_entities in resultados:
+                # Guardar los resultados en un archivo JSON
+                output_path = os.path.join(args.output, nombre + '_result.json')
+                with open(output_path, 'w', encoding='utf-8') as output_file:
+                    json.dump(extracted_entities, output_file, ensure_ascii=False, indent=4)
+            hechas += len(resultados)
+            # La línea de progreso se va sobrescribiendo
+            sys.stdout.write('\r' + progreso(hechas, total, inicio))
+            sys.stdout.flush()
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+    print(f"\nResultados guardados en {args.output}")
+
+if __name__ == '__main__':
+    main()
@@ -4,55 +4,14 @@
 # para cada categoría de entidad y una tasa de acierto global...
 
 import os
-import json
-from dateutil.parser import parse
+from fuentes import leer_json, recorrer
+from metricas import categories, load_json, compare_dicts, compare_by_category
 
 # Directorios
+# original_dir también puede ser training.zip (o una lista de carpetas y zips): los JSON se leen del zip sin descomprimirlo.
 original_dir = 'C:/Users/34670/Desktop/python/Hack a boss/proyecto_decide/training/'
 extracted_dir = 'C:/Users/34670/Desktop/python/Hack a boss/proyecto_decide/libretas/validaciones/'
 
-# Categorías de entidades
-# Estas son las etiquetas que esperamos que el modelo haya reconocido correctamente en los textos.
-categories = [
-    "nombre_cliente", "dni_cliente", "calle_cliente", "cp_cliente", "población_cliente",
-    "provincia_cliente", "nombre_comercializadora", "cif_comercializadora", "dirección_comercializadora",
-    "cp_comercializadora", "población_comercializadora", "provincia_comercializadora", "número_factura",
-    "inicio_periodo", "fin_periodo", "importe_factura", "fecha_cargo", "consumo_periodo", "potencia_contratada"
-]
-
-# Función para cargar JSON
-# Cargamos los datos de un archivo JSON y los devolvemos como un diccionario.
-def load_json(file_path):
-    with open(file_path, 'r', encoding='utf-8') as file:
-        return json.load(file)
-    
-# Función para normalizar fechas al formato dd.mm.yyyy
-def normalize_date(date_str):
-    try:
-        date_obj = parse(date_str, dayfirst=True)
-        return date_obj.strftime("%d.%m.%Y")
-    except (ValueError, OverflowError):
-        return date_str
-
-# Función para comparar dos diccionarios y calcular la tasa de acierto
-# Compara los valores de las entidades en los diccionarios original y extraído, y cuenta los aciertos.
-def compare_dicts(original, extracted):
-    total = 0
-    correct = 0
-    for category in categories:
-        total += 1
-        original_value = str(original.get(category, "")).strip()
-        extracted_value = str(extracted.get(category, "")).strip()
-        
-        # Normalizar fechas si el campo es una fecha
-        if "fecha" in category or "periodo" in category:
-            original_value = normalize_date(original_value)
-            extracted_value = normalize_date(extracted_value)
-        
-        if original_value == extracted_value:
-            correct += 1
-    return correct, total
-
 # Inicializar contadores
 # Estos contadores llevarán un registro de los aciertos por categoría y globalmente.
 total_correct = {category: 0 for category in categories}
@@ -63,32 +22,22 @@ document_accuracies = []
 
 # Procesar cada archivo en el directorio de originales y extraídos
 # Iteramos sobre cada archivo JSON en el directorio original y comparamos con el archivo correspondiente en el directorio extraído.
-for filename in os.listdir(original_dir):
-    if filename.endswith('.json'):
-        original_file_path = os.path.join(original_dir, filename)
-        extracted_file_path = os.path.join(extracted_dir, filename.replace('.json', '_result.json'))
+for filename, referencia in recorrer(original_dir, '.json'):
+    extracted_file_path = os.path.join(extracted_dir, filename.replace('.json', '_result.json'))
+    
+    if os.path.exists(extracted_file_path):
+        original_data = leer_json(referencia)
+        extracted_data = load_json(extracted_file_path)
         
-        if os.path.exists(extracted_file_path):
-            original_data = load_json(original_file_path)
-            extracted_data = load_json(extracted_file_path)
-            
-            correct, total = compare_dicts(original_data, extracted_data)
-            global_correct += correct
-            global_total += total
-            document_accuracies.append(correct / total if total > 0 else 0)
+        correct, total = compare_dicts(original_data, extracted_data)
+        global_correct += correct
+        global_total += total
+        document_accuracies.append(correct / total if total > 0 else 0)
 
-            for category in categories:
-                total_entries[category] += 1
-                original_value = str(original_data.get(category, "")).strip()
-                extracted_value = str(extracted_data.get(category, "")).strip()
-                
-                # Normalizar fechas si el campo es una fecha
-                if "fecha" in category or "periodo" in category:
-                    original_value = normalize_date(original_value)
-                    extracted_value = normalize_date(extracted_value)
-                
-                if original_value == extracted_value:
-                    total_correct[category] += 1
+        for category, acierto in compare_by_category(original_data, extracted_data).items():
+            total_entries[category] += 1
+            if acierto:
+                total_correct[category] += 1
 
 # Calcular y mostrar los porcentajes de acierto
 # Calculamos y mostramos la tasa de acierto para cada categoría de entidad.
@@ -8,9 +8,11 @@
 import os
 import json
 import Levenshtein
-from dateutil.parser import parse
+from fechas import normalizar_fecha
+from fuentes import leer_json, recorrer
 
 # Directorios
+# original_dir también puede ser training.zip (o una lista de carpetas y zips): los JSON se leen del zip sin descomprimirlo.
 original_dir = 'C:/Users/34670/Desktop/python/Hack a boss/proyecto_decide/training/'
 extracted_dir = 'C:/Users/34670/Desktop/python/Hack a boss/proyecto_decide/libretas/validaciones/'
 
@@ -27,13 +29,9 @@ def load_json(file_path):
     with open(file_path, 'r', encoding='utf-8') as file:
         return json.load(file)
 
-# Función para normalizar fechas al formato dd.mm.yyyy
+# Función para normalizar fechas al formato dd.mm.yyyy (ver fechas.py)
 def normalize_date(date_str):
-    try:
-        date_obj = parse(date_str, dayfirst=True)
-        return date_obj.strftime("%d.%m.%Y")
-    except (ValueError, OverflowError):
-        return date_str
+    return normalizar_fecha(date_str) or date_str
 
 # Función para calcular el score basado en la distancia de Levenshtein
 # La métrica utilizada es:
@@ -64,18 +62,16 @@ total_score = 0
 num_files = 0
 
 # Procesar cada archivo en el directorio de originales y extraídos
-for filename in os.listdir(original_dir):
-    if filename.endswith('.json'):
-        original_file_path = os.path.join(original_dir, filename)
-        extracted_file_path = os.path.join(extracted_dir, filename.replace('.json', '_result.json'))
+for filename, referencia in recorrer(original_dir, '.json'):
+    extracted_file_path = os.path.join(extracted_dir, filename.replace('.json', '_result.json'))
+    
+    if os.path.exists(extracted_file_path):
+        original_data = leer_json(referencia)
+        extracted_data = load_json(extracted_file_path)
         
-        if os.path.exists(extracted_file_path):
-            original_data = load_json(original_file_path)
-            extracted_data = load_json(extracted_file_path)
-            
-            file_score = calculate_levenshtein_score(original_data, extracted_data)
-            total_score += file_score
-            num_files += 1
+        file_score = calculate_levenshtein_score(original_data, extracted_data)
+        total_score += file_score
+        num_files += 1
 
 # Calcular y mostrar el score promedio
 if num_files > 0:
@@ -0,0 +1,113 @@
+# pipeline.py
+# Este script hace todo el proceso de producción de una sola pasada y en streaming:
+# PDF -> texto -> clean_text -> normalize_dates -> extract_entities -> JSON.
+# Antes había que ejecutar 06_extraccion_pdf.py para escribir los textos y luego 07_app.py para volver a leerlos;
+# aquí cada factura pasa por todas las etapas seguidas, sin archivos intermedios.
+# Las etapas son generadores encadenados, de forma que en memoria solo hay como mucho una ventana de facturas
+# (las que están extrayéndose en los procesos) y los JSON se van escribiendo según salen.
+# Además medimos la latencia de cada factura de principio a fin.
+
+import os
+import json
+import time
+import statistics
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import spacy
+from extraccion import procesar_referencia, procesar_pdf_maquetacion
+from fuentes import leer_bytes, recorrer
+from entidades import elegir_modelo, extract_entities_batch
+
+# Ruta del modelo entrenado. Con None se usa el modelo ligero solo con el NER (031_exportacion_ner.py) si se ha
+# exportado después del último entrenamiento, y si no modelo_entrenado (ver elegir_modelo en entidades.py).
+model_path = None
+
+# Directorios. pdf_folder puede ser también un .zip o una lista de carpetas y zips (ver fuentes.py).
+pdf_folder = 'C:/Users/34670/Desktop/python/Hack a boss/proyecto_decide/training'
+output_dir = 'C:/Users/34670/Desktop/python/Hack a boss/proyecto_decide/libretas/validaciones/'
+
+# Procesos para la extracción del texto de los PDFs (con 1 se hace todo en el proceso principal)
+num_workers = os.cpu_count() or 1
+# Máximo de facturas en vuelo a la vez. Es lo único que se tiene en memoria.
+ventana = 32
+# Modo maquetación (ver maquetacion.py): el modelo NER solo se aplica a los bloques de la factura
+# que tienen alguna palabra clave cerca, en vez de a toda la factura.
+modo_maquetacion = False
+# Facturas que se juntan para pasar sus segmentos por el modelo de una vez (ver extract_entities_batch).
+# Con más van más rápido, pero cada factura espera a que se llene su lote, así que sube su latencia.
+facturas_por_lote = 16
+
+# En modo normal no hay un texto aparte para el NER
+def _procesar_sin_maquetacion(referencia):
+    return procesar_referencia(referencia), None
+
+def _procesar_con_maquetacion(referencia):
+    return procesar_pdf_maquetacion(leer_bytes(referencia))
+
+# Etapa 1: recorremos la carpeta (o el zip) y vamos dando (nombre, referencia) de cada PDF.
+def recorrer_pdfs(pdf_folder):
+    for pdf_file, referencia in recorrer(pdf_folder, '.pdf'):
+        yield pdf_file[:-len('.pdf')], referencia
+
+# Etapa 2: extracción, limpieza y normalización de fechas (procesar_pdf de extraccion.py).
+# Con un pool de procesos mantenemos como mucho `ventana` facturas encargadas y las devolvemos en orden.
+# Cada factura lleva el instante en que entró al pipeline para medir su latencia.
+# Lo que se devuelve es el texto limpio y el texto para el NER (None si no estamos en modo maquetación).
+def textos_limpios(pdfs, executor=None, ventana=32, maquetacion=False):
+    procesar = _procesar_con_maquetacion if maquetacion else _procesar_sin_maquetacion
+    if executor is None:
+        for nombre, referencia in pdfs:
+            inicio = time.perf_counter()
+            yield nombre, procesar(referencia), inicio
+        return
+
+    en_vuelo = deque()
+    for nombre, referencia in pdfs:
+        en_vuelo.append((nombre, executor.submit(procesar, referencia), time.perf_counter()))
+        if len(en_vuelo) >= ventana:
+            nombre, futuro, inicio = en_vuelo.popleft()
+            yield nombre, futuro.result(), inicio
+    while en_vuelo:
+        nombre, futuro, inicio = en_vuelo.popleft()
+        yield nombre, futuro.result(), inicio
+
+# Etapa 3: extracción de entidades con el modelo y los patrones, por lotes de facturas_por_lote facturas.
+def entidades_facturas(textos, nlp, facturas_por_lote=16):
+    facturas = (((nombre, inicio), text, texto_ner) for nombre, (text, texto_ner), inicio in textos)
+    for (nombre, inicio), entities in extract_entities_batch(nlp, facturas, facturas_por_lote):
+        yield nombre, entities, inicio
+
+# Etapa 4: escribimos el JSON de cada factura según llega y devolvemos su latencia.
+def escribir_json(resultados, output_dir):
+    for nombre, entities, inicio in resultados:
+        output_path = os.path.join(output_dir, nombre + '_result.json')
+        with open(output_path, 'w', encoding='utf-8') as output_file:
+            json.dump(entities, output_file, ensure_ascii=False, indent=4)
+        yield output_path, time.perf_counter() - inicio
+
+if __name__ == '__main__':
+    os.makedirs(output_dir, exist_ok=True)
+    nlp = spacy.load(model_path or elegir_modelo())
+
+    executor = ProcessPoolExecutor(max_workers=num_workers) if num_workers > 1 else None
+    latencias = []
+    inicio_total = time.perf_counter()
+
+    pdfs = recorrer_pdfs(pdf_folder)
+    textos = textos_limpios(pdfs, executor, ventana, modo_maquetacion)
+    resultados = entidades_facturas(textos, nlp, facturas_por_lote)
+    for output_path, latencia in escribir_json(resultados, output_dir):
+        latencias.append(latencia)
+        print(f"Resultados guardados en {output_path} ({latencia * 1000:.0f} ms)")
+
+    duracion = time.perf_counter() - inicio_total
+    if executor is not None:
+        executor.shutdown()
+
+    # Resumen de rendimiento del pipeline completo
+    if latencias:
+        latencias.sort()
+        p95 = latencias[min(len(latencias) - 1, int(len(latencias) * 0.95))]
+        print(f"{len(latencias)} facturas en {duracion:.2f} s ({len(latencias) / duracion:.2f} docs/s)")
+        print(f"Latencia por factura: media {statistics.mean(latencias) * 1000:.0f} ms, "
+              f"mediana {statistics.median(latencias) * 1000:.0f} ms, p95 {p95 * 1000:.0f} ms")
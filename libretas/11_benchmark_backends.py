@@ -0,0 +1,100 @@
+# benchmark_backends.py
+# Este script compara las librerías de PDF que tenemos en requirements.txt (PyMuPDF, pdfminer.six, pdfplumber y pypdfium2)
+# sobre las mismas facturas. Como avisa el README, no todas extraen el mismo texto, así que no basta con mirar la velocidad:
+# para cada librería medimos las páginas por segundo, la memoria máxima (RSS) del proceso, el porcentaje de campos
+# de los JSON originales que aparecen en el texto limpio y, si hay modelo, la tasa de acierto final con la misma
+# lógica de 08_medicion.py. Así podemos elegir la librería más rápida que no pierda campos.
+
+import os
+import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import fitz  # PyMuPDF
+from extraccion import backends, procesar_pdf
+from metricas import categories, load_json, compare_dicts
+from instrumentacion import memoria_pico_mb
+
+# Carpeta con los PDFs y sus JSON originales
+pdf_folder = 'C:/Users/34670/Desktop/python/Hack a boss/proyecto_decide/training'
+# Modelo para medir la tasa de acierto final. Si se pone a None solo se mide si los campos están en el texto.
+model_path = 'modelo_entrenado'
+# Número máximo de facturas a usar en el benchmark (None para todas)
+max_facturas = 200
+
+# Extrae y limpia todas las facturas con una librería. Se ejecuta en un proceso nuevo para cada librería
+# y así la memoria máxima que se mide es solo la suya. El proceso se arranca con spawn, para que no herede la memoria
+# del principal como con fork (el de Linux), y todas las librerías se miden antes de cargar el modelo: en Linux
+# el RSS máximo de un proceso incluye lo que ocupaba al crearse, aunque luego se sustituya por un intérprete nuevo.
+def medir_backend(backend, pdf_paths):
+    inicio = time.perf_counter()
+    textos = [procesar_pdf(pdf_path, backend) for pdf_path in pdf_paths]
+    duracion = time.perf_counter() - inicio
+    return textos, duracion, memoria_pico_mb()
+
+# Porcentaje de campos del JSON original cuyo valor aparece tal cual en el texto limpio
+def campos_presentes(textos, originales):
+    presentes = 0
+    total = 0
+    for text, original in zip(textos, originales):
+        text = text.lower()
+        for category in categories:
+            valor = str(original.get(category, "")).strip().lower()
+            if valor:
+                total += 1
+                presentes += valor in text
+    return presentes / total * 100 if total else 0.0
+
+if __name__ == '__main__':
+    pdf_files = sorted(f for f in os.listdir(pdf_folder) if f.endswith('.pdf'))[:max_facturas]
+    pdf_paths = [os.path.join(pdf_folder, f) for f in pdf_files]
+    originales = [load_json(os.path.join(pdf_folder, f.replace('.pdf', '.json'))) for f in pdf_files]
+
+    paginas = 0
+    for pdf_path in pdf_paths:
+        with fitz.open(pdf_path) as doc:
+            paginas += len(doc)
+
+    # Primero medimos todas las librerías, con el proceso principal todavía pequeño
+    mediciones = []
+    for backend in backends:
+        try:
+            with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as executor:
+                textos, duracion, memoria = executor.submit(medir_backend, backend, pdf_paths).result()
+        except ImportError as e:
+            print(f"{backend}: no está instalado ({e})")
+            continue
+        mediciones.append((backend, textos, duracion, memoria))
+        print(f"{backend}: terminado en {duracion:.2f} s")
+
+    nlp = None
+    if model_path is not None:
+        import spacy
+        from entidades import extract_entities_batch
+        nlp = spacy.load(model_path)
+
+    resultados = []
+    for backend, textos, duracion, memoria in mediciones:
+        fila = {
+            'backend': backend,
+            'paginas_s': paginas / duracion if duracion > 0 else 0.0,
+            'memoria': memoria,
+            'presentes': campos_presentes(textos, originales),
+            'acierto': None,
+        }
+        if nlp is not None:
+            correctos = 0
+            totales = 0
+            facturas = ((original, text, None) for text, original in zip(textos, originales))
+            for original, entities in extract_entities_batch(nlp, facturas):
+                correct, total = compare_dicts(original, entities)
+                correctos += correct
+                totales += total
+            fila['acierto'] = correctos / totales * 100 if totales else 0.0
+        resultados.append(fila)
+
+    # Tabla comparativa
+    print(f"\n{len(pdf_paths)} facturas, {paginas} páginas")
+    print(f"{'backend':<12}{'páginas/s':>12}{'RSS pico MB':>14}{'campos en texto':>18}{'acierto global':>16}")
+    for fila in resultados:
+        acierto = f"{fila['acierto']:.2f}%" if fila['acierto'] is not None else '-'
+        print(f"{fila['backend']:<12}{fila['paginas_s']:>12.1f}{fila['memoria']:>14.1f}{fila['presentes']:>17.2f}%{acierto:>16}")
@@ -0,0 +1,80 @@
+# benchmark_fechas.py
+# Este script compara el normalizador de fechas de fechas.py con dateutil.parser.parse, que es lo que usábamos antes
+# en normalize_dates, normalize_date (08_medicion.py y 09_levenshtein.py) y detect_fecha.
+# Generamos fechas en los formatos que salen en las facturas (con repeticiones, como en un lote real de facturas)
+# y medimos cuántas fechas por segundo normaliza cada uno, sin caché y con la caché LRU.
+# También contamos en cuántas fechas que dateutil sí entendía el resultado es distinto (debería ser 0)
+# y cuántas fechas que dateutil no entendía o leía mal se normalizan ahora.
+
+import random
+import time
+from dateutil.parser import parse
+import fechas
+from fechas import meses, normalizar_fecha
+
+# Número de fechas a normalizar y número de fechas distintas entre ellas
+num_fechas = 50000
+num_distintas = 2000
+semilla = 42
+
+# Una fecha al azar escrita en uno de los formatos de las facturas
+def fecha_aleatoria(rng):
+    dia, mes, anio = rng.randint(1, 28), rng.randint(1, 12), rng.randint(2005, 2024)
+    nombres_meses = [nombre for nombre, numero in meses.items() if numero == mes]
+    formatos = [
+        f"{dia:02d}/{mes:02d}/{anio}",
+        f"{dia}-{mes}-{anio % 100:02d}",
+        f"{dia:02d}.{mes:02d}.{anio}",
+        f"{anio}-{mes:02d}-{dia:02d}",
+        f"{dia:02d}{mes:02d}{anio}",
+        f"{dia} de {rng.choice(nombres_meses)} de {anio}",
+    ]
+    return rng.choice(formatos)
+
+def normalizar_dateutil(date_str):
+    try:
+        return parse(date_str, dayfirst=True).strftime("%d.%m.%Y")
+    except (ValueError, OverflowError):
+        return None
+
+# Fechas por segundo de una función sobre la lista de fechas
+def medir(funcion, muestras):
+    inicio = time.perf_counter()
+    for muestra in muestras:
+        funcion(muestra)
+    return len(muestras) / (time.perf_counter() - inicio)
+
+if __name__ == '__main__':
+    rng = random.Random(semilla)
+    distintas = [fecha_aleatoria(rng) for _ in range(num_distintas)]
+    muestras = [rng.choice(distintas) for _ in range(num_fechas)]
+
+    velocidad_dateutil = medir(normalizar_dateutil, muestras)
+    # Sin caché: llamamos directamente a la función que hay debajo de lru_cache
+    velocidad_sin_cache = medir(lambda muestra: fechas._normalizar.__wrapped__(muestra.strip(), "%d.%m.%Y"), muestras)
+    fechas._normalizar.cache_clear()
+    velocidad_cache = medir(normalizar_fecha, muestras)
+
+    # Comparamos los resultados en las fechas que dateutil entiende. Las de 8 cifras dateutil las lee siempre
+    # como yyyymmdd (27092018 no la entiende y 01022007 la convierte en el 20.07.0102), así que ahí las diferencias
+    # son las fechas ddmmyyyy que ahora se leen bien y las contamos aparte.
+    distintos = 0
+    entendidas = 0
+    corregidas = 0
+    for muestra in distintas:
+        esperado = normalizar_dateutil(muestra)
+        obtenido = normalizar_fecha(muestra)
+        if esperado is None or (muestra.isdigit() and esperado != obtenido):
+            corregidas += obtenido is not None
+        else:
+            entendidas += 1
+            distintos += esperado != obtenido
+
+    print(f"{num_fechas} fechas ({num_distintas} distintas)")
+    print(f"{'normalizador':<28}{'fechas/s':>14}{'speedup':>10}")
+    for nombre, velocidad in [('dateutil', velocidad_dateutil), ('fechas.py sin caché', velocidad_sin_cache),
+                              ('fechas.py con caché LRU', velocidad_cache)]:
+        print(f"{nombre:<28}{velocidad:>14.0f}{velocidad / velocidad_dateutil:>9.1f}x")
+    print(f"Resultados distintos de dateutil: {distintos} de {entendidas}")
+    print(f"Fechas que dateutil no entendía o leía mal (ddmmyyyy, meses en español): {corregidas}")
+    print(fechas._normalizar.cache_info())
@@ -0,0 +1,114 @@
+# resumen_entrenamiento.py
+# Este script resume y dibuja un registro de entrenamiento de instrumentacion.py (de 03_modelo.py o de
+# bert/04_entrenamiento.py). Saca por pantalla la velocidad media, el reparto del tiempo entre componentes,
+# el tiempo de las evaluaciones, la memoria máxima y la mejor métrica, y guarda las gráficas en un PNG junto al log.
+# Uso: python 13_resumen_entrenamiento.py [ruta del log]. Sin ruta se usa el log más reciente de las carpetas de logs.
+
+import os
+import sys
+import json
+from collections import defaultdict
+
+# Carpetas donde buscar el log más reciente si no se indica ninguno
+logs_dirs = ['logs', os.path.join('..', 'bert', 'logs')]
+
+# Log más reciente de las carpetas de logs
+def ultimo_log():
+    logs = [os.path.join(carpeta, f) for carpeta in logs_dirs if os.path.isdir(carpeta)
+            for f in os.listdir(carpeta) if f.endswith('.jsonl')]
+    if not logs:
+        raise FileNotFoundError(f"No hay registros de entrenamiento en {logs_dirs}")
+    return max(logs, key=os.path.getmtime)
+
+# Cabecera y registros del log. Los de evaluación de RoBERTa van aparte (no tienen unidades) y aquí se separan.
+def leer_log(log_path):
+    with open(log_path, 'r', encoding='utf-8') as f:
+        lineas = [json.loads(linea) for linea in f if linea.strip()]
+    cabecera, registros = lineas[0], lineas[1:]
+    pasos = [r for r in registros if r['unidades'] > 0]
+    evaluaciones = [r for r in registros if r['evaluacion_s'] is not None]
+    return cabecera, pasos, evaluaciones
+
+# Resumen por pantalla
+def resumir(cabecera, pasos, evaluaciones):
+    unidad = cabecera['unidad']
+    print(f"Entrenamiento {cabecera['entrenamiento']} del {cabecera['inicio']} ({len(pasos)} registros, {len(evaluaciones)} evaluaciones)")
+    if not pasos:
+        return
+    unidades = sum(r['unidades'] for r in pasos)
+    duracion = sum(r['duracion_s'] for r in pasos)
+    evaluacion = sum(r['evaluacion_s'] for r in evaluaciones)
+    print(f"Tiempo total: {pasos[-1]['tiempo_s'] / 60:.1f} min ({duracion / 60:.1f} entrenando, {evaluacion / 60:.1f} evaluando)")
+    print(f"Velocidad media: {unidades / duracion:.0f} {unidad}/s (mín. {min(r['velocidad'] for r in pasos):.0f}, máx. {max(r['velocidad'] for r in pasos):.0f})")
+
+    componentes = defaultdict(float)
+    for r in pasos:
+        for nombre, segundos in r['componentes_s'].items():
+            componentes[nombre] += segundos
+    total = sum(componentes.values())
+    for nombre, segundos in sorted(componentes.items(), key=lambda c: -c[1]):
+        print(f"{nombre:>24}: {segundos / 60:8.1f} min ({100 * segundos / total:.0f} %)")
+
+    print(f"Memoria máxima: {max(r['rss_pico_mb'] for r in pasos):.0f} MB")
+    if evaluaciones:
+        print(f"Evaluación media: {evaluacion / len(evaluaciones):.1f} s")
+        # La métrica principal: el F1 de las entidades en spaCy y el de eval en RoBERTa
+        clave = next((k for k in ('ents_f', 'eval_f1') if k in evaluaciones[-1]['metricas']), None)
+        if clave is not None:
+            mejor = max(evaluaciones, key=lambda r: r['metricas'][clave] or 0.0)
+            print(f"Mejor {clave}: {mejor['metricas'][clave]:.4f} en {mejor['n']}")
+    if 'restante_s' in pasos[-1]:
+        print(f"Tiempo restante estimado en el último registro: {pasos[-1]['restante_s'] / 60:.1f} min")
+
+# Gráficas: velocidad, tiempo por componente, pérdidas, memoria y métricas, en un PNG junto al log
+def dibujar(cabecera, pasos, evaluaciones, png_path):
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    fig, ejes = plt.subplots(3, 2, figsize=(12, 10))
+    n = [r['n'] for r in pasos]
+
+    ejes[0][0].plot(n, [r['velocidad'] for r in pasos])
+    ejes[0][0].set_title(f"{cabecera['unidad']}/s")
+
+    nombres = sorted({nombre for r in pasos for nombre in r['componentes_s']})
+    ejes[0][1].stackplot(n, *[[r['componentes_s'].get(nombre, 0.0) for r in pasos] for nombre in nombres], labels=nombres)
+    ejes[0][1].set_title("Segundos por componente")
+    ejes[0][1].legend(fontsize='small')
+
+    for nombre in sorted({nombre for r in pasos for nombre in r['perdidas']}):
+        ejes[1][0].plot(n, [r['perdidas'].get(nombre) for r in pasos], label=nombre)
+    ejes[1][0].set_title("Pérdidas")
+    ejes[1][0].legend(fontsize='small')
+
+    ejes[1][1].plot(n, [r['rss_pico_mb'] for r in pasos], label='RSS')
+    if any('gpu_pico_mb' in r for r in pasos):
+        ejes[1][1].plot(n, [r.get('gpu_pico_mb') for r in pasos], label='GPU')
+    ejes[1][1].set_title("Memoria máxima (MB)")
+    ejes[1][1].legend(fontsize='small')
+
+    if evaluaciones:
+        n_eval = [r['n'] for r in evaluaciones]
+        for clave in ('ents_p', 'ents_r', 'ents_f', 'eval_precision', 'eval_recall', 'eval_f1'):
+            if clave in evaluaciones[-1]['metricas']:
+                ejes[2][0].plot(n_eval, [r['metricas'].get(clave) for r in evaluaciones], label=clave, marker='.')
+        ejes[2][0].set_title("Métricas de validación")
+        ejes[2][0].legend(fontsize='small')
+        ejes[2][1].plot(n_eval, [r['evaluacion_s'] for r in evaluaciones], marker='.')
+        ejes[2][1].set_title("Segundos por evaluación")
+
+    fig.suptitle(f"Entrenamiento {cabecera['entrenamiento']} del {cabecera['inicio']}")
+    fig.tight_layout()
+    fig.savefig(png_path)
+    plt.close(fig)
+
+if __name__ == '__main__':
+    log_path = sys.argv[1] if len(sys.argv) > 1 else ultimo_log()
+    cabecera, pasos, evaluaciones = leer_log(log_path)
+    resumir(cabecera, pasos, evaluaciones)
+    if not pasos:
+        sys.exit()
+    png_path = os.path.splitext(log_path)[0] + '.png'
+    dibujar(cabecera, pasos, evaluaciones, png_path)
+    print(f"Gráficas guardadas en '{png_path}'")
@@ -0,0 +1,184 @@
+# almacen_textos.py
+# Almacén de los textos limpios de las facturas en un único archivo empaquetado, en vez de miles de .txt sueltos.
+# El archivo tiene esta forma:
+#   [MAGIC][texto UTF-8 de cada factura, uno detrás de otro][índice JSON][posición del índice (8 bytes)][MAGIC]
+# El índice guarda para cada factura (factura_N) su posición y longitud dentro del archivo y la clave con la que se generó.
+# La clave es el hash del contenido del PDF más la versión de las reglas de limpieza, así que si el PDF no ha cambiado
+# y las reglas tampoco, no hace falta volver a extraerlo. Y si dos facturas tienen exactamente el mismo PDF, comparten el texto.
+# Para leer se usa mmap, de modo que 07_app.py o bert/05_modelo.py pueden sacar cualquier factura directamente por su nombre.
+# Los textos nuevos siempre se añaden al final, así que el texto que sustituyen (al cambiar el PDF o las reglas) queda
+# muerto en el archivo. Al cerrar, si los bytes muertos pasan de umbral_compactacion, el archivo se reescribe solo
+# con los textos que siguen en uso (compactar).
+
+import hashlib
+import inspect
+import json
+import mmap
+import os
+import struct
+
+MAGIC = b'FACTPACK'
+TAM_COLA = 8 + len(MAGIC)
+
+# Fracción de los datos que tiene que estar muerta para compactar el almacén al cerrarlo
+umbral_compactacion = 0.25
+
+# Versión de las reglas de limpieza: hash del código fuente de las funciones (o clases o módulos) que intervienen.
+# Si cambiamos clean_text o normalize_dates cambia la versión y se vuelven a extraer todas las facturas.
+# Lo que no es una función ni una clase (por ejemplo el motor de limpieza con sus reglas) entra con su repr.
+def version_reglas(*funciones):
+    codigo = ''.join(inspect.getsource(funcion) if inspect.isfunction(funcion) or inspect.isclass(funcion) or inspect.ismodule(funcion) else repr(funcion)
+                     for funcion in funciones)
+    return hashlib.sha1(codigo.encode('utf-8')).hexdigest()[:12]
+
+# Clave de caché de un PDF: hash de su contenido más la versión de las reglas.
+def clave_pdf(pdf_bytes, version):
+    return f"{hashlib.sha1(pdf_bytes).hexdigest()}-{version}"
+
+class AlmacenTextos:
+    def __init__(self, ruta):
+        self.ruta = ruta
+        self.textos = {}  # nombre -> [posición, longitud, clave]
+        self.claves = {}  # clave -> [posición, longitud]
+        self._fin_datos = len(MAGIC)
+        self._escritura = None
+        self._archivo = None
+        self._mmap = None
+        if os.path.exists(ruta):
+            self._cargar_indice()
+
+    # Leemos el índice del final del archivo. Si el archivo está a medias (una ejecución que no llegó a cerrar
+    # el almacén), no hay cola válida y empezamos de cero: solo se pierde la caché, no hay nada que arreglar a mano.
+    def _cargar_indice(self):
+        with open(self.ruta, 'rb') as f:
+            tam = f.seek(0, os.SEEK_END)
+            if tam < len(MAGIC) + TAM_COLA:
+                return
+            f.seek(tam - TAM_COLA)
+            cola = f.read(TAM_COLA)
+            if cola[8:] != MAGIC:
+                return
+            inicio_indice = struct.unpack('<Q', cola[:8])[0]
+            f.seek(inicio_indice)
+            indice = json.loads(f.read(tam - TAM_COLA - inicio_indice).decode('utf-8'))
+        self.textos = indice['textos']
+        self.claves = indice['claves']
+        self._fin_datos = inicio_indice
+
+    def __contains__(self, nombre):
+        return nombre in self.textos
+
+    def __len__(self):
+        return len(self.textos)
+
+    def nombres(self):
+        return list(self.textos)
+
+    # Comprobamos si la factura ya está guardada con esta misma clave (mismo PDF y mismas reglas).
+    def vigente(self, nombre, clave):
+        entrada = self.textos.get(nombre)
+        return entrada is not None and entrada[2] == clave
+
+    # Lectura directa de una factura por su nombre usando mmap.
+    # Mientras el almacén se está escribiendo leemos del propio archivo abierto.
+    def leer(self, nombre):
+        posicion, longitud, _ = self.textos[nombre]
+        return self._leer_bytes(posicion, longitud).decode('utf-8')
+
+    def _leer_bytes(self, posicion, longitud):
+        if self._escritura is not None:
+            self._escritura.seek(posicion)
+            return self._escritura.read(longitud)
+        if self._mmap is None:
+            self._archivo = open(self.ruta, 'rb')
+            self._mmap = mmap.mmap(self._archivo.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._mmap[posicion:posicion + longitud]
+
+    def items(self):
+        for nombre in self.textos:
+            yield nombre, self.leer(nombre)
+
+    # Guardamos el texto de una factura. Si ya hay un texto con la misma clave (PDF duplicado),
+    # la factura apunta a ese texto y no se escribe nada nuevo.
+    def guardar(self, nombre, clave, texto=None):
+        if clave in self.claves:
+            posicion, longitud = self.claves[clave]
+        else:
+            datos = texto.encode('utf-8')
+            f = self._abrir_escritura()
+            f.seek(self._fin_datos)
+            f.write(datos)
+            posicion, longitud = self._fin_datos, len(datos)
+            self._fin_datos += longitud
+            self.claves[clave] = [posicion, longitud]
+        self.textos[nombre] = [posicion, longitud, clave]
+
+    # Al empezar a escribir cortamos el archivo donde acaban los datos, quitando el índice viejo.
+    # El índice nuevo se escribe al cerrar.
+    def _abrir_escritura(self):
+        if self._escritura is None:
+            self._cerrar_mmap()
+            self._escritura = open(self.ruta, 'r+b' if os.path.exists(self.ruta) else 'w+b')
+            self._escritura.write(MAGIC)
+            self._escritura.truncate(self._fin_datos)
+        return self._escritura
+
+    def _cerrar_mmap(self):
+        if self._mmap is not None:
+            self._mmap.close()
+            self._archivo.close()
+            self._mmap = None
+            self._archivo = None
+
+    # Bytes de datos que no usa ninguna factura (textos sustituidos por otros)
+    def bytes_muertos(self):
+        vivos = {(posicion, longitud) for posicion, longitud, _ in self.textos.values()}
+        return self._fin_datos - len(MAGIC) - sum(longitud for _, longitud in vivos)
+
+    # Reescribimos el almacén solo con los textos que siguen en uso, en un archivo temporal que luego sustituye
+    # al original (si algo falla a medias, el original sigue intacto). Las claves que ya no usa ninguna factura se quitan.
+    def compactar(self):
+        temporal = self.ruta + '.tmp'
+        textos, claves, nuevas = {}, {}, {}
+        with open(temporal, 'wb') as f:
+            f.write(MAGIC)
+            fin = len(MAGIC)
+            for nombre, (posicion, longitud, clave) in self.textos.items():
+                if (posicion, longitud) not in nuevas:
+                    f.write(self._leer_bytes(posicion, longitud))
+                    nuevas[(posicion, longitud)] = fin
+                    fin += longitud
+                textos[nombre] = [nuevas[(posicion, longitud)], longitud, clave]
+                claves[clave] = [nuevas[(posicion, longitud)], longitud]
+            self.textos, self.claves, self._fin_datos = textos, claves, fin
+            self._escribir_indice(f)
+        self._cerrar_mmap()
+        if self._escritura is not None:
+            self._escritura.close()
+            self._escritura = None
+        os.replace(temporal, self.ruta)
+
+    # El índice va justo después de los datos, seguido de su posición y de MAGIC
+    def _escribir_indice(self, f):
+        indice = json.dumps({'textos': self.textos, 'claves': self.claves}, ensure_ascii=False).encode('utf-8')
+        f.seek(self._fin_datos)
+        f.write(indice)
+        f.write(struct.pack('<Q', self._fin_datos))
+        f.write(MAGIC)
+        f.truncate()
+
+    def cerrar(self):
+        self._cerrar_mmap()
+        if self._escritura is not None:
+            if self.bytes_muertos() > umbral_compactacion * (self._fin_datos - len(MAGIC)):
+                self.compactar()
+                return
+            self._escribir_indice(self._escritura)
+            self._escritura.close()
+            self._escritura = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.cerrar()
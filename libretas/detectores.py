@@ -0,0 +1,228 @@
+# detectores.py
+# Motor de detección por patrones para rellenar las entidades que el modelo no encuentra (validate_and_adjust_entities).
+# Antes había una función detect_* por campo y cada una hacía su re.search sobre el texto entero de la factura;
+# la de provincias además pasaba el texto a minúsculas y hacía un re.search por cada una de las ~60 provincias
+# (y se llamaba dos veces, para la del cliente y la de la comercializadora), y la de fechas se llamaba tres veces
+# con el mismo texto. Aquí todo se compila una sola vez al crear el motor y cada factura se recorre una vez:
+#   - Los patrones de campos van juntos en una sola expresión regular; en cada posición donde empieza alguno se
+#     prueban los campos que pueden empezar ahí, así que salen todas las coincidencias de cada campo con su
+#     posición (la primera de cada campo es la que daba re.search).
+#   - Las provincias (con sus variantes, A Coruña / La Coruña...) se buscan con un autómata de Aho-Corasick sobre
+#     las palabras del texto en minúsculas. Una provincia entre \b ... \b es justo una secuencia de palabras enteras
+#     (rachas de \w) con los mismos separadores, así que sale lo mismo que con las expresiones regulares.
+# Todo lo encontrado en esa pasada (fechas, importes, CP, DNI, CIF, consumos, potencias, direcciones, provincias...)
+# va a un índice de candidatos ordenado por posición, con el segmento (' | ') de cada uno, y los campos se resuelven
+# con consultas sobre él por búsqueda binaria (el primero de un tipo, el siguiente después de una posición, el
+# primero de un segmento) en vez de volver a buscar en el texto.
+
+import re
+from bisect import bisect_left, bisect_right
+from collections import deque, namedtuple
+from fechas import normalizar_fecha
+
+# Patrones de los campos, en el mismo formato que los antiguos detect_*. El valor es el grupo 'valor' si lo hay
+# (el consumo sin el kWh) o toda la coincidencia.
+patrones = {
+    "dni": r'\b\d{8}[A-Z]\b',
+    "cp": r'\b\d{5}\b',
+    "numero_factura": r'\b[A-Z0-9]{10,13}\b',
+    "potencia": r'\b\d{1,2},\d{3}\b',
+    "importe": r'\b\d{1,3},\d{2}\b',
+    "consumo": r'\b(?P<valor>\d{1,4}) kWh\b',
+    "cif": r'\b[ABCDEFGHJNPQRSUVW]\d{7}[0-9A-J]\b',
+    "fecha": r'\b(?:\d{1,4}[\/\-\.]\d{1,2}[\/\-\.]\d{1,4}|\d{8}|\d{1,2}\s+de\s+\w+\s+de\s+\d{4})\b',
+    "direccion": r'\b(?:C\/|Calle|Avenida|Avda\.|Av\.|Plaza|Paseo|Pje\.|Pl\.|Parque|Camino|Carretera|Cami|Urb\.)\s+[\w\s]+(?:,\s*\d+|\s+\d+)?\s*(?:[-ºªA-Za-z0-9\s,]*)?',
+}
+# Qué campos distinguían mayúsculas y minúsculas (los que solo tienen cifras dan igual)
+sin_mayusculas = {"dni", "numero_factura", "consumo", "fecha", "direccion"}
+# Separador de los segmentos del texto de las facturas (cada línea o bloque del PDF)
+separador_segmentos = ' | '
+
+_patron_palabra = re.compile(r'\w+')
+
+# Autómata de Aho-Corasick sobre secuencias de símbolos (aquí, palabras)...
+# Cada patrón es una tupla de símbolos. buscar recorre la secuencia una sola vez y da (fin, patrón) por cada
+# aparición de cada patrón, con fin el índice del último símbolo.
+class AhoCorasick:
+    def __init__(self, patrones):
+        self._hijos = [{}]
+        self._fallo = [0]
+        self._salidas = [[]]
+        self._longitudes = [len(patron) for patron in patrones]
+        for indice, patron in enumerate(patrones):
+            estado = 0
+            for simbolo in patron:
+                if simbolo not in self._hijos[estado]:
+                    self._hijos.append({})
+                    self._fallo.append(0)
+                    self._salidas.append([])
+                    self._hijos[estado][simbolo] = len(self._hijos) - 1
+                estado = self._hijos[estado][simbolo]
+            self._salidas[estado].append(indice)
+
+        # Enlaces de fallo por anchura: el estado del sufijo propio más largo que también es prefijo de algún patrón
+        cola = deque(self._hijos[0].values())
+        while cola:
+            estado = cola.popleft()
+            for simbolo, hijo in self._hijos[estado].items():
+                fallo = self._fallo[estado]
+                while fallo and simbolo not in self._hijos[fallo]:
+                    fallo = self._fallo[fallo]
+                self._fallo[hijo] = self._hijos[fallo].get(simbolo, 0)
+                self._salidas[hijo] = self._salidas[hijo] + self._salidas[self._fallo[hijo]]
+                cola.append(hijo)
+
+    def buscar(self, simbolos):
+        estado = 0
+        hijos, fallo, salidas = self._hijos, self._fallo, self._salidas
+        for fin, simbolo in enumerate(simbolos):
+            while estado and simbolo not in hijos[estado]:
+                estado = fallo[estado]
+            estado = hijos[estado].get(simbolo, 0)
+            for indice in salidas[estado]:
+                yield fin, indice
+
+    def longitud(self, indice):
+        return self._longitudes[indice]
+
+# Un candidato del índice: posición en el texto, tipo (el campo del patrón o 'provincia'), valor y segmento
+Candidato = namedtuple('Candidato', ['inicio', 'fin', 'tipo', 'valor', 'segmento'])
+
+# Índice de los candidatos de una factura...
+# Recibe los candidatos como (inicio, fin, tipo, valor) y los inicios de los segmentos del texto, y a cada candidato
+# le pone su segmento (numerados desde 0). Los candidatos de cada tipo se guardan ordenados por inicio, con la
+# lista de inicios aparte para las búsquedas binarias.
+class IndiceCandidatos:
+    def __init__(self, candidatos, inicios_segmentos):
+        self._inicios_segmentos = inicios_segmentos
+        self._por_tipo = {}
+        for inicio, fin, tipo, valor in sorted(candidatos):
+            self._por_tipo.setdefault(tipo, []).append(Candidato(inicio, fin, tipo, valor, self.segmento(inicio)))
+        self._inicios = {tipo: [candidato.inicio for candidato in lista] for tipo, lista in self._por_tipo.items()}
+
+    # Segmento de una posición del texto
+    def segmento(self, posicion):
+        return bisect_right(self._inicios_segmentos, posicion) - 1
+
+    # Todos los candidatos de un tipo, en orden
+    def de_tipo(self, tipo):
+        return self._por_tipo.get(tipo, [])
+
+    # El primer candidato de un tipo en el texto, o None
+    def primero(self, tipo):
+        lista = self._por_tipo.get(tipo)
+        return lista[0] if lista else None
+
+    # El primer candidato de un tipo que empieza en posicion o después (por ejemplo, el CP después de una dirección)
+    def siguiente(self, tipo, posicion):
+        lista = self._por_tipo.get(tipo)
+        if not lista:
+            return None
+        i = bisect_left(self._inicios[tipo], posicion)
+        return lista[i] if i < len(lista) else None
+
+    # El primer candidato de un tipo dentro de un segmento (por ejemplo, el CIF del bloque de la comercializadora), o None
+    def primero_en_segmento(self, tipo, segmento):
+        if not 0 <= segmento < len(self._inicios_segmentos):
+            return None
+        candidato = self.siguiente(tipo, self._inicios_segmentos[segmento])
+        return candidato if candidato is not None and candidato.segmento == segmento else None
+
+class MotorDetectores:
+    def __init__(self, provincias):
+        self._patrones = {campo: re.compile(patron, re.IGNORECASE if campo in sin_mayusculas else 0)
+                          for campo, patron in patrones.items()}
+        # Una sola expresión con todos los campos, cada uno en su grupo (sin los grupos internos, para que el
+        # grupo que se cierra el último sea siempre el del campo): encuentra las posiciones donde empieza alguno.
+        # Todos empiezan por \b y un carácter de palabra, así que las demás posiciones se descartan enseguida.
+        # Tiene que ser \w y no [A-Z0-9]: \d también acepta cifras de otros alfabetos (２８００１) y [A-Z] sin
+        # distinguir mayúsculas algunas letras que no son ASCII (ſ, K), y los detect_* de antes las encontraban.
+        alternativas = [re.sub(r'\(\?P<\w+>', '(?:', patron) for patron in patrones.values()]
+        self._combinado = re.compile(r'\b(?=\w)(?=' + '|'.join(f"({alternativa})" for alternativa in alternativas) + ')',
+                                     re.IGNORECASE)
+        self._campos = list(self._patrones.items())
+        self.provincias = list(provincias)
+        self._provincias_min = [provincia.lower() for provincia in self.provincias]
+        # Posición de cada provincia en la lista (la primera vez que aparece), para elegir como detect_provincia
+        self._orden_provincias = {}
+        for indice, provincia in enumerate(self.provincias):
+            self._orden_provincias.setdefault(provincia, indice)
+        self._automata = AhoCorasick([tuple(_patron_palabra.findall(provincia)) for provincia in self._provincias_min])
+
+    # Todas las coincidencias de cada campo como (inicio, fin, campo, valor), en orden.
+    # En cada posición la expresión combinada dice el primer campo que empieza ahí (los anteriores no); ese y los
+    # siguientes se comprueban con su propio patrón, que puede distinguir mayúsculas y da el valor.
+    def candidatos(self, text):
+        for posicion in self._combinado.finditer(text):
+            inicio = posicion.start()
+            for campo, patron in self._campos[posicion.lastindex - 1:]:
+                match = patron.match(text, inicio)
+                if match:
+                    valor = match.group('valor') if 'valor' in patron.groupindex else match.group()
+                    yield inicio, match.end(), campo, valor
+
+    # Todas las provincias que aparecen, como (inicio, fin, índice en la lista de provincias), en orden de aparición.
+    # Las posiciones son sobre el texto en minúsculas (casi siempre las mismas que en el original).
+    def provincias_en(self, text):
+        text_min = text.lower()
+        palabras = list(_patron_palabra.finditer(text_min))
+        encontradas = []
+        for fin, indice in self._automata.buscar([palabra.group() for palabra in palabras]):
+            inicio = palabras[fin - self._automata.longitud(indice) + 1].start()
+            final = palabras[fin].end()
+            # Los separadores entre palabras tienen que ser los mismos que en el nombre de la provincia
+            if text_min[inicio:final] == self._provincias_min[indice]:
+                encontradas.append((inicio, final, indice))
+        encontradas.sort()
+        return encontradas
+
+    # Índice con todos los candidatos de la factura (campos y provincias), cada uno con su segmento
+    def indice(self, text):
+        inicios_segmentos = [0]
+        posicion = text.find(separador_segmentos)
+        while posicion != -1:
+            inicios_segmentos.append(posicion + len(separador_segmentos))
+            posicion = text.find(separador_segmentos, posicion + len(separador_segmentos))
+        candidatos = list(self.candidatos(text))
+        candidatos += [(inicio, fin, 'provincia', self.provincias[indice]) for inicio, fin, indice in self.provincias_en(text)]
+        return IndiceCandidatos(candidatos, inicios_segmentos)
+
+    # La provincia que daba detect_provincia: la primera de la lista (no del texto) que aparece
+    def provincia(self, indice):
+        encontradas = indice.de_tipo('provincia')
+        return min((candidato.valor for candidato in encontradas), key=self._orden_provincias.get) if encontradas else ""
+
+    # La fecha que daba detect_fecha (normalizar_fecha con el texto entero): solo hay fecha si todo el texto,
+    # sin los espacios de los lados, es una fecha, es decir, si hay un candidato de fecha que lo ocupa entero.
+    def fecha(self, indice, text):
+        inicio = len(text) - len(text.lstrip())
+        candidato = indice.siguiente('fecha', inicio)
+        if candidato is None or candidato.inicio != inicio or candidato.fin != len(text.rstrip()):
+            return ""
+        return normalizar_fecha(candidato.valor) or ""
+
+    # Todo lo que necesita validate_and_adjust_entities de una pasada: el primer valor de cada campo,
+    # la provincia, la fecha (la misma para los tres campos de fecha) y el CP que va después de la dirección
+    # de la comercializadora, todo sacado del índice.
+    # El nombre del cliente siempre queda vacío: detect_nombre_cliente descartaba los nombres con "letras sueltas"
+    # (letra, espacio, letra), y eso lo cumple el paso de una palabra a otra de cualquier nombre que encontraba.
+    def detectar(self, text):
+        indice = self.indice(text)
+
+        def valor(candidato):
+            return candidato.valor if candidato is not None else ""
+
+        detectado = {campo: valor(indice.primero(campo))
+                     for campo in ("dni", "cp", "numero_factura", "potencia", "importe", "consumo", "direccion")}
+        # El CP de la comercializadora es el primero desde donde aparece por primera vez el texto de la dirección
+        # (como lo buscaba validate_and_adjust_entities), que puede estar antes del candidato si allí no era dirección
+        cp_direccion = ""
+        if detectado["direccion"]:
+            cp_direccion = valor(indice.siguiente("cp", text.find(detectado["direccion"])))
+        detectado.update({
+            "nombre_cliente": "",
+            "provincia": self.provincia(indice),
+            "fecha": self.fecha(indice, text),
+            "cp_direccion": cp_direccion,
+        })
+        return detectado
@@ -0,0 +1,20 @@
+# docbins.py
+# Carga de los DocBin de spaCy con los datos de entrenamiento y validación. Lo usan 03_modelo.py,
+# 04_validacion.py y 032_barrido_hiperparametros.py.
+
+import os
+from spacy.tokens import DocBin
+
+# Función para cargar datos binarios...
+# Cargamos los documentos desde un archivo binario de spaCy (DocBin).
+# data_path puede ser también una carpeta con los shards .spacy de 011_generacion_docbin.py.
+def load_data(data_path, nlp):
+    if os.path.isdir(data_path):
+        paths = [os.path.join(data_path, f) for f in sorted(os.listdir(data_path)) if f.endswith('.spacy')]
+    else:
+        paths = [data_path]
+    docs = []
+    for path in paths:
+        doc_bin = DocBin().from_disk(path)
+        docs.extend(doc_bin.get_docs(nlp.vocab))
+    return docs
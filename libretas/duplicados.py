@@ -0,0 +1,125 @@
+# duplicados.py
+# Detección de documentos casi duplicados entre los documentos generados, con firmas MinHash sobre shingles.
+# Con unas 22 plantillas y listas de valores finitas, muchos documentos generados son casi iguales (misma plantilla
+# y muchos valores repetidos) y entrenar con todos cuesta lo mismo que si fuesen distintos.
+# Cada documento se parte en shingles (grupos de k palabras seguidas) y se resume en una firma MinHash:
+# el porcentaje de posiciones en que coinciden dos firmas estima la similitud de Jaccard entre sus shingles.
+# Para no comparar todos con todos, las firmas se parten en bandas (LSH) y solo se comparan los documentos
+# que coinciden en alguna banda entera. Como los documentos de una misma plantilla se parecen mucho (comparten
+# todo el texto fijo), un documento puede tener cientos de candidatos y alguno pasaría el umbral solo por el error
+# de la estimación: los que lo pasan se confirman con la similitud exacta entre sus shingles.
+# Lo usa 015_deduplicacion.py, entre la generación (01_preprocesamiento.py) y el DocBin (02_entrenamiento.py).
+
+import heapq
+from collections import defaultdict
+import numpy as np
+
+class DetectorDuplicados:
+    # umbral es la similitud de Jaccard estimada a partir de la cual dos documentos son casi duplicados.
+    # Con bandas bandas de num_permutaciones / bandas filas, los pares por encima de umbral coinciden en alguna
+    # banda casi siempre, y los muy distintos casi nunca.
+    def __init__(self, umbral=0.85, num_permutaciones=128, bandas=16, k=5, semilla=1, confirmar=3):
+        self.umbral = umbral
+        self.num_permutaciones = num_permutaciones
+        self.bandas = bandas
+        self.filas = num_permutaciones // bandas
+        self.k = k
+        self.confirmar = confirmar
+        rng = np.random.default_rng(semilla)
+        # Multiplicadores para combinar los k números de palabra de un shingle y para las permutaciones (impares,
+        # con aritmética módulo 2^64: numpy deja que los uint64 desborden)
+        self._pesos = rng.integers(1, 1 << 63, k, dtype=np.uint64) | np.uint64(1)
+        self._a = rng.integers(1, 1 << 63, num_permutaciones, dtype=np.uint64) | np.uint64(1)
+        self._b = rng.integers(0, 1 << 63, num_permutaciones, dtype=np.uint64)
+        self._palabras = {}
+        self._cubetas = [defaultdict(list) for _ in range(bandas)]
+        self._firmas = np.empty((1024, num_permutaciones), dtype=np.uint32)
+        self._num_firmas = 0
+        self._shingles = []
+
+    # Hashes de los shingles de k palabras de un texto. Cada palabra distinta recibe un número (el mismo en todos
+    # los documentos) y cada shingle se combina con numpy a partir de los números de sus k palabras.
+    def shingles(self, texto):
+        palabras = texto.split()
+        numeros = list(map(self._palabras.get, palabras))
+        if None in numeros:
+            for i, palabra in enumerate(palabras):
+                if numeros[i] is None:
+                    numeros[i] = self._palabras.setdefault(palabra, len(self._palabras))
+        numeros = np.array(numeros, dtype=np.uint64)
+        n = max(len(numeros) - self.k + 1, 1)
+        hashes = np.zeros(n, dtype=np.uint64)
+        for j in range(min(self.k, len(numeros))):
+            hashes += numeros[j:j + n] * self._pesos[j]
+        return np.unique(hashes)
+
+    # Firma MinHash: para cada permutación (a * x + b, quedándonos con los 32 bits altos), el mínimo sobre los shingles
+    def firma(self, x):
+        return ((self._a[:, None] * x[None, :] + self._b[:, None]) >> np.uint64(32)).min(axis=1).astype(np.uint32)
+
+    # Si el texto es casi duplicado de alguno de los ya guardados devuelve su número; si no, lo guarda y devuelve None.
+    # Así, de cada grupo de casi duplicados se queda el primero que llega.
+    def duplicado_de(self, texto):
+        x = self.shingles(texto)
+        firma = self.firma(x)
+        claves = [firma[banda * self.filas:(banda + 1) * self.filas].tobytes() for banda in range(self.bandas)]
+        candidatos = set()
+        for cubeta, clave in zip(self._cubetas, claves):
+            candidatos.update(cubeta.get(clave, ()))
+        if candidatos:
+            candidatos = np.array(sorted(candidatos))
+            coincidencias = np.count_nonzero(self._firmas[candidatos] == firma, axis=1)
+            # Confirmamos solo los que mejor estimación tienen (si esos no llegan, los demás tampoco suelen llegar)
+            pasan = np.flatnonzero(coincidencias >= self.umbral * self.num_permutaciones)
+            for candidato in candidatos[pasan[np.argsort(-coincidencias[pasan], kind='stable')[:self.confirmar]]]:
+                comunes = len(np.intersect1d(x, self._shingles[candidato], assume_unique=True))
+                if comunes >= self.umbral * (len(x) + len(self._shingles[candidato]) - comunes):
+                    return int(candidato)
+
+        numero = self._num_firmas
+        if numero == len(self._firmas):
+            self._firmas = np.concatenate([self._firmas, np.empty_like(self._firmas)])
+        self._firmas[numero] = firma
+        self._num_firmas += 1
+        self._shingles.append(x)
+        for cubeta, clave in zip(self._cubetas, claves):
+            cubeta[clave].append(numero)
+        return None
+
+# Elegimos objetivo documentos que cubran lo más posible.
+# El objetivo se reparte a partes iguales entre las plantillas (lo que no use una plantilla con pocos documentos
+# pasa a las demás) y, dentro de cada plantilla, se van cogiendo primero los documentos que traen más valores de
+# entidades que aún no están en la selección. Los documentos mantienen su orden original.
+def seleccionar_diversos(registros, objetivo):
+    por_plantilla = defaultdict(list)
+    for numero, registro in enumerate(registros):
+        por_plantilla[registro.get('plantilla')].append(numero)
+
+    # Cupo de cada plantilla, de la que menos documentos tiene a la que más
+    cupos = {}
+    restantes = objetivo
+    plantillas = sorted(por_plantilla, key=lambda plantilla: len(por_plantilla[plantilla]))
+    for posicion, plantilla in enumerate(plantillas):
+        cupos[plantilla] = min(len(por_plantilla[plantilla]), restantes // (len(plantillas) - posicion))
+        restantes -= cupos[plantilla]
+
+    vistos = set()
+    seleccion = []
+    for plantilla in plantillas:
+        # Selección voraz perezosa: la ganancia de un documento solo puede bajar según se añaden otros
+        valores = {numero: {(label, registros[numero]['text'][start:end]) for start, end, label in registros[numero]['entities']}
+                   for numero in por_plantilla[plantilla]}
+        monticulo = [(-len(valores[numero]), numero) for numero in por_plantilla[plantilla]]
+        heapq.heapify(monticulo)
+        elegidos = 0
+        while monticulo and elegidos < cupos[plantilla]:
+            ganancia, numero = heapq.heappop(monticulo)
+            nueva = len(valores[numero] - vistos)
+            if monticulo and nueva < -monticulo[0][0]:
+                heapq.heappush(monticulo, (-nueva, numero))
+                continue
+            vistos |= valores[numero]
+            seleccion.append(numero)
+            elegidos += 1
+
+    return [registros[numero] for numero in sorted(seleccion)]
@@ -0,0 +1,136 @@
+# entidades.py
+# Extracción de las entidades de una factura a partir de su texto limpio: el modelo spaCy entrenado
+# más las expresiones regulares que ayudan a rellenar y corregir lo que el modelo no encuentra.
+# Lo usan 07_app.py y 10_pipeline.py.
+
+import os
+import re
+from detectores import MotorDetectores
+
+# Categorías de entidades
+# Estas son las etiquetas que el modelo debe reconocer y extraer del texto de las facturas
+categories = [
+    "nombre_cliente", "dni_cliente", "calle_cliente", "cp_cliente", "población_cliente",
+    "provincia_cliente", "nombre_comercializadora", "cif_comercializadora", "dirección_comercializadora",
+    "cp_comercializadora", "población_comercializadora", "provincia_comercializadora", "número_factura",
+    "inicio_periodo", "fin_periodo", "importe_factura", "fecha_cargo", "consumo_periodo", "potencia_contratada"
+]
+
+# Función para elegir el modelo...
+# El modelo ligero solo con el NER que exporta 031_exportacion_ner.py, si es más nuevo que el entrenado.
+# Si 03_modelo.py ha vuelto a entrenar después de exportarlo, el ligero está anticuado: se usa el entrenado y se avisa.
+def elegir_modelo(entrenado='modelo_entrenado', ligero='modelo_ner'):
+    meta_ligero = os.path.join(ligero, 'meta.json')
+    meta_entrenado = os.path.join(entrenado, 'meta.json')
+    if not os.path.exists(meta_ligero):
+        return entrenado
+    if os.path.exists(meta_entrenado) and os.path.getmtime(meta_entrenado) > os.path.getmtime(meta_ligero):
+        print(f"Aviso: '{ligero}' es anterior a '{entrenado}', se usa '{entrenado}' "
+              f"(vuelve a ejecutar 031_exportacion_ner.py para exportar el modelo ligero)")
+        return entrenado
+    return ligero
+
+# Para facilitar la ayuda al modelo, podemos de alguna forma "seleccionar" que datos extraer de los textos
+# que sean más reconocibles mediante expresiones regulares u otras. 
+# Lista de provincias españolas con sus variaciones
+provincias_espanolas = [
+    "Álava", "Araba", "Albacete", "Alicante", "Alacant", "Almería", "Asturias", "Ávila", "Badajoz", 
+    "Baleares", "Illes Balears", "Barcelona", "Burgos", "Cáceres", "Cádiz", "Cantabria", "Castellón", 
+    "Castelló", "Ciudad Real", "Córdoba", "Cuenca", "Gerona", "Girona", "Granada", "Guadalajara", 
+    "Guipúzcoa", "Gipuzkoa", "Huelva", "Huesca", "Jaén", "La Coruña", "A Coruña", "La Rioja", "Las Palmas",
+    "León", "Lleida", "Lugo", "Madrid", "Málaga", "Murcia", "Navarra", "Nafarroa", "Orense", "Ourense", 
+    "Palencia", "Pontevedra", "Salamanca", "Santa Cruz de Tenerife", "Segovia", "Sevilla", "Soria", 
+    "Tarragona", "Teruel", "Toledo", "Valencia", "Valladolid", "Vizcaya", "Bizkaia", "Zamora", "Zaragoza"
+]
+
+# Motor de detección con todos los patrones compilados (ver detectores.py)
+motor = MotorDetectores(provincias_espanolas)
+
+# Función para limpiar el nombre de cliente, algunas veces se cuela la palabra NIF
+def clean_nombre_cliente(nombre):
+    # Eliminar cualquier ocurrencia de NIF o DNI y lo que venga después
+    nombre = re.sub(r'\bNIF\s*\d{8}[A-Z]\b', '', nombre, flags=re.IGNORECASE)
+    nombre = re.sub(r'\bDNI\s*\d{8}[A-Z]\b', '', nombre, flags=re.IGNORECASE)
+    # Eliminar caracteres no deseados
+    nombre = re.sub(r'[^\w\sÁÉÍÓÚÑáéíóúñ]', '', nombre)
+    # Eliminar espacios extra
+    nombre = re.sub(r'\s+', ' ', nombre).strip()
+    return nombre
+
+# Función para validar y ajustar entidades según patrones conocidos
+# Todos los patrones se buscan de una pasada con el motor de detectores.py.
+def validate_and_adjust_entities(entities, text):
+    # Detectar patrones en el texto
+    detectado = motor.detectar(text)
+    detected_entities = {
+        "dni_cliente": detectado["dni"],
+        "cp_cliente": detectado["cp"],
+        "nombre_cliente": detectado["nombre_cliente"],
+        "provincia_cliente": detectado["provincia"],
+        "provincia_comercializadora": detectado["provincia"],
+        "número_factura": detectado["numero_factura"],
+        "potencia_contratada": detectado["potencia"],
+        "importe_factura": detectado["importe"],
+        "inicio_periodo": detectado["fecha"],
+        "fin_periodo": detectado["fecha"],
+        "fecha_cargo": detectado["fecha"],
+        "consumo_periodo": detectado["consumo"],
+        "dirección_comercializadora": detectado["direccion"]
+    }
+
+    # Ajustar entidades extraídas con las detectadas por patrones
+    for key in detected_entities:
+        if not entities[key] and detected_entities[key]:
+            entities[key] = detected_entities[key]
+
+    # Validar y ajustar el CP de la comercializadora... para que no coja el del cliente
+    # (el primer CP que hay a partir de la dirección de la comercializadora)
+    if detectado["cp_direccion"]:
+        entities["cp_comercializadora"] = detectado["cp_direccion"]
+
+    # Limpiar el nombre del cliente
+    entities["nombre_cliente"] = clean_nombre_cliente(entities["nombre_cliente"])
+    
+    return entities
+
+# Función para procesar el texto y extraer las entities...
+# Esta función utiliza el modelo spaCy que le pasamos para extraer entidades específicas del texto de las facturas
+# Si se le pasa texto_ner (por ejemplo solo los bloques relevantes del modo maquetación), el modelo se aplica
+# solo sobre ese texto; los patrones de validación siguen mirando el texto completo.
+# Para muchas facturas es mucho más rápido extract_entities_batch.
+def extract_entities(nlp, text, texto_ner=None):
+    for _, entities in extract_entities_batch(nlp, [(None, text, texto_ner)]):
+        return entities
+
+# Lo mismo que extract_entities para muchas facturas a la vez...
+# facturas da tuplas (clave, text, texto_ner) y se devuelven (clave, entities) en el mismo orden, según se van
+# terminando. En vez de pasar el modelo segmento a segmento (una llamada a nlp por cada línea ' | ' de cada factura),
+# se juntan los segmentos de facturas_por_lote facturas y se pasan todos con nlp.pipe en lotes de batch_size.
+# Los segmentos repetidos (los textos fijos de las plantillas se repiten en muchas facturas) se pasan una sola vez.
+# Como antes, en cada categoría se queda la primera entidad que aparece, recorriendo los segmentos en orden.
+def extract_entities_batch(nlp, facturas, facturas_por_lote=32, batch_size=256):
+    lote = []
+    for factura in facturas:
+        lote.append(factura)
+        if len(lote) == facturas_por_lote:
+            yield from _extract_entities_lote(nlp, lote, batch_size)
+            lote = []
+    if lote:
+        yield from _extract_entities_lote(nlp, lote, batch_size)
+
+def _extract_entities_lote(nlp, lote, batch_size):
+    segmentos = [(text if texto_ner is None else texto_ner).split(' | ') for _, text, texto_ner in lote]
+    unicos = list(dict.fromkeys(segment for segments in segmentos for segment in segments))
+    ents_segmento = {segment: [(ent.label_, ent.text) for ent in doc.ents]
+                     for segment, doc in zip(unicos, nlp.pipe(unicos, batch_size=batch_size))}
+
+    for (clave, text, _), segments in zip(lote, segmentos):
+        entities = {category: "" for category in categories}
+        for segment in segments:
+            for label, ent_text in ents_segmento[segment]:
+                if label in categories and not entities[label]:
+                    entities[label] = ent_text
+
+        # Validar y ajustar las entities extraídas
+        entities = validate_and_adjust_entities(entities, text)
+        yield clave, entities
@@ -0,0 +1,118 @@
+# extraccion.py
+# Funciones de extracción y limpieza del texto de las facturas en PDF.
+# Las usan 06_extraccion_pdf.py (que guarda los textos) y 10_pipeline.py (que va directamente de PDF a JSON),
+# así las dos formas de procesar las facturas aplican exactamente las mismas reglas.
+
+import io
+import re
+from fechas import normalizar_fecha
+from fuentes import abrir_fitz, leer_bytes
+from limpieza import MotorLimpieza
+from maquetacion import extraer_maquetacion, texto_relevante
+
+# Función para extraer texto de un PDF usando PyMuPDF (fitz)
+# Abrimos el PDF y extraemos el texto de cada página.
+# El PDF puede ser una ruta o su contenido en bytes (por ejemplo leído de un zip, ver fuentes.py).
+# Unimos el texto de todas las páginas de una sola vez con join, en vez de ir haciendo
+# text += ..., que copia todo el texto acumulado en cada página.
+def _texto_fitz(pdf):
+    with abrir_fitz(pdf) as doc:
+        return ''.join(page.get_text("text") for page in doc)
+
+# Las otras librerías de requirements.txt. Se importan dentro de cada función para que solo
+# haga falta tener instalada la que se vaya a usar.
+def _como_archivo(pdf):
+    return io.BytesIO(pdf) if isinstance(pdf, (bytes, bytearray)) else pdf
+
+def _texto_pdfminer(pdf):
+    from pdfminer.high_level import extract_text
+    return extract_text(_como_archivo(pdf))
+
+def _texto_pdfplumber(pdf):
+    import pdfplumber
+    with pdfplumber.open(_como_archivo(pdf)) as documento:
+        return '\n'.join(page.extract_text() or '' for page in documento.pages)
+
+def _texto_pypdfium2(pdf):
+    import pypdfium2 as pdfium
+    documento = pdfium.PdfDocument(pdf)
+    try:
+        return '\n'.join(page.get_textpage().get_text_range().replace('\r\n', '\n') for page in documento)
+    finally:
+        documento.close()
+
+# Librerías disponibles para sacar el texto de los PDFs. Como avisa el README, no todas dan el mismo texto,
+# así que con 11_benchmark_backends.py se puede comparar cuál es más rápida sin perder campos.
+backends = {
+    'fitz': _texto_fitz,
+    'pdfminer': _texto_pdfminer,
+    'pdfplumber': _texto_pdfplumber,
+    'pypdfium2': _texto_pypdfium2,
+}
+
+def extract_text_from_pdf(pdf, backend='fitz'):
+    return backends[backend](pdf)
+
+# Expresiones regulares para encontrar fechas en varios formatos, compiladas una sola vez
+date_patterns = [re.compile(pattern, re.IGNORECASE) for pattern in (
+    r'\b(\d{1,2})[\/\-\.](\d{1,2})[\/\-\.](\d{2,4})\b',  # Formatos: 15/09/2024, 15-01-21, 15.01.21
+    r'\b(\d{2,4})[\/\-\.](\d{1,2})[\/\-\.](\d{1,2})\b',  # Formato: 2024/09/17, 2024-09-17, 2024.09.17
+    r'\b(\d{8})\b',                                      # Formato: 27092018
+    r'\b(\d{1,2})\s+de\s+(\w+)\s+de\s+(\d{4})\b',         # Formato: 2 de octubre de 1991
+)]
+
+# Cada fecha encontrada se pasa a dd/mm/yyyy con normalizar_fecha (ver fechas.py); si no es una fecha válida se deja como está
+def replace_date(match):
+    date_str = match.group()
+    return normalizar_fecha(date_str, "%d/%m/%Y") or date_str
+
+# Función para normalizar fechas
+def normalize_dates(text):
+    for pattern in date_patterns:
+        text = pattern.sub(replace_date, text)
+    return text
+
+# Motor con las reglas de limpieza, compilado una sola vez (ver limpieza.py):
+# URLs, secuencias de puntos y de espacios, valores placeholder x,xx, números de página, puntos y comas solitarios
+# y caracteres no deseados (mantenemos números, letras, puntos, comas, € y guiones, y el símbolo |).
+motor_limpieza = MotorLimpieza(conservar='.,€|-', marcadores=(r'\b(?:x,xx|página \d+)\b',))
+
+# Función para limpiar el texto
+# Aplicamos varias reglas de limpieza para preparar el texto extraído.
+def clean_text(text):
+    return motor_limpieza.limpiar(text)
+
+# Pasos de limpieza que se aplican al texto en bruto de una factura.
+def preparar_texto(text):
+    # 2. Reemplazar saltos de línea con el símbolo |
+    text = text.replace('\n', ' | ')
+
+    # 3. Limpiar el texto
+    text = clean_text(text)
+
+    # 4. Normalizar las fechas en el texto
+    text = normalize_dates(text)
+
+    return text
+
+# Función que procesa una factura completa: extracción, limpieza y normalización de fechas.
+# Es la que ejecuta cada proceso en el modo paralelo, así todo el trabajo pesado
+# (fitz, clean_text y normalize_dates) se hace dentro del worker y escala con los núcleos.
+def procesar_pdf(pdf, backend='fitz'):
+    # 1. Extraer texto del PDF
+    text = extract_text_from_pdf(pdf, backend)
+
+    return preparar_texto(text)
+
+# Igual que procesar_pdf pero a partir de una referencia de fuentes.py (ruta o miembro de un zip).
+# Es lo que se manda a los procesos, y así el PDF se lee dentro del propio worker.
+def procesar_referencia(referencia, backend='fitz'):
+    return procesar_pdf(leer_bytes(referencia), backend)
+
+# Igual que procesar_pdf pero en modo maquetación (ver maquetacion.py): extraemos las palabras con su posición
+# y devolvemos el texto completo limpio y, aparte, el texto limpio solo de los bloques relevantes para el NER.
+def procesar_pdf_maquetacion(pdf):
+    maquetacion = extraer_maquetacion(pdf)
+    text = preparar_texto(maquetacion.texto_completo())
+    texto_ner = preparar_texto(texto_relevante(maquetacion))
+    return text, texto_ner
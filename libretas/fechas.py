@@ -0,0 +1,101 @@
+# fechas.py
+# Normalizador de fechas hecho a medida para las facturas, para no tener que llamar a dateutil.parser.parse.
+# dateutil prueba decenas de formatos en cada llamada y se le llamaba por cada fecha de cada texto
+# (normalize_dates), cuatro veces por campo de fecha y documento en 08_medicion.py y 09_levenshtein.py,
+# y con el texto entero de la factura en detect_fecha.
+# Aquí solo reconocemos los formatos que aparecen en las facturas:
+#   - dd/mm/yyyy, dd-mm-yy, dd.mm.yy...  (día, mes y año separados por / - .)
+#   - yyyy-mm-dd, yyyy/mm/dd, yyyy.mm.dd
+#   - ddmmyyyy (y yyyymmdd, que es lo que entendía dateutil)
+#   - "2 de octubre de 1991", con los meses en español
+# Para los formatos numéricos seguimos las mismas reglas que dateutil con dayfirst=True (qué número es el día,
+# cuál el mes y cuál el año, y cómo se completan los años de dos cifras), así que el resultado es el mismo.
+# Como las mismas fechas se repiten muchísimo entre facturas, los resultados se guardan en una caché LRU.
+
+import re
+import time
+from datetime import date
+from functools import lru_cache
+
+# Meses en español
+meses = {
+    'enero': 1, 'febrero': 2, 'marzo': 3, 'abril': 4, 'mayo': 5, 'junio': 6, 'julio': 7, 'agosto': 8,
+    'septiembre': 9, 'setiembre': 9, 'octubre': 10, 'noviembre': 11, 'diciembre': 12,
+}
+
+_patron_numerica = re.compile(r'(\d{1,4})([\/\-\.])(\d{1,2})([\/\-\.])(\d{1,4})')
+_patron_ocho_cifras = re.compile(r'\d{8}')
+_patron_texto = re.compile(r'(\d{1,2})\s+de\s+(\w+)\s+de\s+(\d{4})', re.IGNORECASE)
+
+# Las fechas más largas que reconocemos ("30 de septiembre de 2018") caben de sobra; con más texto no hay fecha
+_longitud_maxima = 64
+
+# Año de dos cifras: dateutil lo pone en el siglo actual, salvo que quede a más de 50 años de este año
+def _completar_anio(anio):
+    actual = time.localtime().tm_year
+    anio += actual // 100 * 100
+    if anio >= actual + 50:
+        anio -= 100
+    elif anio < actual - 50:
+        anio += 100
+    return anio
+
+# Decide cuál de los tres números es el día, el mes y el año como dateutil con dayfirst=True.
+# Un número de más de 2 cifras es el año; si hay dos así, no es una fecha.
+def _dia_mes_anio(cifras):
+    largos = [i for i, c in enumerate(cifras) if len(c) > 2]
+    if len(largos) > 1:
+        return None
+    a, b, c = (int(x) for x in cifras)
+    if a > 31 or largos == [0]:
+        # 2024-17-09 o 2024-09-07: dateutil pone el día delante del mes si el último número puede ser un mes
+        anio, dia, mes = (a, b, c) if c <= 12 else (a, c, b)
+    elif a > 12 or b <= 12:
+        dia, mes, anio = a, b, c
+    else:
+        mes, dia, anio = a, b, c
+    if not largos:
+        anio = _completar_anio(anio)
+    return dia, mes, anio
+
+def _es_valida(dia, mes, anio):
+    try:
+        date(anio, mes, dia)
+        return True
+    except ValueError:
+        return False
+
+def _fecha(texto):
+    m = _patron_numerica.fullmatch(texto)
+    # Con puntos tienen que ser puntos los dos separadores; / y - sí se pueden mezclar (igual que en dateutil)
+    if m and (m.group(2) == '.') == (m.group(4) == '.'):
+        return _dia_mes_anio(m.group(1, 3, 5))
+    if _patron_ocho_cifras.fullmatch(texto):
+        # Primero ddmmyyyy (con un año razonable, para no convertir cualquier número de 8 cifras en una fecha);
+        # si no, yyyymmdd como lo leía dateutil
+        dia, mes, anio = int(texto[:2]), int(texto[2:4]), int(texto[4:])
+        if 1900 <= anio < 2100 and _es_valida(dia, mes, anio):
+            return dia, mes, anio
+        return _dia_mes_anio((texto[:4], texto[4:6], texto[6:]))
+    m = _patron_texto.fullmatch(texto)
+    if m and m.group(2).lower() in meses:
+        return int(m.group(1)), meses[m.group(2).lower()], int(m.group(3))
+    return None
+
+@lru_cache(maxsize=65536)
+def _normalizar(texto, formato):
+    partes = _fecha(texto)
+    if partes is None:
+        return None
+    dia, mes, anio = partes
+    try:
+        return date(anio, mes, dia).strftime(formato)
+    except ValueError:
+        return None
+
+# Devuelve la fecha en el formato indicado, o None si el texto no es una fecha (o no es una fecha válida).
+def normalizar_fecha(texto, formato="%d.%m.%Y"):
+    texto = texto.strip()
+    if len(texto) > _longitud_maxima:
+        return None
+    return _normalizar(texto, formato)
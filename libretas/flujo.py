@@ -0,0 +1,75 @@
+# flujo.py
+# Flujo infinito de documentos sintéticos para entrenar sin generar antes un conjunto fijo en disco.
+# Las plantillas y los valores de json_categoria dan para tantos documentos como queramos: en vez de escribir
+# 10.000-20.000 documentos y entrenar siempre con los mismos, los generamos según los va pidiendo el entrenamiento,
+# así que cada iteración ve datos nuevos y no ocupan nada en disco.
+# Los documentos salen por shards, con la misma semilla por shard que en la generación a disco (ver generacion.py),
+# así que el flujo es reproducible. Los documentos de validación (es_validacion) no salen nunca en el flujo de
+# entrenamiento: con la misma semilla, los de validación de 011_generacion_docbin.py no se ven al entrenar.
+# La generación (y la preparación de cada documento para el modelo, preparar) va en procesos en segundo plano
+# que trabajan unos shards por delante del entrenamiento, para que nunca tenga que esperar a los datos.
+# Lo usan lector_flujo.py (lector de corpus de spaCy para 03_modelo.py) y bert/flujo_roberta.py.
+
+import itertools
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from generacion import cargar_datos_json, cargar_plantillas, es_validacion, generar_shard
+from valores import cargar_valores, compilar_valores
+
+# Documentos de un shard, solo los de entrenamiento o solo los de validación
+def documentos_shard(plantillas, datos_json, shard, docs_por_shard, semilla, validacion=False):
+    for i, _, texto, entities in generar_shard(plantillas, datos_json, shard, (shard + 1) * docs_por_shard, docs_por_shard, semilla):
+        if es_validacion(i) == validacion:
+            yield texto, entities
+
+# Flujo infinito de documentos, shard detrás de shard, empezando en shard_inicial y saltando de paso en paso
+# (así varios procesos pueden repartirse el flujo sin repetir documentos: el proceso k de n empieza en k con paso n).
+def flujo_documentos(plantillas, datos_json, semilla, docs_por_shard=1000, shard_inicial=0, paso=1, validacion=False):
+    for shard in itertools.count(shard_inicial, paso):
+        yield from documentos_shard(plantillas, datos_json, shard, docs_por_shard, semilla, validacion)
+
+# Datos de cada proceso en segundo plano: plantillas compiladas, valores de los JSON y la función que prepara cada documento.
+# Se cargan una sola vez por proceso, al arrancarlo. Con valores_dir, los valores se abren en formato compacto
+# y compartido entre procesos (ver valores.py), con el muestreo estratificado que se indique.
+_contexto = {}
+
+def iniciar_flujo(plantillas_dir, json_dir, json_files, preparar, normalizar=None, valores_dir=None, muestreo=None):
+    if valores_dir is None:
+        _contexto['datos_json'] = cargar_datos_json(json_dir, json_files)
+    else:
+        _contexto['datos_json'] = cargar_valores(valores_dir, json_files, muestreo)
+    _contexto['plantillas'] = cargar_plantillas(plantillas_dir, json_files, normalizar)
+    _contexto['preparar'] = preparar
+
+# Genera y prepara los documentos de entrenamiento de un shard (en un proceso en segundo plano)
+def preparar_shard(shard, docs_por_shard, semilla):
+    preparar = _contexto['preparar']
+    return [preparar(texto, entities) for texto, entities in
+            documentos_shard(_contexto['plantillas'], _contexto['datos_json'], shard, docs_por_shard, semilla)]
+
+# Flujo infinito de documentos preparados, generados en num_workers procesos en segundo plano.
+# preparar(texto, entities) tiene que ser una función de módulo (se manda a los procesos) y devolver algo que se
+# pueda pasar entre procesos. Se mantienen por_delante shards pedidos, y los documentos salen en orden de shard,
+# así que el flujo es el mismo con cualquier número de procesos. Con num_workers=0 se genera en este mismo proceso.
+def flujo_en_segundo_plano(plantillas_dir, json_dir, json_files, preparar, semilla, docs_por_shard=1000,
+                           num_workers=2, por_delante=4, shard_inicial=0, normalizar=None, valores_dir=None, muestreo=None):
+    shards = itertools.count(shard_inicial)
+    if valores_dir is not None:
+        compilar_valores(json_dir, json_files, valores_dir)
+    if num_workers == 0:
+        iniciar_flujo(plantillas_dir, json_dir, json_files, preparar, normalizar, valores_dir, muestreo)
+        for shard in shards:
+            yield from preparar_shard(shard, docs_por_shard, semilla)
+
+    executor = ProcessPoolExecutor(max_workers=num_workers, initializer=iniciar_flujo,
+                                   initargs=(plantillas_dir, json_dir, json_files, preparar, normalizar, valores_dir, muestreo))
+    try:
+        pendientes = deque(executor.submit(preparar_shard, next(shards), docs_por_shard, semilla)
+                           for _ in range(max(por_delante, num_workers)))
+        while True:
+            documentos = pendientes.popleft().result()
+            pendientes.append(executor.submit(preparar_shard, next(shards), docs_por_shard, semilla))
+            yield from documentos
+    finally:
+        # Al dejar de leer el flujo (o si falla el entrenamiento) cancelamos lo que quede pendiente
+        executor.shutdown(wait=False, cancel_futures=True)
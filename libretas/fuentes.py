@@ -0,0 +1,67 @@
+# fuentes.py
+# Lectura de las facturas (PDF) y de los JSON originales tanto desde una carpeta como directamente desde
+# uno o varios .zip (por ejemplo training.zip), sin descomprimirlos en disco.
+# Descomprimir cientos de miles de archivos pequeños se lleva una buena parte del tiempo de cada ejecución,
+# así que los miembros del zip se leen en memoria y se le pasan a fitz con fitz.open(stream=...).
+# Un origen puede ser la ruta de una carpeta, la de un .zip o una lista de ellas.
+
+import json
+import os
+import zipfile
+import fitz  # PyMuPDF
+
+# Zips abiertos en este proceso, para no leer el índice del zip en cada factura.
+# La clave lleva el pid porque con fork los procesos hijos heredan el diccionario, y si compartieran
+# el mismo archivo abierto se pisarían la posición de lectura unos a otros.
+_zips_abiertos = {}
+
+def es_zip(ruta):
+    return ruta.lower().endswith('.zip')
+
+def _zip(ruta):
+    clave = (os.getpid(), ruta)
+    if clave not in _zips_abiertos:
+        _zips_abiertos[clave] = zipfile.ZipFile(ruta)
+    return _zips_abiertos[clave]
+
+# Recorremos los archivos con una extensión dada de todos los orígenes, en orden de nombre dentro de cada origen.
+# Devuelve pares (nombre del archivo, referencia). La referencia es la ruta del archivo si está en una carpeta,
+# o (ruta del zip, nombre del miembro) si está dentro de un zip. Es pequeña y se puede mandar a otros procesos,
+# que leen el contenido cuando les toca con leer_bytes.
+# Los resultados se guardan con el nombre del archivo, así que si dos archivos se llaman igual (en subcarpetas
+# distintas de un zip o en orígenes distintos) se da un error en vez de que uno pise al otro.
+def recorrer(origenes, extension):
+    if isinstance(origenes, str):
+        origenes = [origenes]
+    vistos = {}
+    for origen in origenes:
+        if es_zip(origen):
+            archivos = sorted((os.path.basename(info.filename), (origen, info.filename))
+                              for info in _zip(origen).infolist()
+                              if not info.is_dir() and not info.filename.startswith('__MACOSX')
+                              and info.filename.endswith(extension))
+        else:
+            archivos = [(nombre, os.path.join(origen, nombre))
+                        for nombre in sorted(os.listdir(origen)) if nombre.endswith(extension)]
+        for nombre, referencia in archivos:
+            if nombre in vistos:
+                raise ValueError(f"Hay dos archivos con el nombre {nombre}: {vistos[nombre]} y {referencia}")
+            vistos[nombre] = referencia
+            yield nombre, referencia
+
+# Contenido de un archivo a partir de su referencia
+def leer_bytes(referencia):
+    if isinstance(referencia, str):
+        with open(referencia, 'rb') as f:
+            return f.read()
+    ruta_zip, miembro = referencia
+    return _zip(ruta_zip).read(miembro)
+
+def leer_json(referencia):
+    return json.loads(leer_bytes(referencia).decode('utf-8'))
+
+# Abrimos un PDF con fitz tanto si es una ruta como si es su contenido en bytes
+def abrir_fitz(pdf):
+    if isinstance(pdf, (bytes, bytearray)):
+        return fitz.open(stream=pdf, filetype='pdf')
+    return fitz.open(pdf)
@@ -0,0 +1,132 @@
+# generacion.py
+# Generación de documentos de entrenamiento a partir de las plantillas (plantilla_*.txt) y de los valores
+# de json_categoria. Lo usan libretas/01_preprocesamiento.py y bert/01_preprocesamiento.py.
+# Antes, para cada documento se volvía a abrir y leer la plantilla, se buscaba cada placeholder con find
+# y se iba cortando y pegando el texto, corrigiendo las posiciones de las entidades en cada sustitución.
+# Ahora cada plantilla se compila una sola vez en una lista de trozos de texto fijo y huecos (placeholders),
+# y un documento se monta con un único join, calculando las posiciones de las entidades según se avanza.
+
+import hashlib
+import json
+import os
+import random
+import re
+
+# Diccionario de placeholders: cada placeholder de las plantillas con la etiqueta de la entidad y el archivo JSON
+# (en json_categoria) del que salen sus valores. Es el mismo en libretas y en bert.
+json_files = {
+    "placeholder_01": "nombre_cliente",
+    "placeholder_02": "dni_cliente",
+    "placeholder_03": "calle_cliente",
+    "placeholder_04": "cp_cliente",
+    "placeholder_05": "poblacion_cliente",
+    "placeholder_06": "provincia_cliente",
+    "placeholder_07": "nombre_comercializadora",
+    "placeholder_08": "cif_comercializadora",
+    "placeholder_09": "direccion_comercializadora",
+    "placeholder_10": "cp_comercializadora",
+    "placeholder_11": "poblacion_comercializadora",
+    "placeholder_12": "provincia_comercializadora",
+    "placeholder_13": "numero_factura",
+    "placeholder_14": "inicio_periodo",
+    "placeholder_15": "fin_periodo",
+    "placeholder_16": "importe_factura",
+    "placeholder_17": "fecha_cargo",
+    "placeholder_18": "consumo_periodo",
+    "placeholder_19": "potencia_contratada",
+}
+
+# Cargamos los valores de cada placeholder desde su archivo JSON
+def cargar_datos_json(json_dir, json_files):
+    datos = {}
+    for placeholder, key in json_files.items():
+        with open(os.path.join(json_dir, f"{key}.json"), 'r', encoding='utf-8') as f:
+            datos[placeholder] = json.load(f)
+    return datos
+
+class Plantilla:
+    def __init__(self, nombre, literales, huecos):
+        self.nombre = nombre
+        self.literales = literales  # texto fijo antes de cada hueco y al final (len(huecos) + 1 trozos)
+        self.huecos = huecos        # (placeholder, etiqueta) de cada hueco, en el orden en que aparecen
+
+    def __len__(self):
+        return len(self.huecos)
+
+# Expresión que encuentra cualquiera de los placeholders (los más largos primero, por si uno es prefijo de otro)
+def patron_placeholders(json_files):
+    return re.compile('|'.join(re.escape(p) for p in sorted(json_files, key=len, reverse=True)))
+
+# Partimos el texto de la plantilla en trozos fijos y huecos
+def compilar_plantilla(nombre, texto, json_files, patron=None):
+    patron = patron or patron_placeholders(json_files)
+    literales = []
+    huecos = []
+    ultimo = 0
+    for m in patron.finditer(texto):
+        literales.append(texto[ultimo:m.start()])
+        huecos.append((m.group(), json_files[m.group()]))
+        ultimo = m.end()
+    literales.append(texto[ultimo:])
+    return Plantilla(nombre, literales, huecos)
+
+# Leemos y compilamos todas las plantillas de la carpeta una sola vez, ordenadas por nombre.
+# normalizar se aplica al texto de cada plantilla antes de compilarla (por ejemplo normalizar_texto en bert).
+def cargar_plantillas(plantillas_dir, json_files, normalizar=None):
+    patron = patron_placeholders(json_files)
+    plantillas = []
+    for plantilla_file in sorted(f for f in os.listdir(plantillas_dir) if f.endswith('.txt')):
+        with open(os.path.join(plantillas_dir, plantilla_file), 'r', encoding='utf-8') as f:
+            texto = f.read()
+        if normalizar is not None:
+            texto = normalizar(texto)
+        plantillas.append(compilar_plantilla(plantilla_file, texto, json_files, patron))
+    return plantillas
+
+# Montamos un documento: cada hueco se rellena con un valor al azar de su categoría (rng.choice)
+# y la entidad se guarda como [inicio, fin, etiqueta] con las posiciones en el texto final.
+def generar_texto(plantilla, datos_json, rng):
+    partes = []
+    entities = []
+    posicion = 0
+    for literal, (placeholder, key) in zip(plantilla.literales, plantilla.huecos):
+        valor = rng.choice(datos_json[placeholder])
+        partes.append(literal)
+        partes.append(valor)
+        posicion += len(literal)
+        entities.append([posicion, posicion + len(valor), key])
+        posicion += len(valor)
+    partes.append(plantilla.literales[-1])
+    return ''.join(partes), entities
+
+# Generación por shards...
+# Los documentos se reparten en shards de docs_por_shard documentos (el shard k tiene los documentos
+# k * docs_por_shard ... (k + 1) * docs_por_shard - 1). Cada shard usa su propio generador de números
+# aleatorios con una semilla sacada de (semilla global, número de shard), así que el resultado es
+# exactamente el mismo se generen con un proceso, con todos los núcleos o repartidos entre varias máquinas.
+
+# Semilla de un shard a partir de la semilla global
+def semilla_shard(semilla, shard):
+    return int.from_bytes(hashlib.sha256(f"{semilla}:{shard}".encode('utf-8')).digest()[:8], 'little')
+
+def num_shards(num_docs, docs_por_shard):
+    return (num_docs + docs_por_shard - 1) // docs_por_shard
+
+# Shards que le tocan a una máquina cuando se reparte la generación entre num_maquinas.
+# Son un bloque seguido, así que juntando lo de cada máquina en orden sale lo mismo que en una sola.
+def shards_de_maquina(num_docs, docs_por_shard, maquina=0, num_maquinas=1):
+    total = num_shards(num_docs, docs_por_shard)
+    return list(range(total * maquina // num_maquinas, total * (maquina + 1) // num_maquinas))
+
+# Genera los documentos de un shard. Devuelve (índice global del documento, plantilla usada, texto, entidades).
+def generar_shard(plantillas, datos_json, shard, num_docs, docs_por_shard, semilla):
+    rng = random.Random(semilla_shard(semilla, shard))
+    for i in range(shard * docs_por_shard, min(num_docs, (shard + 1) * docs_por_shard)):
+        plantilla = rng.choice(plantillas)
+        texto, entities = generar_texto(plantilla, datos_json, rng)
+        yield i, plantilla, texto, entities
+
+# Reparto entre entrenamiento y validación (80%-20%) por el número de documento: uno de cada cada_validacion va a
+# validación. Va por el número y no al azar para que el reparto sea el mismo se genere como se genere.
+def es_validacion(i, cada_validacion=5):
+    return i % cada_validacion == cada_validacion - 1
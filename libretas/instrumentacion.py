@@ -0,0 +1,65 @@
+# instrumentacion.py
+# Medición de los entrenamientos: velocidad, tiempo por componente, memoria, tiempo de evaluación y tiempo restante.
+# Los entrenamientos (03_modelo.py y bert/04_entrenamiento.py) solo sacaban las pérdidas, y con ejecuciones de
+# decenas de horas no se puede saber qué ajustar sin medir. RegistroEntrenamiento apunta una línea JSON por
+# iteración (o cada pocos pasos) en un archivo de logs/, que luego resume y dibuja 13_resumen_entrenamiento.py.
+# La primera línea del archivo es una cabecera con el tipo de entrenamiento, la unidad de la velocidad y la configuración.
+
+import os
+import sys
+import json
+import time
+
+# Memoria máxima (RSS) del proceso actual en MB
+def memoria_pico_mb():
+    if sys.platform == 'win32':
+        import psutil
+        return psutil.Process().memory_info().peak_wset / 1024 ** 2
+    import resource
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # En macOS viene en bytes y en Linux en KB
+    return pico / 1024 ** 2 if sys.platform == 'darwin' else pico / 1024
+
+class RegistroEntrenamiento:
+    # entrenamiento es el nombre del archivo (se le añade la fecha y hora), unidad lo que se cuenta para la
+    # velocidad (palabras, tokens...) y total el número de iteraciones o pasos previstos, para el tiempo restante.
+    def __init__(self, carpeta, entrenamiento, unidad, total=None, config=None):
+        os.makedirs(carpeta, exist_ok=True)
+        self.ruta = os.path.join(carpeta, f"{entrenamiento}_{time.strftime('%Y%m%d_%H%M%S')}.jsonl")
+        self.total = total
+        self._inicio = time.perf_counter()
+        self._archivo = open(self.ruta, 'w', encoding='utf-8')
+        self._escribir({"entrenamiento": entrenamiento, "unidad": unidad, "total": total,
+                        "inicio": time.strftime('%Y-%m-%d %H:%M:%S'), "config": config or {}})
+
+    # Cada línea se escribe y se vuelca al momento, para poder mirar el log mientras se entrena
+    def _escribir(self, registro):
+        self._archivo.write(json.dumps(registro, ensure_ascii=False) + '\n')
+        self._archivo.flush()
+
+    # Apuntamos una iteración o paso n: cuántas unidades se han procesado y en cuánto tiempo (sin contar la evaluación),
+    # el tiempo de cada componente, las pérdidas y, si se ha evaluado, cuánto ha tardado y las métricas.
+    # El tiempo restante es lo que se lleva por iteración o paso (contando evaluaciones y carga de datos) por los que faltan.
+    def apuntar(self, n, unidades, duracion, componentes=None, perdidas=None, evaluacion_s=None, metricas=None, **extra):
+        tiempo = time.perf_counter() - self._inicio
+        registro = {
+            "n": n,
+            "tiempo_s": round(tiempo, 3),
+            "duracion_s": round(duracion, 3),
+            "unidades": unidades,
+            "velocidad": round(unidades / duracion, 1) if duracion > 0 else None,
+            "componentes_s": {nombre: round(segundos, 3) for nombre, segundos in (componentes or {}).items()},
+            # Las pérdidas de spaCy vienen como floats de numpy, que json no sabe escribir
+            "perdidas": {nombre: round(float(perdida), 4) for nombre, perdida in (perdidas or {}).items()},
+            "rss_pico_mb": round(memoria_pico_mb(), 1),
+            "evaluacion_s": None if evaluacion_s is None else round(evaluacion_s, 3),
+            "metricas": metricas or {},
+            **extra,
+        }
+        if self.total is not None and n > 0:
+            registro["restante_s"] = round(max(self.total - n, 0) * tiempo / n, 1)
+        self._escribir(registro)
+        return registro
+
+    def cerrar(self):
+        self._archivo.close()
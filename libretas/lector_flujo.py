@@ -0,0 +1,60 @@
+# lector_flujo.py
+# Lector de corpus de spaCy que da un flujo infinito de ejemplos (Example) generados según se piden (ver flujo.py).
+# Está registrado como "facturas.flujo_sintetico.v1", así que se puede usar en 03_modelo.py o en la config de
+# spacy train (con --code libretas/lector_flujo.py y max_epochs = -1, que es como spaCy entrena con corpus infinitos):
+#
+#   [corpora.train]
+#   @readers = "facturas.flujo_sintetico.v1"
+#   plantillas_dir = "libretas/plantillas/"
+#   json_dir = "libretas/json_categoria/"
+#
+# En los procesos en segundo plano cada documento se tokeniza con un spaCy en blanco en español (el mismo
+# tokenizador que los modelos es_core_news) y las entidades se pasan a etiquetas IOB por token; las que no
+# coinciden con los tokens se quitan, como en 011_generacion_docbin.py. Aquí solo queda montar los Doc a partir
+# de las palabras, que es bastante más rápido que tokenizar.
+
+from typing import Callable, Iterable, Optional
+import spacy
+from spacy.language import Language
+from spacy.tokens import Doc
+from spacy.training import Example
+from flujo import flujo_en_segundo_plano
+from generacion import json_files
+
+# Cada vez que se pide el corpus empieza en una zona de shards distinta, para que cada llamada vea documentos nuevos
+shards_por_llamada = 1_000_000
+
+_nlp = {}
+
+# Tokenizamos un documento generado y pasamos sus entidades a etiquetas IOB (en los procesos en segundo plano)
+def preparar_documento(texto, entities):
+    if 'es' not in _nlp:
+        _nlp['es'] = spacy.blank('es')
+    doc = _nlp['es'].make_doc(texto)
+    etiquetas = ['O'] * len(doc)
+    for start, end, label in entities:
+        span = doc.char_span(start, end)
+        if span is None:
+            continue
+        etiquetas[span.start] = f"B-{label}"
+        for i in range(span.start + 1, span.end):
+            etiquetas[i] = f"I-{label}"
+    return [token.text for token in doc], [bool(token.whitespace_) for token in doc], etiquetas
+
+@spacy.registry.readers("facturas.flujo_sintetico.v1")
+def crear_lector_flujo(plantillas_dir: str, json_dir: str, semilla: int = 42, docs_por_shard: int = 1000,
+                       num_workers: int = 2, por_delante: int = 4, valores_dir: Optional[str] = None,
+                       muestreo: Optional[dict] = None) -> Callable[[Language], Iterable[Example]]:
+    llamadas = [0]
+
+    def lector(nlp):
+        shard_inicial = llamadas[0] * shards_por_llamada
+        llamadas[0] += 1
+        for words, spaces, etiquetas in flujo_en_segundo_plano(plantillas_dir, json_dir, json_files, preparar_documento, semilla,
+                                                               docs_por_shard, num_workers, por_delante, shard_inicial,
+                                                               valores_dir=valores_dir, muestreo=muestreo):
+            predicted = Doc(nlp.vocab, words=words, spaces=spaces)
+            reference = Doc(nlp.vocab, words=words, spaces=spaces, ents=etiquetas)
+            yield Example(predicted, reference)
+
+    return lector
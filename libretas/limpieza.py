@@ -0,0 +1,91 @@
+# limpieza.py
+# Motor de limpieza del texto de las facturas con las expresiones regulares compiladas una sola vez.
+# clean_text encadenaba 7-10 re.sub, y cada uno copiaba el documento entero. Aquí las reglas que se pueden
+# aplicar a la vez van juntas en una sola alternativa y el texto se recorre 4 veces en lugar de 7-10:
+#   1. URLs (se quitan) y secuencias de puntos (se dejan en uno), en una sola expresión.
+#   2. Espacios: ' '.join(text.split()) junta cualquier secuencia de espacios en uno y quita los del principio
+#      y el final igual que re.sub(r'\s+', ' ', text).strip(), pero sin expresiones regulares.
+#   3. Marcadores (x,xx, "página N"...): una pasada por cada grupo de marcadores que no se pisan entre sí.
+#   4. Puntos y comas sueltos entre espacios y caracteres que no queremos, en una sola expresión.
+# El resultado es exactamente el mismo que el de la cadena de re.sub original.
+# Además, si se pide, devuelve para cada carácter del texto limpio su posición en el texto original, para poder
+# llevar lo que encuentre el modelo de vuelta al texto que salió del PDF.
+
+import re
+
+_patron_espacios = re.compile(r'\s+')
+
+# La URL desaparece y la secuencia de puntos se queda en un solo punto
+def _url_o_puntos(match):
+    return '.' if match.group()[0] == '.' else ''
+
+# re.sub con el mismo reemplazo, pero llevando también la posición original de cada carácter.
+# Los caracteres que pone el reemplazo apuntan al inicio de lo que sustituyen.
+def _sustituir(patron, reemplazo, texto, posiciones):
+    trozos = []
+    nuevas = []
+    ultimo = 0
+    for m in patron.finditer(texto):
+        trozos.append(texto[ultimo:m.start()])
+        nuevas.extend(posiciones[ultimo:m.start()])
+        nuevo = reemplazo(m) if callable(reemplazo) else reemplazo
+        trozos.append(nuevo)
+        nuevas.extend([posiciones[m.start()]] * len(nuevo))
+        ultimo = m.end()
+    trozos.append(texto[ultimo:])
+    nuevas.extend(posiciones[ultimo:])
+    return ''.join(trozos), nuevas
+
+class MotorLimpieza:
+    # conservar: caracteres que no son letras, números ni espacios y que se quedan en el texto.
+    # marcadores: expresiones que se quitan del texto, aplicadas en orden. Las que no se pisan entre sí
+    #   pueden ir juntas en una misma expresión con |, y así se aplican en una sola pasada.
+    # minusculas: pasar el texto a minúsculas antes de limpiarlo.
+    def __init__(self, conservar='.,€|-', marcadores=(r'\b(?:x,xx|página \d+)\b',), minusculas=False):
+        self.conservar = conservar
+        self.marcadores = tuple(marcadores)
+        self.minusculas = minusculas
+        self.patron_urls_puntos = re.compile(r'http\S+|www\.\S+|\.{2,}')
+        self.patrones_marcadores = [re.compile(marcador) for marcador in self.marcadores]
+        # Tras el paso 2 el único espacio que queda es ' '
+        self.patron_borrar = re.compile(r'(?<= )[.,](?= )|[^\w\s' + re.escape(conservar) + ']+')
+
+    def __repr__(self):
+        return f"MotorLimpieza(conservar={self.conservar!r}, marcadores={self.marcadores!r}, minusculas={self.minusculas!r})"
+
+    # Limpia el texto. Con con_posiciones=True devuelve también una lista con la posición en el texto original
+    # de cada carácter del texto limpio (los espacios juntados apuntan al primero de la secuencia).
+    def limpiar(self, texto, con_posiciones=False):
+        if con_posiciones:
+            return self._limpiar_con_posiciones(texto)
+        if self.minusculas:
+            texto = texto.lower()
+        texto = self.patron_urls_puntos.sub(_url_o_puntos, texto)
+        texto = ' '.join(texto.split())
+        for patron in self.patrones_marcadores:
+            texto = patron.sub('', texto)
+        return self.patron_borrar.sub('', texto)
+
+    # Los mismos pasos que limpiar, siguiendo la posición original de cada carácter. Es más lento,
+    # así que solo se usa cuando hace falta el mapa de posiciones.
+    def _limpiar_con_posiciones(self, texto):
+        posiciones = list(range(len(texto)))
+        if self.minusculas:
+            minusculas = texto.lower()
+            if len(minusculas) != len(texto):
+                # Algunos caracteres se convierten en más de uno al pasarlos a minúsculas (por ejemplo 'İ')
+                posiciones = [i for i, c in enumerate(texto) for _ in c.lower()]
+            texto = minusculas
+        texto, posiciones = _sustituir(self.patron_urls_puntos, _url_o_puntos, texto, posiciones)
+        texto, posiciones = _sustituir(_patron_espacios, ' ', texto, posiciones)
+        if texto.startswith(' '):
+            texto, posiciones = texto[1:], posiciones[1:]
+        if texto.endswith(' '):
+            texto, posiciones = texto[:-1], posiciones[:-1]
+        for patron in self.patrones_marcadores:
+            texto, posiciones = _sustituir(patron, '', texto, posiciones)
+        return _sustituir(self.patron_borrar, '', texto, posiciones)
+
+# Pasa un tramo [inicio, fin) del texto limpio a su tramo en el texto original
+def tramo_original(posiciones, inicio, fin):
+    return posiciones[inicio], posiciones[fin - 1] + 1
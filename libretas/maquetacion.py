@@ -0,0 +1,140 @@
+# maquetacion.py
+# Extracción del texto de las facturas conservando la posición de cada palabra en la página.
+# Con page.get_text("text") se pierde la geometría, y es justo lo que separa el bloque del cliente del de la comercializadora.
+# Aquí usamos page.get_text("words"), que da cada palabra con su caja (x0, y0, x1, y1) y su número de bloque y de línea,
+# y lo guardamos en columnas de NumPy (una por atributo) en vez de en listas de diccionarios.
+# El texto de todas las palabras va en un único string y cada palabra se localiza por su inicio y fin dentro de él.
+# Sobre eso se pueden hacer consultas por región y quedarse solo con los bloques que interesan para pasarle
+# al modelo NER mucho menos texto por factura.
+
+import re
+import numpy as np
+from fuentes import abrir_fitz
+
+# Palabras clave que suelen acompañar a los campos que buscamos. Los bloques que las contienen (y sus vecinos)
+# son los que le pasamos al modelo; el resto de la factura (conceptos, tarifas, publicidad...) no hace falta.
+patron_anclas = re.compile(
+    r'\b(?:cliente|titular|nombre|dni|nif|cif|factura|periodo|facturación|fecha|cargo|importe|total|consumo|kwh|'
+    r'potencia|contratada|dirección|domicilio|calle|comercializadora|suministro|c\.?p\.?|código postal)\b|\b\d{5}\b',
+    re.IGNORECASE)
+
+class Maquetacion:
+    def __init__(self, texto, inicio, fin, cajas, pagina, bloque, linea):
+        self.texto = texto      # todas las palabras seguidas, separadas por un espacio
+        self.inicio = inicio    # posición de cada palabra en self.texto (int32)
+        self.fin = fin
+        self.cajas = cajas      # (n_palabras, 4) float32: x0, y0, x1, y1
+        self.pagina = pagina    # int16
+        self.bloque = bloque    # id de bloque global (único en todo el documento), int32
+        self.linea = linea      # número de línea dentro del bloque, int32
+
+        # Caja y página de cada bloque, calculadas una vez
+        self.num_bloques = int(bloque.max()) + 1 if len(bloque) else 0
+        self.cajas_bloques = np.empty((self.num_bloques, 4), dtype=np.float32)
+        self.cajas_bloques[:, :2] = np.inf
+        self.cajas_bloques[:, 2:] = -np.inf
+        np.minimum.at(self.cajas_bloques[:, 0], bloque, cajas[:, 0])
+        np.minimum.at(self.cajas_bloques[:, 1], bloque, cajas[:, 1])
+        np.maximum.at(self.cajas_bloques[:, 2], bloque, cajas[:, 2])
+        np.maximum.at(self.cajas_bloques[:, 3], bloque, cajas[:, 3])
+        self.pagina_bloques = np.zeros(self.num_bloques, dtype=np.int16)
+        self.pagina_bloques[bloque] = pagina
+
+        # Palabras de cada bloque, en su orden: las de b son self._orden[self._limites[b]:self._limites[b + 1]].
+        # El texto de cada bloque se monta la primera vez que se pide y se guarda.
+        self._orden = np.argsort(bloque, kind='stable')
+        self._limites = np.searchsorted(bloque[self._orden], np.arange(self.num_bloques + 1))
+        self._textos_bloques = [None] * self.num_bloques
+
+    def __len__(self):
+        return len(self.inicio)
+
+    def palabra(self, i):
+        return self.texto[self.inicio[i]:self.fin[i]]
+
+    # Índices de las palabras cuyo centro cae dentro de la región indicada de una página.
+    def palabras_en_region(self, pagina, x0, y0, x1, y1):
+        cx = (self.cajas[:, 0] + self.cajas[:, 2]) / 2
+        cy = (self.cajas[:, 1] + self.cajas[:, 3]) / 2
+        mascara = (self.pagina == pagina) & (cx >= x0) & (cx <= x1) & (cy >= y0) & (cy <= y1)
+        return np.flatnonzero(mascara)
+
+    # Bloques que se solapan con la región indicada de una página.
+    def bloques_en_region(self, pagina, x0, y0, x1, y1):
+        c = self.cajas_bloques
+        mascara = (self.pagina_bloques == pagina) & (c[:, 0] <= x1) & (c[:, 2] >= x0) & (c[:, 1] <= y1) & (c[:, 3] >= y0)
+        return np.flatnonzero(mascara)
+
+    # Texto de un bloque, con una línea por cada línea del PDF (como lo daría get_text("text")).
+    def texto_bloque(self, b):
+        if self._textos_bloques[b] is not None:
+            return self._textos_bloques[b]
+        indices = self._orden[self._limites[b]:self._limites[b + 1]]
+        lineas = []
+        linea_actual = None
+        for i in indices:
+            if self.linea[i] != linea_actual:
+                lineas.append([])
+                linea_actual = self.linea[i]
+            lineas[-1].append(self.palabra(i))
+        self._textos_bloques[b] = '\n'.join(' '.join(linea) for linea in lineas)
+        return self._textos_bloques[b]
+
+    # Texto completo del documento, bloque a bloque.
+    def texto_completo(self):
+        return '\n'.join(self.texto_bloque(b) for b in range(self.num_bloques))
+
+    # Bloques cuyo texto contiene el patrón.
+    def bloques_con(self, patron):
+        return [b for b in range(self.num_bloques) if patron.search(self.texto_bloque(b))]
+
+# Extraemos las palabras de todas las páginas del PDF (ruta o bytes) y montamos las columnas.
+def extraer_maquetacion(pdf):
+    trozos = []
+    inicio, fin, cajas, pagina, bloque, linea = [], [], [], [], [], []
+    posicion = 0
+    bloque_base = 0
+    with abrir_fitz(pdf) as doc:
+        for num_pagina, page in enumerate(doc):
+            palabras = page.get_text("words")
+            max_bloque = -1
+            for x0, y0, x1, y1, palabra, num_bloque, num_linea, _ in palabras:
+                trozos.append(palabra)
+                inicio.append(posicion)
+                fin.append(posicion + len(palabra))
+                posicion += len(palabra) + 1
+                cajas.append((x0, y0, x1, y1))
+                pagina.append(num_pagina)
+                bloque.append(bloque_base + num_bloque)
+                linea.append(num_linea)
+                max_bloque = max(max_bloque, num_bloque)
+            bloque_base += max_bloque + 1
+
+    # Renumeramos los bloques para que sean consecutivos (los bloques de imagen no tienen palabras)
+    bloque = np.array(bloque, dtype=np.int32)
+    _, bloque = np.unique(bloque, return_inverse=True)
+    return Maquetacion(
+        ' '.join(trozos),
+        np.array(inicio, dtype=np.int32),
+        np.array(fin, dtype=np.int32),
+        np.array(cajas, dtype=np.float32).reshape(-1, 4),
+        np.array(pagina, dtype=np.int16),
+        bloque.astype(np.int32),
+        np.array(linea, dtype=np.int32),
+    )
+
+# Seleccionamos los bloques que importan: los que contienen alguna palabra clave, los que están a su derecha
+# en la misma franja horizontal (suele ser el valor de una etiqueta) y el que tienen justo debajo.
+def bloques_relevantes(maquetacion, patron=patron_anclas, margen=15.0):
+    seleccion = set()
+    for b in maquetacion.bloques_con(patron):
+        x0, y0, x1, y1 = maquetacion.cajas_bloques[b]
+        pagina = maquetacion.pagina_bloques[b]
+        seleccion.add(b)
+        seleccion.update(maquetacion.bloques_en_region(pagina, x1, y0, np.inf, y1).tolist())
+        seleccion.update(maquetacion.bloques_en_region(pagina, x0, y1, x1, y1 + margen).tolist())
+    return sorted(seleccion)
+
+# Texto de los bloques relevantes, en orden de lectura, para pasárselo al modelo NER.
+def texto_relevante(maquetacion, patron=patron_anclas):
+    return '\n'.join(maquetacion.texto_bloque(b) for b in bloques_relevantes(maquetacion, patron))
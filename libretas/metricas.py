@@ -0,0 +1,47 @@
+# metricas.py
+# Funciones para comparar las entidades extraídas con las de los JSON originales del dataset de entrenamiento.
+# Las usa 08_medicion.py y también 11_benchmark_backends.py para medir cuántos campos se aciertan con cada librería de PDF.
+
+import json
+from fechas import normalizar_fecha
+
+# Categorías de entidades
+# Estas son las etiquetas que esperamos que el modelo haya reconocido correctamente en los textos.
+categories = [
+    "nombre_cliente", "dni_cliente", "calle_cliente", "cp_cliente", "población_cliente",
+    "provincia_cliente", "nombre_comercializadora", "cif_comercializadora", "dirección_comercializadora",
+    "cp_comercializadora", "población_comercializadora", "provincia_comercializadora", "número_factura",
+    "inicio_periodo", "fin_periodo", "importe_factura", "fecha_cargo", "consumo_periodo", "potencia_contratada"
+]
+
+# Función para cargar JSON
+# Cargamos los datos de un archivo JSON y los devolvemos como un diccionario.
+def load_json(file_path):
+    with open(file_path, 'r', encoding='utf-8') as file:
+        return json.load(file)
+    
+# Función para normalizar fechas al formato dd.mm.yyyy (ver fechas.py)
+def normalize_date(date_str):
+    return normalizar_fecha(date_str) or date_str
+
+# Función para comparar campo a campo...
+# Devuelve para cada categoría si el valor extraído coincide con el original.
+def compare_by_category(original, extracted):
+    results = {}
+    for category in categories:
+        original_value = str(original.get(category, "")).strip()
+        extracted_value = str(extracted.get(category, "")).strip()
+
+        # Normalizar fechas si el campo es una fecha
+        if "fecha" in category or "periodo" in category:
+            original_value = normalize_date(original_value)
+            extracted_value = normalize_date(extracted_value)
+
+        results[category] = original_value == extracted_value
+    return results
+
+# Función para comparar dos diccionarios y calcular la tasa de acierto
+# Devuelve el número de categorías acertadas y el total de categorías.
+def compare_dicts(original, extracted):
+    results = compare_by_category(original, extracted)
+    return sum(results.values()), len(results)
@@ -0,0 +1,98 @@
+# shards.py
+# Escritura y lectura de los documentos generados en shards JSONL, en vez de un documento_N.json (con indent=4) por documento.
+# Cada shard es un archivo con un documento por línea (JSON compacto), opcionalmente comprimido con gzip o zstd,
+# y junto a ellos hay un índice (indice.json) con los shards en orden y cuántos documentos tiene cada uno.
+# Así pasamos de decenas de miles de archivos pequeños a unas pocas decenas, ocupan mucho menos en disco
+# y se leen en streaming, documento a documento, sin tener que cargar todo en memoria.
+# Los shards coinciden con los de la generación (ver generacion.py): el shard k lo escribe el proceso que lo genera.
+
+import glob
+import gzip
+import io
+import json
+import os
+
+extensiones = {None: '.jsonl', 'gzip': '.jsonl.gz', 'zstd': '.jsonl.zst'}
+
+# Nombre del archivo de un shard
+def nombre_shard(prefijo, shard, compresion=None):
+    return f"{prefijo}_{shard:05d}{extensiones[compresion]}"
+
+# Abrimos un shard en modo texto, comprimido o no según la compresión.
+# El gzip se escribe sin fecha en la cabecera, para que el mismo contenido dé siempre los mismos bytes.
+# zstd necesita el paquete zstandard; se importa solo si se usa.
+def _abrir(ruta, modo, compresion):
+    if compresion is None:
+        return open(ruta, modo + 't', encoding='utf-8', newline='\n')
+    if compresion == 'gzip':
+        binario = gzip.GzipFile(ruta, modo + 'b', mtime=0)
+    elif compresion == 'zstd':
+        import zstandard
+        binario = zstandard.open(ruta, modo + 'b')
+    else:
+        raise ValueError(f"Compresión desconocida: {compresion}")
+    return io.TextIOWrapper(binario, encoding='utf-8', newline='\n')
+
+# Escribimos los documentos de un shard. Devuelve la entrada del índice para ese shard.
+def escribir_shard(directorio, prefijo, shard, registros, compresion=None):
+    archivo = nombre_shard(prefijo, shard, compresion)
+    num_registros = 0
+    with _abrir(os.path.join(directorio, archivo), 'w', compresion) as f:
+        for registro in registros:
+            f.write(json.dumps(registro, ensure_ascii=False) + '\n')
+            num_registros += 1
+    return {"shard": shard, "archivo": archivo, "registros": num_registros}
+
+# Escribimos el índice con los shards. Si la generación se reparte entre varias máquinas, cada una escribe
+# el suyo (indice_0.json, indice_1.json...) y al leer se juntan todos.
+# Los índices de otra ejecución que ya no valen se borran: el indice.json al escribir uno por máquina, y los
+# de todas las máquinas al escribir indice.json.
+def escribir_indice(directorio, entradas, compresion=None, maquina=None):
+    nombre = 'indice.json' if maquina is None else f'indice_{maquina}.json'
+    viejos = glob.glob(os.path.join(directorio, 'indice_*.json')) if maquina is None else [os.path.join(directorio, 'indice.json')]
+    for ruta in viejos:
+        if os.path.exists(ruta):
+            os.remove(ruta)
+    indice = {
+        "compresion": compresion,
+        "registros": sum(entrada["registros"] for entrada in entradas),
+        "shards": sorted(entradas, key=lambda entrada: entrada["shard"]),
+    }
+    with open(os.path.join(directorio, nombre), 'w', encoding='utf-8') as f:
+        json.dump(indice, f, ensure_ascii=False, indent=4)
+
+def hay_shards(directorio):
+    return bool(glob.glob(os.path.join(directorio, 'indice*.json')))
+
+# Leemos los índices del directorio y los juntamos en uno solo, con los shards en orden.
+# Si dos índices tienen el mismo shard o distinta compresión es que se han mezclado ejecuciones distintas
+# (se leerían documentos repetidos o con la compresión equivocada), así que no se leen.
+def leer_indice(directorio):
+    shards = []
+    compresiones = {}
+    for ruta in sorted(glob.glob(os.path.join(directorio, 'indice*.json'))):
+        with open(ruta, 'r', encoding='utf-8') as f:
+            indice = json.load(f)
+        compresiones[os.path.basename(ruta)] = indice["compresion"]
+        shards.extend(indice["shards"])
+    if len(set(compresiones.values())) > 1:
+        raise ValueError(f"Los índices de {directorio} tienen compresiones distintas: {compresiones}")
+    numeros = [entrada["shard"] for entrada in shards]
+    if len(set(numeros)) < len(numeros):
+        raise ValueError(f"Hay shards repetidos en los índices de {directorio} ({', '.join(compresiones)}); "
+                         f"borra los índices que sobran")
+    compresion = next(iter(compresiones.values()), None)
+    shards.sort(key=lambda entrada: entrada["shard"])
+    return {"compresion": compresion, "registros": sum(entrada["registros"] for entrada in shards), "shards": shards}
+
+# Recorremos los documentos de un shard, línea a línea
+def leer_shard(directorio, entrada, compresion=None):
+    with _abrir(os.path.join(directorio, entrada["archivo"]), 'r', compresion) as f:
+        for linea in f:
+            yield json.loads(linea)
+
+# Recorremos todos los documentos en orden, leyendo los shards uno detrás de otro
+def leer_shards(directorio):
+    indice = leer_indice(directorio)
+    for entrada in indice["shards"]:
+        yield from leer_shard(directorio, entrada, indice["compresion"])
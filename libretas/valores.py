@@ -0,0 +1,135 @@
+# valores.py
+# Almacén compacto de los valores de json_categoria para la generación de documentos.
+# cargar_datos_json carga cada uno de los 19 JSON en una lista de str, y cada proceso generador tiene su propia copia.
+# Aquí cada campo se guarda una sola vez en disco como un buffer UTF-8 seguido ({campo}.bin) más un array con
+# la posición de cada valor dentro del buffer ({campo}.idx). Los procesos abren esos archivos con mmap, así que
+# el sistema operativo comparte las mismas páginas de memoria entre todos y no se duplica nada por proceso.
+# PoolValores se comporta como una lista (len y [i]), así que rng.choice de generar_texto funciona igual y con la
+# misma semilla salen exactamente los mismos documentos que con las listas de los JSON.
+#
+# También permite muestreo estratificado: los valores de cada campo se agrupan por un criterio (longitud, número
+# de palabras o forma) y con unos pesos por estrato se sacan más a menudo los formatos raros (calles largas,
+# poblaciones de varias palabras...) sin copiar valores: solo cambia cómo se elige el índice.
+
+import json
+import mmap
+import os
+import re
+from array import array
+from bisect import bisect_right
+
+# Criterios de estratificación: a cada valor le dan el nombre de su estrato
+criterios = {
+    # Longitud en caracteres, de 10 en 10 (0: menos de 10, 1: de 10 a 19... 5: 50 o más)
+    'longitud': lambda valor: str(min(len(valor) // 10, 5)),
+    # Número de palabras (4: cuatro o más)
+    'palabras': lambda valor: str(min(len(valor.split()), 4)),
+    # Forma: letras como 'a', cifras como '9' y cada racha de iguales en uno (B90393497 -> a9, 19,78 -> 9,9)
+    'forma': lambda valor: re.sub(r'(.)\1+', r'\1', re.sub(r'\d', '9', re.sub(r'[^\W\d_]', 'a', valor))),
+}
+
+# Compilamos los JSON de json_categoria en el formato compacto. Solo se recompilan los campos cuyo JSON
+# ha cambiado desde la última vez. Hay que llamarlo en el proceso principal, antes de arrancar los generadores.
+def compilar_valores(json_dir, json_files, valores_dir):
+    os.makedirs(valores_dir, exist_ok=True)
+    for key in json_files.values():
+        json_path = os.path.join(json_dir, f"{key}.json")
+        meta_path = os.path.join(valores_dir, f"{key}.json")
+        if os.path.exists(meta_path) and os.path.getmtime(meta_path) >= os.path.getmtime(json_path):
+            continue
+        with open(json_path, 'r', encoding='utf-8') as f:
+            valores = json.load(f)
+
+        offsets = array('q', [0])
+        with open(os.path.join(valores_dir, f"{key}.bin"), 'wb') as f:
+            for valor in valores:
+                offsets.append(offsets[-1] + f.write(valor.encode('utf-8')))
+        with open(os.path.join(valores_dir, f"{key}.idx"), 'wb') as f:
+            offsets.tofile(f)
+
+        # Para cada criterio, los índices de los valores ordenados por estrato y el tramo de cada estrato
+        estratos = {}
+        for criterio, estrato_de in criterios.items():
+            estrato_valor = [estrato_de(valor) for valor in valores]
+            orden = array('q', sorted(range(len(valores)), key=lambda i: (estrato_valor[i], i)))
+            with open(os.path.join(valores_dir, f"{key}.{criterio}.idx"), 'wb') as f:
+                orden.tofile(f)
+            tramos = {}
+            for posicion, i in enumerate(orden):
+                inicio, _ = tramos.get(estrato_valor[i], (posicion, posicion))
+                tramos[estrato_valor[i]] = (inicio, posicion + 1)
+            estratos[criterio] = tramos
+
+        # El JSON de metadatos se escribe el último: si existe, el resto de archivos del campo está completo
+        with open(meta_path, 'w', encoding='utf-8') as f:
+            json.dump({"valores": len(valores), "estratos": estratos}, f, ensure_ascii=False, indent=4)
+
+# Abrimos un archivo en solo lectura con mmap (un archivo vacío no se puede mapear)
+def _mapear(ruta):
+    with open(ruta, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return b''
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+class PoolValores:
+    def __init__(self, valores_dir, key):
+        self.valores_dir = valores_dir
+        self.key = key
+        with open(os.path.join(valores_dir, f"{key}.json"), 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        self.estratos = meta["estratos"]
+        self._buffer = _mapear(os.path.join(valores_dir, f"{key}.bin"))
+        self._offsets = memoryview(_mapear(os.path.join(valores_dir, f"{key}.idx"))).cast('q')
+        self._ordenes = {}
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        return self._buffer[self._offsets[i]:self._offsets[i + 1]].decode('utf-8')
+
+    # Índices de los valores ordenados por estrato según un criterio (se mapean la primera vez que se piden)
+    def orden(self, criterio):
+        if criterio not in self._ordenes:
+            self._ordenes[criterio] = memoryview(_mapear(os.path.join(self.valores_dir, f"{self.key}.{criterio}.idx"))).cast('q')
+        return self._ordenes[criterio]
+
+# Vista de un PoolValores con muestreo estratificado. También se comporta como una lista para rng.choice:
+# cada estrato ocupa tantas posiciones como valores tiene multiplicado por su peso (1 si no se da), así que
+# con peso 3 los valores de ese estrato salen tres veces más que en el muestreo uniforme, sin copiarlos.
+class PoolEstratificado:
+    def __init__(self, pool, criterio, pesos):
+        self.pool = pool
+        self._orden = pool.orden(criterio)
+        self._tramos = []
+        self._limites = []
+        total = 0
+        for estrato, (inicio, fin) in sorted(pool.estratos[criterio].items()):
+            posiciones = max(1, round((fin - inicio) * pesos.get(estrato, 1.0)))
+            self._tramos.append((total, posiciones, inicio, fin - inicio))
+            total += posiciones
+            self._limites.append(total)
+        self._total = total
+
+    def __len__(self):
+        return self._total
+
+    def __getitem__(self, j):
+        base, posiciones, inicio, cantidad = self._tramos[bisect_right(self._limites, j)]
+        return self.pool[self._orden[inicio + (j - base) * cantidad // posiciones]]
+
+# Abrimos los valores compactos de cada placeholder, con el mismo formato que cargar_datos_json (placeholder -> valores).
+# muestreo es un diccionario campo -> (criterio, {estrato: peso}) para los campos que se quieren estratificar,
+# por ejemplo {"calle_cliente": ("longitud", {"3": 3.0, "4": 3.0, "5": 3.0})} para sacar más calles largas.
+def cargar_valores(valores_dir, json_files, muestreo=None):
+    muestreo = muestreo or {}
+    datos = {}
+    for placeholder, key in json_files.items():
+        pool = PoolValores(valores_dir, key)
+        if key in muestreo:
+            criterio, pesos = muestreo[key]
+            pool = PoolEstratificado(pool, criterio, pesos)
+        datos[placeholder] = pool
+    return datos